@@ -1,6 +1,12 @@
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+from gcm_aggregates import GCMAggregateStore
+from period_stats import monthly_percentage_change, percentage_change
+from study_periods import BOX_PLOT_PERIODS, BOX_PLOT_PERIOD_LABELS
+from stats_cache import memoize
+from figure_export import new_figure, show_figure, scenario_title
+from instrumentation import timed
 
 # Set font to Times New Roman for all plot elements
 plt.rcParams["font.family"] = "Times New Roman"
@@ -23,93 +29,73 @@ gcm_files = {
     # Add more GCM paths here
 }
 
-# Define the baseline and future periods
-baseline_period = (1984, 2014)
-near_future_period = (2015, 2040)
-mid_future_period = (2041, 2071)
-far_future_period = (2070, 2100)
+# Baseline and future periods by key (the per-GCM aggregates are stored for these periods), shared with the stats
+# command line; edit them in study_periods.py
+periods = BOX_PLOT_PERIODS
 
-# Function to calculate the mean monthly flow for a given period and scenario
-def get_monthly_mean_flow(df: pd.DataFrame, period: tuple, flow_column: str) -> pd.Series:
-    subset = df[(df['Year'] >= period[0]) & (df['Year'] <= period[1])]
-    return subset.groupby('Month')[flow_column].mean()
+# Labels of the future periods on the plots
+period_labels = BOX_PLOT_PERIOD_LABELS
 
 # Function to load data, calculate monthly means for a specific scenario (e.g., 'Flow SSP245', 'Flow SSP585')
+@timed()
 def load_and_process_data(flow_scenario: str):
     # Initialize a dictionary to store the monthly mean flows for each GCM
     monthly_flows = {key: {} for key in gcm_files.keys()}
 
-    # Loop through each GCM file and calculate monthly means
-    for gcm_name, file_path in gcm_files.items():
-        # Load the dataset
-        df = pd.read_excel(file_path)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df['Month'] = df['Date'].dt.month
-        df['Year'] = df['Date'].dt.year
+    # Update the per-GCM aggregates (monthly sums and counts); only workbooks added or changed since the last run are read
+    store = GCMAggregateStore([flow_scenario], periods)
+    store.update(gcm_files)
 
-        # Calculate monthly mean flow for each period based on the selected scenario
-        monthly_flows[gcm_name]['baseline'] = get_monthly_mean_flow(df, baseline_period, flow_scenario)
-        monthly_flows[gcm_name]['near_future'] = get_monthly_mean_flow(df, near_future_period, flow_scenario)
-        monthly_flows[gcm_name]['mid_future'] = get_monthly_mean_flow(df, mid_future_period, flow_scenario)
-        monthly_flows[gcm_name]['far_future'] = get_monthly_mean_flow(df, far_future_period, flow_scenario)
+    # Calculate monthly mean flow of every GCM for each period from the stored aggregates
+    for period_key in periods:
+        gcm_monthly_means = store.gcm_monthly_means(flow_scenario, period_key)
+        for gcm_name in gcm_files:
+            monthly_flows[gcm_name][period_key] = gcm_monthly_means[gcm_name].rename(flow_scenario)
 
     return monthly_flows
 
-# Function to calculate the ensemble mean across multiple GCMs
+# Function to calculate the ensemble mean across multiple GCMs (cached by the monthly flows of that period)
+@timed()
+@memoize('ensemble_monthly_mean', key=lambda monthly_flows, period_key: [monthly_flows[gcm][period_key] for gcm in gcm_files])
 def calculate_ensemble_mean(monthly_flows, period_key):
     # Concatenate the monthly flows from all GCMs and calculate the mean
     ensemble_data = pd.concat([monthly_flows[gcm][period_key] for gcm in gcm_files.keys()], axis=1)
     return ensemble_data.mean(axis=1)
 
-# Function to calculate percentage change
-def calculate_percentage_change(future_flow, baseline_flow):
-    return ((future_flow - baseline_flow) / baseline_flow) * 100
-
-# Function to plot the results
-def plot_scenario(flow_scenario: str):
-    # Load and process data for the selected scenario
-    monthly_flows = load_and_process_data(flow_scenario)
-
-    # Calculate the ensemble means for each period
-    ensemble_baseline = calculate_ensemble_mean(monthly_flows, 'baseline')
-    ensemble_near_future = calculate_ensemble_mean(monthly_flows, 'near_future')
-    ensemble_mid_future = calculate_ensemble_mean(monthly_flows, 'mid_future')
-    ensemble_far_future = calculate_ensemble_mean(monthly_flows, 'far_future')
-
-    # Calculate percentage changes for each future period relative to the baseline
-    near_future_change = calculate_percentage_change(ensemble_near_future, ensemble_baseline)
-    mid_future_change = calculate_percentage_change(ensemble_mid_future, ensemble_baseline)
-    far_future_change = calculate_percentage_change(ensemble_far_future, ensemble_baseline)
-
-    # Prepare the data for plotting
-    near_future_change = near_future_change.reset_index()  # Reset the index to preserve the Month column
-    near_future_change['Period'] = 'Near Future (2015-2040)'
-
-    mid_future_change = mid_future_change.reset_index()
-    mid_future_change['Period'] = 'Mid Future (2041-2070)'
-
-    far_future_change = far_future_change.reset_index()
-    far_future_change['Period'] = 'Far Future (2071-2100)'
-
-    # Concatenate the data for plotting
-    combined_changes = pd.concat([near_future_change, mid_future_change, far_future_change])
-
-    # Melt the DataFrame for easy plotting
-    combined_changes = combined_changes.reset_index().melt(id_vars=['Month', 'Period'], value_name='Percentage Change')
-
-    # Plot the box plots
-    plt.figure(figsize=(15, 8), dpi=300)
-
-    # Define custom colors
-    custom_palette = {
-        'Near Future (2015-2040)': '#0FD4EF',
-        'Mid Future (2041-2070)': '#1FD29F',
-        'Far Future (2071-2100)': '#162BDA'}
+# Function to load the monthly mean flows of every scenario, GCM and period in one pass (long-format table)
+@timed()
+def load_monthly_table(flow_scenarios):
+    # One store for all scenarios, so every workbook is read once
+    store = GCMAggregateStore(list(flow_scenarios), periods)
+    store.update(gcm_files)
+    return store.monthly_mean_table()
+
+# Function to calculate the percentage change of every GCM, month and future period relative to that GCM's baseline
+@timed()
+def calculate_gcm_percentage_changes(monthly_table):
+    # Match each future row with the baseline flow of its (scenario, GCM, month) in one merge (a duplicate baseline raises)
+    keys = ['Scenario', 'GCM', 'Month']
+    is_baseline = monthly_table['Period'] == 'baseline'
+    baseline_flow = monthly_table.loc[is_baseline, keys + ['Flow']].rename(columns={'Flow': 'Baseline Flow'})
+    changes = monthly_table[~is_baseline].merge(baseline_flow, on=keys, how='left', validate='many_to_one')
+    changes['Percentage Change'] = percentage_change(changes['Flow'], changes['Baseline Flow'])
+    changes = changes.drop(columns='Baseline Flow')
+    return changes.assign(Period=changes['Period'].map(period_labels))
+
+# Function to draw the box plot of the percentage changes (one box per month and period)
+@timed()
+def plot_change_boxplot(changes, flow_scenario: str, title: str, name: str):
+    new_figure(figsize=(15, 8), dpi=300)
+
+    # Define custom colors (blue for the moderate, red for the extreme scenario)
+    palette_colors = ['#0FD4EF', '#1FD29F', '#162BDA'] if flow_scenario.endswith('SSP245') else ['#EFCD0F', '#F06616', '#D20000']
+    custom_palette = dict(zip(period_labels.values(), palette_colors))
     
     #RED PALETTE:   '#EFCD0F' '#F06616' '#D20000'
     #BLUE PALETTE:  '#0FD4EF', '#1FD29F', '#162BDA'
 
-    sns.boxplot(x='Month', y='Percentage Change', hue='Period', data=combined_changes, palette=custom_palette)
+    sns.boxplot(x='Month', y='Percentage Change', hue='Period', data=changes, palette=custom_palette,
+                hue_order=list(period_labels.values()))
 
     # Create a list of month names
     month_names = [
@@ -119,11 +105,42 @@ def plot_scenario(flow_scenario: str):
 
     # Change the x-ticks to month names
     plt.xticks(ticks=range(12), labels=month_names, rotation=45, fontsize=16)
-    plt.title(f'Moderate Scenario ({flow_scenario})', fontsize=18)
+    plt.title(title, fontsize=18)
     plt.ylabel('Percentage Change (%)', fontsize=17)
     plt.legend(title='Time Period',fontsize=16)
     plt.tight_layout()
-    plt.show()
+    show_figure(name)
+
+# Function to plot the results (per_gcm: boxes of the changes of the individual GCMs instead of the ensemble mean)
+def plot_scenario(flow_scenario: str, per_gcm: bool = False):
+    if per_gcm:
+        plot_scenarios([flow_scenario])
+        return
+
+    # Load and process data for the selected scenario
+    monthly_flows = load_and_process_data(flow_scenario)
+
+    # Calculate the ensemble means for each period (months as rows, periods as columns)
+    ensemble_means = pd.DataFrame({period_key: calculate_ensemble_mean(monthly_flows, period_key) for period_key in periods})
+
+    # Calculate percentage changes for each future period relative to the baseline
+    changes = monthly_percentage_change(ensemble_means).rename(columns=period_labels)
+
+    # Melt the DataFrame for easy plotting (one row per month and period)
+    combined_changes = changes.reset_index().melt(id_vars='Month', var_name='Period', value_name='Percentage Change')
+
+    # Plot the box plots
+    plot_change_boxplot(combined_changes, flow_scenario, f'{scenario_title(flow_scenario)} ({flow_scenario})',
+                        'monthly_change_boxplot')
+
+# Function to plot the spread of the GCM changes for several scenarios from a single data load
+def plot_scenarios(flow_scenarios=('Flow SSP245', 'Flow SSP585')):
+    changes = calculate_gcm_percentage_changes(load_monthly_table(flow_scenarios))
+    for flow_scenario in flow_scenarios:
+        plot_change_boxplot(changes[changes['Scenario'] == flow_scenario], flow_scenario,
+                            f'{scenario_title(flow_scenario)} ({flow_scenario}): % change of each of the '
+                            f'{len(gcm_files)} GCMs', f'monthly_change_boxplot_per_gcm {flow_scenario}')
 
 # Example usage: Choose a flow scenario ('Flow SSP245' or 'Flow SSP585')
-plot_scenario('Flow SSP245')
+if __name__ == '__main__':
+    plot_scenario('Flow SSP245')
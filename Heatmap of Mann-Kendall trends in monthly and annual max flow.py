@@ -0,0 +1,112 @@
+import warnings
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from gcm_aggregates import GCMAggregateStore
+from trend import trend_table
+from study_periods import TREND_PERIOD
+from figure_export import new_subplots, show_figure, scenario_title
+from instrumentation import timed
+
+# Set font to Times New Roman for all plot elements
+plt.rcParams["font.family"] = "Times New Roman"
+
+# Define the file paths for all GCMs (add more paths as needed)
+gcm_files = {
+    'BCC-CSM2-MR': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/BCC-CSM2-MR.xlsx",
+    'MPI-ESM1-2-HR': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/MPI-ESM1-2-HR.xlsx",
+    'MPI-ESM1-2-LR': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/MPI-ESM1-2-LR.xlsx",
+    'ACCESS-CM2': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/ACCESS-CM2.xlsx",
+    'ACCESS-ESM1-5': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/ACCESS-ESM1-5.xlsx",
+    'CanESM5': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/CanESM5.xlsx",
+    'EC-Earth3': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/EC-Earth3.xlsx",
+    'EC-Earth3-Veg': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/EC-Earth3-Veg.xlsx",
+    'INM-CM4-8': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/INM-CM4-8.xlsx",
+    'INM-CM5-0': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/INM-CM5-0.xlsx",
+    'MRI-ESM2-0': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/MRI-ESM2-0.xlsx",
+    'NorESM2-LM': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/NorESM2-LM.xlsx",
+    'NorESM2-MM': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/NorESM2-MM.xlsx"
+    # Add more GCM paths here
+}
+
+# Define the years tested for a trend (the projection period; edit it in study_periods.py) and the significance level of the Mann-Kendall test
+trend_period = TREND_PERIOD
+significance_level = 0.05
+
+# Names of the tested series: the mean flow of every month, then the annual maximum flow
+series_names = [
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December', 'Annual Max'
+]
+
+# Function to test every GCM's (and the ensemble mean's) monthly and annual max flow series for a trend
+@timed()
+def calculate_trends(flow_scenario: str):
+    # Update the per-GCM aggregates; only workbooks added or changed since the last run are read
+    store = GCMAggregateStore([flow_scenario], {'trend': trend_period})
+    store.update(gcm_files)
+    years, month_sum, month_count, annual_max = store.yearly_arrays(flow_scenario)
+    rows = (years >= trend_period[0]) & (years <= trend_period[1])
+
+    # GCM x series x year array: the mean flow of every month (NaN without data), then the annual max flow
+    with np.errstate(invalid='ignore', divide='ignore'):
+        monthly_means = np.where(month_count > 0, month_sum / month_count, np.nan)[:, rows]
+    series = np.concatenate((np.moveaxis(monthly_means, 1, -1), annual_max[:, None, rows]), axis=1)
+
+    # The ensemble mean series is tested as one more member
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # Years without data in any GCM
+        ensemble = np.nanmean(series, axis=0)
+    series = np.concatenate((series, ensemble[None]), axis=0)
+
+    # Sen's slope per decade, in m³/s and in % of the series mean
+    return trend_table(series, {'GCM': store.gcms + ['Ensemble'], 'Series': series_names}, significance_level, slope_scale=10)
+
+# Function to summarise the significance of the trends: GCMs with a significant increase / decrease, and the ensemble trend
+def summarise_trends(trends):
+    members = trends[trends['GCM'] != 'Ensemble']
+    ensemble = trends[trends['GCM'] == 'Ensemble'].set_index('Series')
+    summary = pd.DataFrame({
+        'GCMs Increasing': members[members['Trend'] == 'increasing'].groupby('Series').size(),
+        'GCMs Decreasing': members[members['Trend'] == 'decreasing'].groupby('Series').size(),
+    }).reindex(series_names).fillna(0).astype(int)
+    summary['Ensemble Slope (%/decade)'] = ensemble["Sen's Slope (%)"]
+    summary['Ensemble p-value'] = ensemble['p-value']
+    summary['Ensemble Trend'] = ensemble['Trend']
+    return summary
+
+# Function to plot the heatmap of the trends (series x GCM, significant trends marked)
+@timed()
+def plot_scenario(flow_scenario: str):
+    trends = calculate_trends(flow_scenario)
+    print(f'Mann-Kendall trends {trend_period[0]}-{trend_period[1]} ({flow_scenario}, \u03b1 = {significance_level}):')
+    print(summarise_trends(trends))
+
+    slopes = trends.pivot(index='Series', columns='GCM', values="Sen's Slope (%)").loc[series_names, trends['GCM'].unique()]
+    significant = trends.pivot(index='Series', columns='GCM', values='Significant').loc[slopes.index, slopes.columns]
+
+    fig, ax = new_subplots(1, 1, figsize=(16, 9), dpi=300)
+    limit = np.nanpercentile(np.abs(slopes.to_numpy()), 98)
+    mesh = ax.pcolormesh(np.arange(slopes.shape[1] + 1) - 0.5, np.arange(slopes.shape[0] + 1) - 0.5, slopes.to_numpy(),
+                         cmap='BrBG', vmin=-limit, vmax=limit)
+    rows, columns = np.nonzero(significant.to_numpy(dtype=bool))
+    ax.scatter(columns, rows, marker='o', s=40, facecolor='black', edgecolor='white',
+               label=f'Significant trend (Mann-Kendall, p < {significance_level})')
+    fig.colorbar(mesh, ax=ax, label="Sen's Slope (% of mean per decade)", pad=0.02)
+
+    # Separate the ensemble column and the annual max row from the individual GCMs and months
+    ax.axvline(slopes.shape[1] - 1.5, color='black', linewidth=2)
+    ax.axhline(len(series_names) - 1.5, color='black', linewidth=2)
+    ax.set_xticks(range(slopes.shape[1]), labels=slopes.columns, rotation=45, ha='right', fontsize=12)
+    ax.set_yticks(range(slopes.shape[0]), labels=slopes.index, fontsize=14)
+    ax.invert_yaxis()
+    ax.set_title(f'{scenario_title(flow_scenario)} ({flow_scenario}): trends in mean monthly and annual max flow, '
+                 f'{trend_period[0]}-{trend_period[1]}', fontsize=16)
+    ax.legend(loc='upper left', bbox_to_anchor=(0, -0.14), fontsize=12, frameon=False)
+    fig.subplots_adjust(bottom=0.22)
+
+    show_figure('trend_heatmap')
+
+# Example usage: Choose a flow scenario ('Flow SSP245' or 'Flow SSP585')
+if __name__ == '__main__':
+    plot_scenario('Flow SSP245')
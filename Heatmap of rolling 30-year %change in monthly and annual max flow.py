@@ -0,0 +1,101 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from gcm_aggregates import GCMAggregateStore
+from rolling_windows import rolling_monthly_change, rolling_annual_max_change, time_of_emergence
+from study_periods import ROLLING_BASELINE, ROLLING_WINDOW_YEARS
+from figure_export import new_subplots, show_figure, scenario_title
+from instrumentation import timed
+
+# Set font to Times New Roman for all plot elements
+plt.rcParams["font.family"] = "Times New Roman"
+
+# Define the file paths for all GCMs (add more paths as needed)
+gcm_files = {
+    'BCC-CSM2-MR': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/BCC-CSM2-MR.xlsx",
+    'MPI-ESM1-2-HR': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/MPI-ESM1-2-HR.xlsx",
+    'MPI-ESM1-2-LR': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/MPI-ESM1-2-LR.xlsx",
+    'ACCESS-CM2': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/ACCESS-CM2.xlsx",
+    'ACCESS-ESM1-5': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/ACCESS-ESM1-5.xlsx",
+    'CanESM5': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/CanESM5.xlsx",
+    'EC-Earth3': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/EC-Earth3.xlsx",
+    'EC-Earth3-Veg': "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/EC-Earth3-Veg.xlsx",
+    'INM-CM4-8': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/INM-CM4-8.xlsx",
+    'INM-CM5-0': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/INM-CM5-0.xlsx",
+    'MRI-ESM2-0': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/MRI-ESM2-0.xlsx",
+    'NorESM2-LM': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/NorESM2-LM.xlsx",
+    'NorESM2-MM': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/NorESM2-MM.xlsx"
+    # Add more GCM paths here
+}
+
+# Define the baseline period and the rolling windows (every 30-year window from 2015 to 2100; edit them in study_periods.py)
+baseline_period = ROLLING_BASELINE
+window_length = 30
+first_year, last_year = ROLLING_WINDOW_YEARS
+
+# A change has emerged once the median GCM change exceeds this (in %) with this share of GCMs agreeing on its sign
+emergence_threshold = 10.0
+emergence_agreement = 0.8
+
+# Function to calculate the % change of every rolling window for a flow scenario (e.g., 'Flow SSP245', 'Flow SSP585')
+@timed()
+def calculate_rolling_changes(flow_scenario: str):
+    # Update the per-GCM aggregates; only workbooks added or changed since the last run are read
+    store = GCMAggregateStore([flow_scenario], {'baseline': baseline_period})
+    store.update(gcm_files)
+    years, month_sum, month_count, annual_max = store.yearly_arrays(flow_scenario)
+
+    # Window x month x GCM cube of % changes in mean monthly flow, and window x GCM % changes in mean annual max flow
+    starts, monthly_change, ensemble_monthly_change = rolling_monthly_change(
+        month_sum, month_count, years, baseline_period, first_year, last_year, window_length)
+    _, annual_max_change, ensemble_annual_max_change = rolling_annual_max_change(
+        annual_max, years, baseline_period, first_year, last_year, window_length)
+    return starts, monthly_change, ensemble_monthly_change, annual_max_change, ensemble_annual_max_change
+
+# Function to plot the heatmap of the rolling changes
+@timed()
+def plot_scenario(flow_scenario: str):
+    starts, monthly_change, ensemble_monthly_change, annual_max_change, ensemble_annual_max_change = \
+        calculate_rolling_changes(flow_scenario)
+
+    # Time of emergence of every month and of the annual max flow
+    monthly_emergence = time_of_emergence(starts, monthly_change, emergence_threshold, emergence_agreement)
+    annual_max_emergence = time_of_emergence(starts, annual_max_change, emergence_threshold, emergence_agreement)
+
+    fig, (ax_months, ax_max) = new_subplots(2, 1, figsize=(16, 10), dpi=300, sharex=True, height_ratios=(3, 1))
+
+    # Heatmap of the ensemble % change: months on the y-axis, window start years on the x-axis
+    limit = np.nanpercentile(np.abs(ensemble_monthly_change), 98)
+    mesh = ax_months.pcolormesh(np.append(starts, starts[-1] + 1) - 0.5, np.arange(0.5, 13.5), ensemble_monthly_change.T,
+                                cmap='BrBG', vmin=-limit, vmax=limit)
+    ax_months.scatter(monthly_emergence, np.arange(1, 13), marker='o', s=60, facecolor='black', edgecolor='white',
+                      label=f'Time of emergence (|median change| \u2265 {emergence_threshold:g}%, '
+                            f'\u2265 {emergence_agreement:.0%} of GCMs agree)')
+    fig.colorbar(mesh, ax=[ax_months, ax_max], label='Percentage Change (%)', pad=0.02)
+
+    month_names = [
+        'January', 'February', 'March', 'April', 'May', 'June',
+        'July', 'August', 'September', 'October', 'November', 'December'
+    ]
+    ax_months.set_yticks(range(1, 13), labels=month_names, fontsize=14)
+    ax_months.invert_yaxis()
+    ax_months.set_title(f'{scenario_title(flow_scenario)} ({flow_scenario}): % change in mean monthly flow of rolling '
+                        f'{window_length}-year windows relative to {baseline_period[0]}-{baseline_period[1]}', fontsize=16)
+    ax_months.legend(loc='upper left', bbox_to_anchor=(0, -0.01), fontsize=12, frameon=False)
+
+    # Ensemble % change of the mean annual max flow with the 10-90th percentile range across GCMs
+    low, high = np.nanpercentile(annual_max_change, [10, 90], axis=1)
+    ax_max.fill_between(starts, low, high, color='grey', alpha=0.3, label='GCM range (10th-90th percentile)')
+    ax_max.plot(starts, ensemble_annual_max_change, color='black', linewidth=2, label='Ensemble mean')
+    ax_max.axhline(0, color='grey', linewidth=1, linestyle='--')
+    if not np.isnan(annual_max_emergence):
+        ax_max.axvline(annual_max_emergence, color='red', linewidth=1.5, label='Time of emergence')
+    ax_max.set_ylabel('Annual Max Flow\nChange (%)', fontsize=14)
+    ax_max.set_xlabel(f'Start year of the {window_length}-year window', fontsize=14)
+    ax_max.set_xlim(starts[0] - 0.5, starts[-1] + 0.5)
+    ax_max.legend(loc='upper left', fontsize=12)
+
+    show_figure('rolling_change_heatmap')
+
+# Example usage: Choose a flow scenario ('Flow SSP245' or 'Flow SSP585')
+if __name__ == '__main__':
+    plot_scenario('Flow SSP245')
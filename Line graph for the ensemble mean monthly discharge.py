@@ -1,7 +1,11 @@
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
-from scipy.interpolate import interp1d
+from gcm_aggregates import GCMAggregateStore
+from study_periods import LINE_GRAPH_PERIODS
+from stats_cache import memoize
+from smoothing import smooth_monthly
+from figure_export import new_figure, show_figure, scenario_title
+from instrumentation import timed
 
 plt.rcParams["font.family"] = "Times New Roman"
 
@@ -22,53 +26,39 @@ gcm_files = {
     'NorESM2-MM': r"D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble/Amalshid Simulation Flow data/NorESM2-MM.xlsx"
 }
 
-# Define the baseline and future periods
-baseline_period = (1984, 2014)
-near_future_period = (2015, 2040)
-mid_future_period = (2041, 2070)
-far_future_period = (2071, 2100)
-
-# Function to calculate the mean monthly flow for a given period and flow scenario
-def get_monthly_mean_flow(df: pd.DataFrame, period: tuple, flow_column: str) -> pd.Series:
-    subset = df[(df['Year'] >= period[0]) & (df['Year'] <= period[1])]
-    return subset.groupby('Month')[flow_column].mean()
+# Baseline and future periods by key (the per-GCM aggregates are stored for these periods), shared with the stats
+# command line; edit them in study_periods.py
+periods = LINE_GRAPH_PERIODS
 
 # Function to load and process data for the selected flow scenario
+@timed()
 def load_and_process_data(flow_scenario: str):
     # Initialize dictionaries to store the results for all GCMs
     monthly_flows = {key: {} for key in gcm_files.keys()}
 
-    # Loop through each GCM file and calculate monthly means
-    for gcm_name, file_path in gcm_files.items():
-        # Load the dataset
-        df = pd.read_excel(file_path)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df['Month'] = df['Date'].dt.month
-        df['Year'] = df['Date'].dt.year
+    # Update the per-GCM aggregates (monthly sums and counts); only workbooks added or changed since the last run are read
+    store = GCMAggregateStore([flow_scenario], periods)
+    store.update(gcm_files)
 
-        # Calculate monthly mean flow for each period based on the selected scenario
-        monthly_flows[gcm_name]['baseline'] = get_monthly_mean_flow(df, baseline_period, flow_scenario)
-        monthly_flows[gcm_name]['near_future'] = get_monthly_mean_flow(df, near_future_period, flow_scenario)
-        monthly_flows[gcm_name]['mid_future'] = get_monthly_mean_flow(df, mid_future_period, flow_scenario)
-        monthly_flows[gcm_name]['far_future'] = get_monthly_mean_flow(df, far_future_period, flow_scenario)
+    # Calculate monthly mean flow of every GCM for each period from the stored aggregates
+    for period_key in periods:
+        gcm_monthly_means = store.gcm_monthly_means(flow_scenario, period_key)
+        for gcm_name in gcm_files:
+            monthly_flows[gcm_name][period_key] = gcm_monthly_means[gcm_name].rename(flow_scenario)
 
     return monthly_flows
 
-# Function to calculate the ensemble mean across multiple GCMs
+# Function to calculate the ensemble mean across multiple GCMs (cached by the monthly flows of that period)
+@timed()
+@memoize('ensemble_monthly_mean', key=lambda monthly_flows, period_key: [monthly_flows[gcm][period_key] for gcm in gcm_files])
 def calculate_ensemble_mean(monthly_flows, period_key):
     # Concatenate the monthly flows from all GCMs and calculate the mean
     ensemble_data = pd.concat([monthly_flows[gcm][period_key] for gcm in gcm_files.keys()], axis=1)
     return ensemble_data.mean(axis=1)
 
-# Smoothing function using interpolation (for smooth plotting)
-def smooth_data(x, y):
-    x_new = np.linspace(x.min(), x.max(), 500)  # More points for a smoother curve
-    interpolator = interp1d(x, y, kind='cubic')  # Cubic spline for smoothing
-    y_smooth = interpolator(x_new)
-    return x_new, y_smooth
-
-# Function to plot the results for a selected flow scenario
-def plot_scenario(flow_scenario: str):
+# Function to plot the results for a selected flow scenario (show_gcms also draws every GCM's future curves)
+@timed()
+def plot_scenario(flow_scenario: str, show_gcms: bool = False):
     # Load and process data for the selected scenario
     monthly_flows = load_and_process_data(flow_scenario)
 
@@ -78,21 +68,26 @@ def plot_scenario(flow_scenario: str):
     ensemble_mid_future = calculate_ensemble_mean(monthly_flows, 'mid_future')
     ensemble_far_future = calculate_ensemble_mean(monthly_flows, 'far_future')
 
-    # Prepare months for plotting
-    months = np.array(range(1, 13))
-
-    # Apply smoothing to each ensemble series
-    baseline_x_smooth, baseline_y_smooth = smooth_data(months, ensemble_baseline.values)
-    near_future_x_smooth, near_future_y_smooth = smooth_data(months, ensemble_near_future.values)
-    mid_future_x_smooth, mid_future_y_smooth = smooth_data(months, ensemble_mid_future.values)
-    far_future_x_smooth, far_future_y_smooth = smooth_data(months, ensemble_far_future.values)
+    # Smooth all ensemble series at once with the periodic spline (December joins January)
+    x_smooth, (baseline_y_smooth, near_future_y_smooth, mid_future_y_smooth, far_future_y_smooth) = smooth_monthly(
+        [ensemble_baseline.values, ensemble_near_future.values, ensemble_mid_future.values, ensemble_far_future.values])
 
     # Plot the smoothed line graph for the ensemble mean
-    plt.figure(figsize=(13, 8), dpi=300)
-    plt.plot(baseline_x_smooth, baseline_y_smooth, linestyle='--', color='black', label='Baseline (1984-2014)')
-    plt.plot(near_future_x_smooth, near_future_y_smooth, color='#EFCD0F', label='Near Future (2015-2040)')
-    plt.plot(mid_future_x_smooth, mid_future_y_smooth, color='#F06616', label='Mid Future (2041-2070)')
-    plt.plot(far_future_x_smooth, far_future_y_smooth, color='#D20000', label='Far Future (2071-2100)')
+    # Red palette for the extreme scenario, blue for the moderate one
+    colors = ['#0FDBEF', 'blue', '#9A0FEF'] if flow_scenario.endswith('SSP245') else ['#EFCD0F', '#F06616', '#D20000']
+    new_figure(figsize=(13, 8), dpi=300)
+
+    # Thin per-GCM curves of every future period, all smoothed in one matrix multiply
+    if show_gcms:
+        future_keys = ['near_future', 'mid_future', 'far_future']
+        _, gcm_y_smooth = smooth_monthly([[monthly_flows[gcm][key].values for gcm in gcm_files] for key in future_keys])
+        for color, period_curves in zip(colors, gcm_y_smooth):
+            plt.plot(x_smooth, period_curves.T, color=color, linewidth=0.5, alpha=0.3)
+
+    plt.plot(x_smooth, baseline_y_smooth, linestyle='--', color='black', label='Baseline (1984-2014)')
+    plt.plot(x_smooth, near_future_y_smooth, color=colors[0], label='Near Future (2015-2040)')
+    plt.plot(x_smooth, mid_future_y_smooth, color=colors[1], label='Mid Future (2041-2070)')
+    plt.plot(x_smooth, far_future_y_smooth, color=colors[2], label='Far Future (2071-2100)')
 
 #BLUE PELATTE: #0FDBEF, blue, 9A0FEF
 #RED PELATTE:  '#EFCD0F' '#F06616' '#D20000'
@@ -105,13 +100,14 @@ def plot_scenario(flow_scenario: str):
     plt.xticks(ticks=range(1, 13), labels=month_names, rotation=45, fontsize=16)
 
     # Add labels and title
-    plt.title('Extreme Scenario', fontsize=20)
+    plt.title(scenario_title(flow_scenario), fontsize=20)
     plt.ylabel('Mean Monthly Discharge (m³/s)', fontsize=16)
     plt.legend(title='Time Period', fontsize=20, loc='upper left')
 
     # Display the plot
     plt.tight_layout()
-    plt.show()
+    show_figure('monthly_mean_discharge')
 
 # Example usage: Choose a flow scenario ('Flow SSP245' or 'Flow SSP585')
-plot_scenario('Flow SSP585')
+if __name__ == '__main__':
+    plot_scenario('Flow SSP585')
@@ -0,0 +1,358 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from ensemble_cube import load_ensemble_cube
+from gcm_aggregates import GCMAggregateStore
+from instrumentation import timer
+from period_stats import (annual_max_tables, average_by_periods, basic_eflow_table, ensemble_daily_mean, ensemble_monthly_table,
+                          monthly_percentage_change, percentage_change_table, period_annual_max, period_fdcs, split_daily_periods)
+from seasonal_means import ensemble_seasonal_table, load_seasonal_means
+from stats_cache import data_fingerprint
+from study_periods import (ANNUAL_MAX_BASELINE, ANNUAL_MAX_FUTURE_PERIODS, ANNUAL_MAX_PERIOD_LABELS, BOX_PLOT_PERIODS,
+                           DAILY_PERIODS, LINE_GRAPH_PERIODS, SEASONAL_PERIODS)
+
+SCENARIOS = ('SSP245', 'SSP585')
+
+
+class Node:
+    """
+    One lazy step of an analysis: a function applied to arguments, some of which are the results of other nodes.
+    """
+
+    __slots__ = ('function', 'args', 'kwargs', 'name', 'key', 'dependencies')
+
+    def __init__(self, function, args, kwargs, name, key, dependencies):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name
+        self.key = key
+        self.dependencies = dependencies
+
+    def __repr__(self):
+        return f'Node({self.name!r})'
+
+
+# Function to replace the nodes inside an argument by their keys (so equal steps get equal fingerprints)
+def _structure(value):
+    if isinstance(value, Node):
+        return ('node', value.key)
+    if isinstance(value, dict):
+        return {key: _structure(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_structure(item) for item in value)
+    return value
+
+
+# Function to list the nodes inside an argument
+def _find_nodes(value, found):
+    if isinstance(value, Node):
+        found[value.key] = value
+    elif isinstance(value, dict):
+        for item in value.values():
+            _find_nodes(item, found)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _find_nodes(item, found)
+    return found
+
+
+# Function to replace the nodes inside an argument by their results
+def _resolve(value, results):
+    if isinstance(value, Node):
+        return results[value.key]
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_resolve(item, results) for item in value)
+    return value
+
+
+class AnalysisGraph:
+    """
+    Lazy graph of analysis steps shared by any number of analyses.
+
+    Declaring a step with the same function and arguments as an existing one returns the existing node, so
+    analyses that need the same load or reduction share it. compute() runs every node the requested outputs
+    depend on exactly once (results are kept for later calls) and runs independent branches in parallel threads.
+    Results are shared between the analyses that use them and must not be modified.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.results = {}
+        self.seconds = {}
+        self.declared = 0
+
+    # Function to declare a step (or get the identical step declared before)
+    def node(self, function, *args, name=None, **kwargs):
+        """
+        Declares function(*args, **kwargs) as a step; arguments may be nodes (also inside lists, tuples and dicts).
+
+        Args:
+        function (callable): Module-level function computing the step.
+        args: Positional arguments.
+        name (str, optional): Name of the step in timings and profiles. Defaults to the function name.
+        kwargs: Keyword arguments.
+
+        Returns:
+        Node: The node of the step.
+        """
+        self.declared += 1
+        key = data_fingerprint(function.__module__, function.__qualname__, _structure(args), _structure(kwargs))
+        if key not in self.nodes:
+            dependencies = list(_find_nodes([args, kwargs], {}).values())
+            self.nodes[key] = Node(function, args, kwargs, name or function.__name__, key, dependencies)
+        return self.nodes[key]
+
+    # Function to list the nodes that still have to run for the outputs, dependencies first
+    def _pending(self, outputs):
+        order, visited = [], set()
+
+        def visit(node):
+            if node.key in visited or node.key in self.results:
+                return
+            visited.add(node.key)
+            for dependency in node.dependencies:
+                visit(dependency)
+            order.append(node)
+
+        for node in _find_nodes(outputs, {}).values():
+            visit(node)
+        return order
+
+    # Function to run one node
+    def _run(self, node):
+        start = time.perf_counter()
+        with timer(node.name):
+            value = node.function(*_resolve(node.args, self.results), **_resolve(node.kwargs, self.results))
+        self.seconds[node.key] = time.perf_counter() - start
+        self.results[node.key] = value
+
+    # Function to compute the results of any structure of nodes
+    def compute(self, outputs, max_workers=None):
+        """
+        Runs every step the outputs depend on that has not run yet, each exactly once.
+
+        Args:
+        outputs: A node, or a list, tuple or dict (possibly nested) of nodes.
+        max_workers (int, optional): Number of threads for independent steps. Defaults to the CPU count;
+            1 runs the steps one after another in this thread.
+
+        Returns:
+        The outputs with every node replaced by its result.
+        """
+        order = self._pending(outputs)
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers <= 1 or len(order) <= 1:
+            for node in order:
+                self._run(node)
+            return _resolve(outputs, self.results)
+
+        # A node is submitted as soon as the last of its dependencies has finished
+        waiting = {node.key: sum(dependency.key not in self.results for dependency in node.dependencies) for node in order}
+        dependents = {}
+        for node in order:
+            for dependency in node.dependencies:
+                dependents.setdefault(dependency.key, []).append(node)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {executor.submit(self._run, node): node for node in order if waiting[node.key] == 0}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    future.result()  # Raises the error of a failed step
+                    for dependent in dependents.get(node.key, []):
+                        waiting[dependent.key] -= 1
+                        if waiting[dependent.key] == 0:
+                            running[executor.submit(self._run, dependent)] = dependent
+        return _resolve(outputs, self.results)
+
+    # Function to summarise the steps that ran
+    def timings(self):
+        """
+        Returns:
+        pd.DataFrame: Name and seconds of every step that ran, slowest first.
+        """
+        table = pd.DataFrame({'Step': [self.nodes[key].name for key in self.seconds], 'Seconds': list(self.seconds.values())})
+        return table.sort_values('Seconds', ascending=False, ignore_index=True)
+
+
+## STEPS (module-level functions, so equal steps of different analyses are recognised; the reductions are the
+## library functions the scripts call, so the graph and the figures never disagree)
+
+# Function to get the annual maxima of every GCM and scenario: (years, array with shape (gcm, scenario, year))
+def _cube_annual_max(cube):
+    return cube.annual_max('Flow')
+
+
+# Function to tabulate the annual maxima of every GCM per scenario (the combined_data of the annual-max script)
+def _annual_max_tables(cube, annual_max):
+    return annual_max_tables(*annual_max, cube.gcms, cube.scenarios)
+
+
+# Function to average the annual maxima of the GCMs over the baseline and every future period (periods as rows)
+def _annual_max_period_means(tables):
+    combined_data, year_indexes = tables
+    means = {scenario: average_by_periods(df, year_indexes[scenario], ANNUAL_MAX_BASELINE, ANNUAL_MAX_FUTURE_PERIODS)
+             for scenario, df in combined_data.items()}
+    return pd.DataFrame(means).rename_axis('Period')
+
+
+# Function to build the % change table of the mean annual maximum flow (the result_table of the annual-max script)
+def _annual_max_change_table(tables):
+    return percentage_change_table(*tables, ANNUAL_MAX_BASELINE, ANNUAL_MAX_FUTURE_PERIODS, ANNUAL_MAX_PERIOD_LABELS)
+
+
+# Function to tabulate the Gumbel (L-moments) return levels of every period
+def _period_return_levels(annual_max_flows):
+    # Imported here so the analyses that do not fit return levels never import scipy
+    from extreme_value import RETURN_PERIODS, return_levels
+    return pd.DataFrame({period: return_levels(flows.to_numpy()) for period, flows in annual_max_flows.items()},
+                        index=pd.Index(RETURN_PERIODS, name='Return Period (years)'))
+
+
+# Function to bring the per-GCM monthly aggregates of the flow columns up to date (the store of the monthly scripts)
+def _monthly_aggregates(file_paths, columns):
+    store = GCMAggregateStore(columns, {})
+    store.update(file_paths)
+    return store
+
+
+## STEP DECLARATIONS (the building blocks the analyses are made of)
+
+# Function to declare loading a flow ensemble (every scenario in one cube)
+def load(graph, file_paths, scenarios=SCENARIOS):
+    return graph.node(load_ensemble_cube, file_paths, list(scenarios), name='load')
+
+
+# Function to declare the daily ensemble mean flow of one scenario
+def ensemble_mean(graph, cube, scenario):
+    return graph.node(ensemble_daily_mean, cube, scenario, name=f'ensemble mean {scenario}')
+
+
+# Function to declare the annual maxima of every GCM and scenario
+def annual_max(graph, cube):
+    return graph.node(_cube_annual_max, cube, name='annual max')
+
+
+# Function to declare the annual maxima tabulated per scenario (with their year indexes)
+def annual_max_table(graph, cube):
+    return graph.node(_annual_max_tables, cube, annual_max(graph, cube), name='annual max tables')
+
+
+# Function to declare splitting a daily table into periods
+def period_split(graph, data, periods):
+    return graph.node(split_daily_periods, data, periods, name='period split')
+
+
+# Function to declare the per-GCM monthly aggregates of the flow of every scenario
+def monthly_aggregates(graph, file_paths, scenarios=SCENARIOS):
+    return graph.node(_monthly_aggregates, file_paths, [f'Flow {scenario}' for scenario in scenarios], name='monthly aggregates')
+
+
+# Function to declare the FDC of every period of a split
+def fdc(graph, periods):
+    return graph.node(period_fdcs, periods, name='FDC')
+
+
+## ANALYSES (each declares the outputs of one script and returns them by name)
+
+# Function to declare the annual maximum flow analysis: annual maxima, mean per period and % change table
+def annual_max_flow_analysis(graph, file_paths, scenarios=SCENARIOS):
+    cube = load(graph, file_paths, scenarios)
+    tables = annual_max_table(graph, cube)
+    return {'annual_max': annual_max(graph, cube),
+            'average_by_period': graph.node(_annual_max_period_means, tables, name='annual max period means'),
+            'percentage_change': graph.node(_annual_max_change_table, tables, name='annual max % change')}
+
+
+# Function to declare the return period analysis: annual maxima of the ensemble mean and Gumbel return levels per period
+def return_period_analysis(graph, file_paths, scenarios=SCENARIOS):
+    cube = load(graph, file_paths, scenarios)
+    outputs = {}
+    for scenario in scenarios:
+        maxima = graph.node(period_annual_max, period_split(graph, ensemble_mean(graph, cube, scenario), DAILY_PERIODS),
+                            name='period annual max')
+        outputs[f'annual_max {scenario}'] = maxima
+        outputs[f'return_levels {scenario}'] = graph.node(_period_return_levels, maxima, name='return levels')
+    return outputs
+
+
+# Function to declare the environmental flow analysis: FDC, Q90/Q95 and basic e-flow per period
+def environmental_flow_analysis(graph, file_paths, scenarios=SCENARIOS):
+    cube = load(graph, file_paths, scenarios)
+    outputs = {}
+    for scenario in scenarios:
+        curves = fdc(graph, period_split(graph, ensemble_mean(graph, cube, scenario), DAILY_PERIODS))
+        outputs[f'fdc {scenario}'] = curves
+        outputs[f'basic_eflow {scenario}'] = graph.node(basic_eflow_table, curves, name='basic e-flow')
+    return outputs
+
+
+# Function to declare the ensemble monthly means of every period (months as rows, periods as columns) per scenario
+def _monthly_tables(graph, file_paths, scenarios, periods):
+    store = monthly_aggregates(graph, file_paths, scenarios)
+    return {scenario: graph.node(ensemble_monthly_table, store, f'Flow {scenario}', periods, name='ensemble monthly means')
+            for scenario in scenarios}
+
+
+# Function to declare the monthly discharge analysis of the line graph
+def monthly_mean_discharge_analysis(graph, file_paths, scenarios=SCENARIOS):
+    tables = _monthly_tables(graph, file_paths, scenarios, LINE_GRAPH_PERIODS)
+    return {f'monthly_means {scenario}': table for scenario, table in tables.items()}
+
+
+# Function to declare the monthly % change analysis of the box plot
+def monthly_change_analysis(graph, file_paths, scenarios=SCENARIOS):
+    tables = _monthly_tables(graph, file_paths, scenarios, BOX_PLOT_PERIODS)
+    return {f'percentage_change {scenario}': graph.node(monthly_percentage_change, table, name='monthly % change')
+            for scenario, table in tables.items()}
+
+
+# Function to declare the seasonal water balance analysis (precipitation, ET and soil water per season and period)
+def seasonal_means_analysis(graph, file_paths, scenarios=SCENARIOS):
+    means = graph.node(load_seasonal_means, file_paths, list(scenarios), SEASONAL_PERIODS, name='load seasonal means')
+    return {f'seasonal_means {scenario}': graph.node(ensemble_seasonal_table, means, list(scenarios), scenario, SEASONAL_PERIODS,
+                                                      name='ensemble seasonal table')
+            for scenario in scenarios}
+
+
+# Analyses by name: (declaring function, kind of input workbooks)
+ANALYSES = {
+    'annual_max_flow': (annual_max_flow_analysis, 'flow'),
+    'return_period': (return_period_analysis, 'flow'),
+    'environmental_flow': (environmental_flow_analysis, 'flow'),
+    'monthly_mean_discharge': (monthly_mean_discharge_analysis, 'flow'),
+    'monthly_change': (monthly_change_analysis, 'flow'),
+    'seasonal_means': (seasonal_means_analysis, 'water_balance'),
+}
+
+
+# Function to compute several analyses with every shared step run once
+def run_analyses(flow_files, water_balance_files=None, analyses=None, scenarios=SCENARIOS, max_workers=None, graph=None):
+    """
+    Declares the requested analyses on one graph and computes them together.
+
+    Args:
+    flow_files (dict or list of str): GCM name -> flow workbook path (or a list of paths).
+    water_balance_files (dict or list of str, optional): Water balance workbooks; the seasonal analysis is skipped without them.
+    analyses (list of str, optional): Names from ANALYSES. Defaults to all of them.
+    scenarios (tuple of str): Scenarios to analyse.
+    max_workers (int, optional): Number of threads for independent steps (see AnalysisGraph.compute).
+    graph (AnalysisGraph, optional): Graph to declare the analyses on (e.g. to reuse results of an earlier call).
+
+    Returns:
+    (dict, AnalysisGraph): Analysis name -> {output name -> result}, and the graph (for its timings).
+    """
+    graph = AnalysisGraph() if graph is None else graph
+    inputs = {'flow': flow_files, 'water_balance': water_balance_files}
+    outputs = {}
+    for name in analyses or ANALYSES:
+        declare, kind = ANALYSES[name]
+        if inputs[kind] is not None:
+            outputs[name] = declare(graph, inputs[kind], scenarios)
+    return graph.compute(outputs, max_workers), graph
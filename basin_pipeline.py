@@ -0,0 +1,244 @@
+"""
+Multi-basin pipeline: runs every analysis of the repository (annual max flow, monthly line graph and box plots,
+rolling changes, return periods, flow duration curves / environmental flow and the seasonal water balance) for
+every basin of a manifest and saves the figures.
+
+Each basin is one task for a pool of worker processes. A worker first brings the columnar cache of every
+workbook of its basin up to date (load), then runs the analysis jobs of batch_export with the basin's workbooks
+(aggregate, statistics and figures). Progress is saved to <output-dir>/<basin>/basin.json after every job, so
+rerunning the same command after a failure only runs the jobs that did not finish (or all jobs of a basin whose
+workbooks changed).
+
+Manifest (JSON; relative directories are resolved against the manifest's folder):
+{"basins": [{"name": "Amalshid",
+             "flow_dir": "Amalshid Simulation Flow data",
+             "water_balance_dir": "Amalshid SW,ET"}]}
+Every .xlsx workbook of a directory is one GCM, named after the file. The water balance directory is optional
+(without it the seasonal job is skipped).
+
+Usage:
+python basin_pipeline.py manifest.json [--output-dir basins] [--formats png] [--workers N] [--jobs NAME ...] [--force]
+"""
+import argparse
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch_export import SCRIPT_DIR, _run_job, build_jobs
+from gcm_io import workbook_fingerprint
+
+# Manifest keys of the input directories, by kind of workbook
+INPUT_DIRS = {'flow': 'flow_dir', 'water_balance': 'water_balance_dir'}
+
+# Inputs of each script: script -> (global holding its GCM workbooks, kind of workbook)
+SCRIPT_INPUTS = {
+    'Annual Max Flow plot with %change and PDF plots.py': ('file_paths', 'flow'),
+    'Box plot of the ensemble %change in mean monthly flow.py': ('gcm_files', 'flow'),
+    'Line graph for the ensemble mean monthly discharge.py': ('gcm_files', 'flow'),
+    'Heatmap of rolling 30-year %change in monthly and annual max flow.py': ('gcm_files', 'flow'),
+    'Heatmap of Mann-Kendall trends in monthly and annual max flow.py': ('gcm_files', 'flow'),
+    'plot of reducing return period (with Gumbel).py': ('file_paths', 'flow'),
+    'Plot of environmental flow across different time period': ('file_paths', 'flow'),
+    'Plot of seasonal mean of precipitation, ET and SWC across different time periods': ('gcm_files', 'water_balance'),
+}
+
+
+# Function to turn a basin name into a folder name
+def _basin_folder(name):
+    return re.sub(r'[^0-9A-Za-z_-]+', '_', name).strip('_')
+
+
+# Function to list the GCM workbooks of a directory: GCM name (file stem) -> path
+def discover_workbooks(directory):
+    # Files starting with '~$' are Excel lock files of open workbooks
+    file_names = sorted(name for name in os.listdir(directory) if name.lower().endswith('.xlsx') and not name.startswith('~$'))
+    return {os.path.splitext(name)[0]: os.path.join(directory, name) for name in file_names}
+
+
+# Function to read and check a basin manifest
+def read_manifest(path):
+    """
+    Reads the list of basins from a manifest file.
+
+    Args:
+    path (str): Path of the JSON manifest.
+
+    Returns:
+    list of dict: One entry per basin with 'name', 'flow_dir' and optionally 'water_balance_dir' (absolute paths).
+    """
+    with open(path) as file:
+        manifest = json.load(file)
+    basins = manifest['basins'] if isinstance(manifest, dict) else manifest
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    names = set()
+    for basin in basins:
+        if 'name' not in basin or 'flow_dir' not in basin:
+            raise ValueError(f"Every basin needs a 'name' and a 'flow_dir': {basin}")
+        if _basin_folder(basin['name']) in names:
+            raise ValueError(f"Duplicate basin name: {basin['name']}")
+        names.add(_basin_folder(basin['name']))
+        for key in INPUT_DIRS.values():
+            if basin.get(key):
+                basin[key] = os.path.join(base_dir, basin[key])
+    return basins
+
+
+# Function to read the saved progress of a basin (None if there is none)
+def _read_state(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+# Function to save the progress of a basin (written atomically, so an interrupted write never corrupts it)
+def _write_state(path, state):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(state, file, indent=2)
+    os.replace(temporary, path)
+
+
+# Function to run every job of one basin, skipping the jobs a previous run already finished (worker function)
+def _run_basin(basin, jobs, output_dir, formats, script_dir, force):
+    basin_dir = os.path.join(output_dir, _basin_folder(basin['name']))
+    os.makedirs(basin_dir, exist_ok=True)
+    state_path = os.path.join(basin_dir, 'basin.json')
+    previous = _read_state(state_path)
+    state = {'basin': basin['name'], 'pid': os.getpid(), 'status': 'running', 'jobs': {}}
+    start = time.perf_counter()
+
+    # Load: parse new or changed workbooks into the columnar cache and fingerprint every input
+    try:
+        inputs = {kind: discover_workbooks(basin[key]) for kind, key in INPUT_DIRS.items() if basin.get(key)}
+        if not inputs['flow']:
+            raise FileNotFoundError(f"No .xlsx workbooks in {basin['flow_dir']}")
+        state['inputs'] = {path: workbook_fingerprint(path) for files in inputs.values() for path in files.values()}
+    except Exception:
+        state.update(status='failed', error=traceback.format_exc(), seconds=time.perf_counter() - start)
+        _write_state(state_path, state)
+        return state
+    state['load_seconds'] = time.perf_counter() - start
+
+    # Finished jobs of a previous run are kept only if they were made from the same workbooks (jobs that are not
+    # part of this run are carried over as they are)
+    finished = {}
+    if previous is not None and previous.get('inputs') == state['inputs'] and not force:
+        finished = {name: job for name, job in previous['jobs'].items() if job['status'] == 'ok'}
+        state['jobs'] = {name: job for name, job in finished.items() if name not in jobs}
+
+    for name, (script, function, kwargs) in jobs.items():
+        variable, kind = SCRIPT_INPUTS[script]
+        if name in finished:
+            state['jobs'][name] = dict(finished[name], resumed=True)
+            continue
+        if not inputs.get(kind):
+            state['jobs'][name] = {'job': name, 'status': 'skipped', 'error': f"No '{INPUT_DIRS[kind]}' for this basin"}
+            continue
+        state['jobs'][name] = _run_job(name, script, function, kwargs, basin_dir, formats, script_dir,
+                                       overrides={variable: inputs[kind]})
+        _write_state(state_path, state)
+
+    failed = [name for name in jobs if state['jobs'][name]['status'] == 'failed']
+    state['status'] = 'failed' if failed else 'ok'
+    state['seconds'] = time.perf_counter() - start
+    _write_state(state_path, state)
+    return state
+
+
+# Function to run the pipeline for every basin and write the summary
+def run_pipeline(basins, jobs=None, output_dir='basins', formats=('png',), max_workers=None, script_dir=SCRIPT_DIR,
+                 force=False):
+    """
+    Runs every job for every basin, one basin per worker process, and writes output_dir/pipeline.json.
+
+    Args:
+    basins (list of dict): Basins, e.g. from read_manifest.
+    jobs (dict, optional): Job name -> (script, function, keyword arguments). Defaults to batch_export.build_jobs().
+    output_dir (str): Directory for the results (one sub-directory per basin and job).
+    formats (tuple of str): Figure file formats.
+    max_workers (int, optional): Number of worker processes (None uses one per CPU; 1 runs in this process).
+    script_dir (str): Directory of the plotting scripts.
+    force (bool): Run every job again, ignoring the progress saved by previous runs.
+
+    Returns:
+    dict: The summary (settings, total time, basins per hour and one entry per basin).
+    """
+    jobs = build_jobs() if jobs is None else jobs
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(basins)) if basins else 1
+    arguments = (jobs, output_dir, tuple(formats), script_dir, force)
+
+    start = time.perf_counter()
+    states = {}
+    if max_workers <= 1:
+        for basin in basins:
+            states[basin['name']] = _run_basin(basin, *arguments)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(_run_basin, basin, *arguments): basin['name'] for basin in basins}
+            for future in as_completed(futures):
+                try:
+                    states[futures[future]] = future.result()
+                except Exception:
+                    # The worker itself died (e.g. out of memory); the jobs it finished are saved in basin.json
+                    states[futures[future]] = {'basin': futures[future], 'status': 'failed', 'error': traceback.format_exc()}
+    seconds = time.perf_counter() - start
+
+    completed = [state for state in states.values() if state['status'] == 'ok']
+    # Basins whose every job was already done by a previous run do not count towards the throughput
+    resumed = sum(all(state['jobs'][name].get('resumed') or state['jobs'][name]['status'] == 'skipped' for name in jobs)
+                  for state in completed)
+    processed = len(completed) - resumed
+    summary = {'formats': list(formats), 'workers': max_workers, 'seconds': seconds,
+               'basins_completed': len(completed), 'basins_resumed': resumed, 'basins_failed': len(basins) - len(completed),
+               'basins_per_hour': processed / seconds * 3600 if seconds > 0 else 0.0,
+               'basins': [states[basin['name']] for basin in basins]}
+    with open(os.path.join(output_dir, 'pipeline.json'), 'w') as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run every analysis for every basin of a manifest.')
+    parser.add_argument('manifest', help='JSON file listing the basins and their GCM workbook directories')
+    parser.add_argument('--output-dir', default='basins')
+    parser.add_argument('--formats', nargs='+', default=['png'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--jobs', nargs='+', default=None, help='Names of the jobs to run (default: all)')
+    parser.add_argument('--force', action='store_true', help='Run every job again instead of resuming')
+    args = parser.parse_args()
+
+    jobs = build_jobs()
+    if args.jobs:
+        unknown = set(args.jobs) - set(jobs)
+        if unknown:
+            parser.error(f"Unknown jobs: {', '.join(sorted(unknown))} (available: {', '.join(jobs)})")
+        jobs = {name: jobs[name] for name in args.jobs}
+
+    summary = run_pipeline(read_manifest(args.manifest), jobs, args.output_dir, args.formats, args.workers, force=args.force)
+    for state in summary['basins']:
+        counts = {}
+        for job in (state['jobs'][name] for name in jobs if name in state['jobs']):
+            status = 'resumed' if job.get('resumed') else job['status']
+            counts[status] = counts.get(status, 0) + 1
+        print(f"{state['basin']:<24} {state['status']:<7} {state.get('seconds', 0):7.1f} s  "
+              + ', '.join(f'{count} {status}' for status, count in sorted(counts.items())))
+        for name, job in state['jobs'].items():
+            if name in jobs and job['status'] == 'failed':
+                print(f'  {name}:\n{job["error"]}')
+        if 'error' in state:
+            print(state['error'])
+    print(f"{summary['basins_completed']}/{len(summary['basins'])} basins ({summary['basins_resumed']} already done) in "
+          f"{summary['seconds']:.1f} s with {summary['workers']} worker(s): {summary['basins_per_hour']:.1f} basins/hour; "
+          f"summary written to {os.path.join(args.output_dir, 'pipeline.json')}")
+    return 0 if summary['basins_failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,153 @@
+"""
+Headless batch export: renders every figure of the plotting scripts for every scenario with the Agg backend and
+saves them as PNG/PDF/SVG files instead of showing them. Independent jobs run in parallel worker processes, and
+a manifest.json with the timing of every job and figure is written to the output directory.
+
+Usage:
+python batch_export.py [--output-dir figures] [--formats png pdf svg] [--workers N] [--jobs NAME ...]
+"""
+import argparse
+import inspect
+import json
+import os
+import runpy
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import write_report
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Scenarios rendered by the per-scenario jobs
+SCENARIOS = ('SSP245', 'SSP585')
+
+
+# Function to list the export jobs: job name -> (script, function, keyword arguments)
+def build_jobs(scenarios=SCENARIOS):
+    """
+    Lists one job per script and scenario (scripts that already plot both scenarios run once).
+
+    Args:
+    scenarios (tuple of str): Scenarios to render.
+
+    Returns:
+    dict: Job name -> (script file name, function to call, keyword arguments).
+    """
+    jobs = {
+        'annual_max_flow': ('Annual Max Flow plot with %change and PDF plots.py', 'main', {}),
+        'seasonal_means': ('Plot of seasonal mean of precipitation, ET and SWC across different time periods',
+                           'plot_scenarios_side_by_side', {}),
+        'seasonal_trends': ('Plot of seasonal mean of precipitation, ET and SWC across different time periods',
+                            'plot_seasonal_trends', {}),
+        'monthly_change_boxplot_per_gcm': ('Box plot of the ensemble %change in mean monthly flow.py', 'plot_scenarios',
+                                           {'flow_scenarios': [f'Flow {scenario}' for scenario in scenarios]}),
+    }
+    for scenario in scenarios:
+        jobs[f'monthly_change_boxplot_{scenario}'] = ('Box plot of the ensemble %change in mean monthly flow.py',
+                                                      'plot_scenario', {'flow_scenario': f'Flow {scenario}'})
+        jobs[f'monthly_mean_discharge_{scenario}'] = ('Line graph for the ensemble mean monthly discharge.py',
+                                                      'plot_scenario', {'flow_scenario': f'Flow {scenario}'})
+        jobs[f'return_period_{scenario}'] = ('plot of reducing return period (with Gumbel).py', 'main', {'scenario': scenario})
+        jobs[f'return_period_per_gcm_{scenario}'] = ('plot of reducing return period (with Gumbel).py', 'main',
+                                                     {'scenario': scenario, 'per_gcm': True})
+        jobs[f'environmental_flow_{scenario}'] = ('Plot of environmental flow across different time period', 'main',
+                                                  {'scenario': scenario})
+        jobs[f'rolling_change_heatmap_{scenario}'] = ('Heatmap of rolling 30-year %change in monthly and annual max flow.py',
+                                                      'plot_scenario', {'flow_scenario': f'Flow {scenario}'})
+        jobs[f'trend_heatmap_{scenario}'] = ('Heatmap of Mann-Kendall trends in monthly and annual max flow.py',
+                                             'plot_scenario', {'flow_scenario': f'Flow {scenario}'})
+    return jobs
+
+
+# Function to run one job in the current process and save its figures (worker function)
+def _run_job(name, script, function, kwargs, output_dir, formats, script_dir, overrides=None):
+    import matplotlib
+    matplotlib.use('Agg')  # Before the script imports pyplot
+    from figure_export import export_mode
+
+    entry = {'job': name, 'script': script, 'function': function, 'arguments': kwargs, 'pid': os.getpid()}
+    records = []
+    start = time.perf_counter()
+    try:
+        with export_mode(os.path.join(output_dir, name), formats) as records:
+            # The script's own `if __name__ == '__main__'` block is skipped; only the requested function runs
+            namespace = runpy.run_path(os.path.join(script_dir, script), run_name='batch_export')
+            # run_path returns a copy of the script's globals, so module settings (e.g. its GCM file paths) are
+            # replaced in the globals the function actually reads (those of the function under its decorators)
+            inspect.unwrap(namespace[function]).__globals__.update(overrides or {})
+            namespace[function](**kwargs)
+        entry['status'] = 'ok'
+    except Exception:
+        entry['status'] = 'failed'
+        entry['error'] = traceback.format_exc()
+    entry['seconds'] = time.perf_counter() - start
+    entry['figures'] = records
+    # With instrumentation on (GCM_PROFILE_DIR) every job gets its own profile, named after its output folder and job
+    profile = write_report(label=f'{os.path.basename(os.path.normpath(output_dir))} {name}')
+    if profile is not None:
+        entry['profile'] = profile['files']['json']
+    return entry
+
+
+# Function to render every job and write the manifest
+def run_batch(jobs, output_dir='figures', formats=('png', 'pdf', 'svg'), max_workers=None, script_dir=SCRIPT_DIR):
+    """
+    Renders the figures of every job, in parallel worker processes, and writes output_dir/manifest.json.
+
+    Args:
+    jobs (dict): Job name -> (script, function, keyword arguments), e.g. from build_jobs.
+    output_dir (str): Directory for the figures (one sub-directory per job) and the manifest.
+    formats (tuple of str): File formats to save.
+    max_workers (int, optional): Number of worker processes (None uses one per CPU; 1 renders in this process).
+    script_dir (str): Directory of the plotting scripts.
+
+    Returns:
+    dict: The manifest (settings, total time and one entry per job with its figures and timings).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_jobs = len(jobs)
+    arguments = [(name, script, function, kwargs, output_dir, tuple(formats), script_dir)
+                 for name, (script, function, kwargs) in jobs.items()]
+    max_workers = min(max_workers or os.cpu_count() or 1, n_jobs) if n_jobs else 1
+
+    start = time.perf_counter()
+    if max_workers <= 1:
+        entries = [_run_job(*job) for job in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            entries = list(executor.map(_run_job, *zip(*arguments)))
+
+    manifest = {'formats': list(formats), 'workers': max_workers, 'seconds': time.perf_counter() - start, 'jobs': entries}
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render every figure for every scenario to files.')
+    parser.add_argument('--output-dir', default='figures')
+    parser.add_argument('--formats', nargs='+', default=['png', 'pdf', 'svg'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--jobs', nargs='+', default=None, help='Names of the jobs to run (default: all)')
+    args = parser.parse_args()
+
+    jobs = build_jobs()
+    if args.jobs:
+        unknown = set(args.jobs) - set(jobs)
+        if unknown:
+            parser.error(f"Unknown jobs: {', '.join(sorted(unknown))} (available: {', '.join(jobs)})")
+        jobs = {name: jobs[name] for name in args.jobs}
+
+    manifest = run_batch(jobs, args.output_dir, args.formats, args.workers)
+    for entry in manifest['jobs']:
+        print(f"{entry['job']:<32} {entry['status']:<7} {entry['seconds']:7.1f} s  {len(entry['figures'])} figure(s)")
+        if entry['status'] != 'ok':
+            print(entry['error'])
+    print(f"{len(manifest['jobs'])} jobs in {manifest['seconds']:.1f} s with {manifest['workers']} worker(s); "
+          f"manifest written to {os.path.join(args.output_dir, 'manifest.json')}")
+    return 0 if all(entry['status'] == 'ok' for entry in manifest['jobs']) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,133 @@
+"""
+Shared analysis graph against running the analyses one by one: every analysis declared on its own graph (as the
+scripts run them, each loading and reducing the ensemble itself) versus all analyses declared on one graph, where
+the load, the ensemble means, the period splits and the monthly means each run once. Prints the steps declared,
+the steps that actually ran and the wall time of both, and checks that the results are identical. Also checks the
+shared graph against the plotting scripts' own functions: the % change table (result_table) and average annual max
+flow per period of the annual-max script, the period annual maxima and Gumbel design floods of the return-period
+script, the mean basic e-flow of the e-flow script (calculate_basic_eflow), and the ensemble monthly means and
+% changes of the line graph and box plot.
+
+Usage:
+python benchmarks/bench_analysis_graph.py [n_gcms] [max_workers]
+"""
+import contextlib
+import inspect
+import io
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from analysis_graph import ANALYSES, SCENARIOS, AnalysisGraph, run_analyses
+from synthetic_data import FLOW_VARIABLES, WATER_BALANCE_VARIABLES, write_synthetic_ensemble
+
+
+# Function to check that two (nested) results are identical
+def assert_same(a, b):
+    if isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for key in a:
+            assert_same(a[key], b[key])
+    elif isinstance(a, (list, tuple)):
+        for item_a, item_b in zip(a, b):
+            assert_same(item_a, item_b)
+    elif isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+    elif isinstance(a, pd.Series):
+        pd.testing.assert_series_equal(a, b)
+    else:
+        np.testing.assert_array_equal(a, b)
+
+
+# Function to load a plotting script with its GCM workbooks replaced (as batch_export runs it, without a display)
+def load_script(script, variable, gcm_files):
+    import matplotlib
+    matplotlib.use('Agg')  # Before the script imports pyplot
+    namespace = runpy.run_path(os.path.join(REPO_DIR, script), run_name='bench')
+    # run_path returns a copy of the script's globals: replace the workbooks in the globals its functions read
+    for value in namespace.values():
+        if inspect.isfunction(value) and value.__module__ == 'bench':
+            inspect.unwrap(value).__globals__[variable] = gcm_files
+    return namespace
+
+
+# Function to check the outputs of the shared graph against the plotting scripts' own functions
+def check_against_scripts(results, flow_files):
+    script = load_script('Annual Max Flow plot with %change and PDF plots.py', 'file_paths', flow_files)
+    combined_data, year_indexes = script['combine_annual_max'](script['load_all_gcm_data'](flow_files))
+    pd.testing.assert_frame_equal(results['annual_max_flow']['percentage_change'],
+                                  script['calculate_percentage_change_table'](combined_data, year_indexes))
+    for scenario in SCENARIOS:
+        assert results['annual_max_flow']['average_by_period'][scenario].to_dict() == \
+            script['calculate_average_by_periods'](combined_data[scenario], year_indexes[scenario])
+
+    script = load_script('plot of reducing return period (with Gumbel).py', 'file_paths', flow_files)
+    for scenario in SCENARIOS:
+        maxima = script['calculate_annual_max'](script['split_by_periods'](script['load_gcm_data'](flow_files, f'Flow {scenario}')))
+        assert_same(results['return_period'][f'annual_max {scenario}'], maxima)
+        floods = script['calculate_design_floods'](maxima, distributions=('gumbel',), n_boot=10)
+        np.testing.assert_allclose(results['return_period'][f'return_levels {scenario}'].to_numpy().ravel(order='F'),
+                                   floods['Flow (m³/s)'].to_numpy(), rtol=1e-12)
+
+    script = load_script('Plot of environmental flow across different time period', 'file_paths', flow_files)
+    _, ensemble_by_scenario = script['load_gcm_data_all_scenarios'](flow_files, SCENARIOS)
+    for scenario, data in ensemble_by_scenario.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            mean_basic_eflow = script['calculate_basic_eflow'](script['calculate_period_fdcs'](script['split_by_periods'](data)))
+        assert results['environmental_flow'][f'basic_eflow {scenario}'].loc['Mean', 'Basic E-Flow'] == mean_basic_eflow
+
+    for name, script_name, output in [
+        ('monthly_mean_discharge', 'Line graph for the ensemble mean monthly discharge.py', 'monthly_means'),
+        ('monthly_change', 'Box plot of the ensemble %change in mean monthly flow.py', 'percentage_change'),
+    ]:
+        script = load_script(script_name, 'gcm_files', flow_files)
+        for scenario in SCENARIOS:
+            monthly_flows = script['load_and_process_data'](f'Flow {scenario}')
+            table = pd.DataFrame({period: script['calculate_ensemble_mean'](monthly_flows, period) for period in script['periods']})
+            if name == 'monthly_change':
+                table = table.drop(columns='baseline').apply(lambda flows: script['percentage_change'](flows, table['baseline']))
+            pd.testing.assert_frame_equal(results[name][f'{output} {scenario}'], table)
+
+
+def main(n_gcms=13, max_workers=None):
+    with tempfile.TemporaryDirectory() as workdir:
+        flow_files = write_synthetic_ensemble(os.path.join(workdir, 'flow'), n_gcms, FLOW_VARIABLES, excel=False)
+        water_balance_files = write_synthetic_ensemble(os.path.join(workdir, 'water_balance'), n_gcms,
+                                                       WATER_BALANCE_VARIABLES, excel=False)
+
+        # One graph per analysis: nothing is shared between the analyses
+        start = time.perf_counter()
+        separate, declared, executed = {}, 0, 0
+        for name in ANALYSES:
+            results, graph = run_analyses(flow_files, water_balance_files, [name], max_workers=max_workers)
+            separate.update(results)
+            declared += graph.declared
+            executed += len(graph.seconds)
+        separate_seconds = time.perf_counter() - start
+
+        # One graph for all analyses
+        start = time.perf_counter()
+        shared, graph = run_analyses(flow_files, water_balance_files, max_workers=max_workers, graph=AnalysisGraph())
+        shared_seconds = time.perf_counter() - start
+
+        check_against_scripts(shared, flow_files)
+
+    assert_same(separate, shared)
+    print(f'{len(ANALYSES)} analyses, {n_gcms} synthetic GCMs, max_workers={max_workers or os.cpu_count()}')
+    print(f'separate graphs: {declared:3d} steps declared, {executed:3d} run, {separate_seconds:7.3f} s')
+    print(f'shared graph:    {graph.declared:3d} steps declared, {len(graph.seconds):3d} run, {shared_seconds:7.3f} s '
+          f'({separate_seconds / shared_seconds:.1f}x faster)')
+    print("results identical, and identical to the plotting scripts' own functions")
+    print('slowest steps of the shared graph:')
+    print(graph.timings().head(8).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,80 @@
+"""
+Memory and aggregation-time comparison: dict of per-GCM DataFrames with iterative merges vs the dense EnsembleCube.
+
+Usage:
+python benchmarks/bench_ensemble_cube.py [n_gcms ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ensemble_cube import build_ensemble_cube
+from synthetic_data import synthetic_ensemble
+
+SCENARIOS = ['SSP245', 'SSP585']
+
+
+# The former approach: per-GCM groupby on 'Year' plus one pd.merge per GCM, then pandas row statistics
+def merge_approach(frames):
+    for df in frames.values():
+        df['Year'] = df['Date'].dt.year
+    results = {}
+    for scenario in SCENARIOS:
+        merged_data = pd.DataFrame()
+        for gcm, df in frames.items():
+            annual_max = df.groupby('Year').max().reset_index()[['Year', f'Flow {scenario}']]
+            annual_max = annual_max.rename(columns={f'Flow {scenario}': f'Flow {scenario}_{gcm}'})
+            merged_data = annual_max if merged_data.empty else pd.merge(merged_data, annual_max, on='Year')
+        merged_data = merged_data.dropna()
+        results[scenario] = (merged_data.iloc[:, 1:].mean(axis=1),
+                             merged_data.iloc[:, 1:].quantile(0.025, axis=1),
+                             merged_data.iloc[:, 1:].quantile(0.975, axis=1),
+                             sum(df[f'Flow {scenario}'] for df in frames.values()) / len(frames))
+    return results
+
+
+# The cube approach: annual max, ensemble mean and percentiles as axis reductions
+def cube_approach(cube):
+    years, annual_max = cube.annual_max('Flow')
+    results = {}
+    for s, scenario in enumerate(cube.scenarios):
+        results[scenario] = (annual_max[:, s].mean(axis=0),
+                             np.percentile(annual_max[:, s], 2.5, axis=0),
+                             np.percentile(annual_max[:, s], 97.5, axis=0),
+                             cube.ensemble_mean('Flow', scenario))
+    return results
+
+
+def main(ensemble_sizes=(12, 50)):
+    print(f'{"GCMs":>5} {"frames MB":>10} {"cube MB":>8} {"cube32 MB":>10} {"merge s":>8} {"cube s":>7} {"speed-up":>9}')
+    for n_gcms in ensemble_sizes:
+        frames = synthetic_ensemble(n_gcms)
+        for df in frames.values():
+            df['Year'] = df['Date'].dt.year
+        frames_mb = sum(df.memory_usage(deep=True).sum() for df in frames.values()) / 1e6
+
+        cube = build_ensemble_cube(frames, SCENARIOS)
+        cube32 = build_ensemble_cube(frames, SCENARIOS, dtype=np.float32)
+
+        start = time.perf_counter()
+        reference = merge_approach(frames)
+        merge_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = cube_approach(cube)
+        cube_time = time.perf_counter() - start
+
+        for scenario in SCENARIOS:
+            for expected, actual in zip(reference[scenario], result[scenario]):
+                np.testing.assert_allclose(np.asarray(expected), actual, rtol=1e-9)
+
+        print(f'{n_gcms:>5} {frames_mb:>10.1f} {cube.nbytes / 1e6:>8.1f} {cube32.nbytes / 1e6:>10.1f} '
+              f'{merge_time:>8.3f} {cube_time:>7.3f} {merge_time / cube_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (12, 50))
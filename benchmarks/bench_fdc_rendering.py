@@ -0,0 +1,67 @@
+"""
+Render time and file size of the flow duration curve figure drawn from every daily value vs downsampled curves
+(fixed exceedance grid and LTTB), with the largest deviation of each downsampled curve from the full one.
+
+Usage:
+python benchmarks/bench_fdc_rendering.py [n_periods] [days_per_period] [max_points]
+"""
+import io
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flow_duration import downsample_fdc, flow_duration_curve
+
+FORMATS = ('png', 'svg', 'pdf')
+
+
+# Function to draw the FDC figure the way plot_fdc does and save it in memory
+def render(curves, fmt):
+    plt.figure(figsize=(10, 6), dpi=300)
+    for period, (flows, exceedance) in curves.items():
+        plt.plot(exceedance, flows, label=period)
+    plt.yscale('log')
+    plt.xlabel('Exceedance Probability (%)')
+    plt.ylabel('Flow (cumec)')
+    plt.legend()
+    plt.grid(True, which='both', linestyle='--', linewidth=0.5)
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    plt.savefig(buffer, format=fmt)
+    elapsed = time.perf_counter() - start
+    plt.close()
+    return elapsed, buffer.getbuffer().nbytes
+
+
+def main(n_periods=4, days_per_period=11000, max_points=500):
+    rng = np.random.default_rng(0)
+    fdcs = {f'Period {p + 1}': flow_duration_curve(rng.gamma(2.0, 60.0 * (1 + 0.1 * p), days_per_period) + 200)
+            for p in range(n_periods)}
+
+    variants = {'full': fdcs}
+    for method in ('grid', 'lttb'):
+        variants[method] = {period: downsample_fdc(flows, exceedance, max_points, method)
+                            for period, (flows, exceedance) in fdcs.items()}
+
+    print(f'{n_periods} curves of {days_per_period} days, downsampled to ~{max_points} points')
+    print(f'{"curve":>6} {"points":>7} {"max dev.":>9} ' + ' '.join(f'{fmt + " s":>7} {fmt + " kB":>8}' for fmt in FORMATS))
+    for name, curves in variants.items():
+        points = sum(len(flows) for flows, _ in curves.values())
+        # Largest gap between the drawn polyline and the full curve, relative to the flow range
+        deviation = max(np.max(np.abs(np.interp(fdcs[period][1], exceedance, flows) - fdcs[period][0]))
+                        / np.ptp(fdcs[period][0]) for period, (flows, exceedance) in curves.items())
+        cells = []
+        for fmt in FORMATS:
+            elapsed, size = render(curves, fmt)
+            cells.append(f'{elapsed:>7.3f} {size / 1e3:>8.1f}')
+        print(f'{name:>6} {points:>7} {deviation:>9.2%} ' + ' '.join(cells))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,46 @@
+"""
+Cold-vs-warm timing benchmark for the columnar GCM workbook cache (gcm_io.read_gcm_workbook).
+
+Usage:
+python benchmarks/bench_gcm_cache.py [n_gcms]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gcm_io import read_gcm_workbook
+from synthetic_data import write_synthetic_workbook
+
+
+def main(n_gcms=3):
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = [os.path.join(workdir, f'GCM-{i:02d}.xlsx') for i in range(n_gcms)]
+        for i, path in enumerate(paths):
+            write_synthetic_workbook(path, seed=i)
+
+        start = time.perf_counter()
+        for path in paths:
+            read_gcm_workbook(path, use_cache=False)
+        excel_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for path in paths:
+            read_gcm_workbook(path)
+        cold_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for path in paths:
+            read_gcm_workbook(path)
+        warm_time = time.perf_counter() - start
+
+    print(f'GCMs: {n_gcms}')
+    print(f'pd.read_excel only:        {excel_time:8.3f} s')
+    print(f'Cold (parse + write cache): {cold_time:8.3f} s')
+    print(f'Warm (load from cache):    {warm_time:8.3f} s')
+    print(f'Speed-up warm vs read_excel: {excel_time / warm_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
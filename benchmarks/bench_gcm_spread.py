@@ -0,0 +1,63 @@
+"""
+Per-GCM % change table of the monthly box plot: the long-format monthly means of every scenario, GCM, period and
+month (GCMAggregateStore.monthly_mean_table) and the per-GCM percentage change of the box-plot script, for 12 vs
+50 GCMs, with both scenarios aggregated in one pass vs one pass per scenario.
+
+Usage:
+python benchmarks/bench_gcm_spread.py [small_ensemble] [large_ensemble]
+"""
+import os
+import runpy
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from gcm_aggregates import GCMAggregates, GCMAggregateStore
+from synthetic_data import synthetic_ensemble
+
+COLUMNS = ['Flow SSP245', 'Flow SSP585']
+SCRIPT = 'Box plot of the ensemble %change in mean monthly flow.py'
+
+
+# Function to time the per-GCM change table of one ensemble
+def time_ensemble(frames, periods, calculate_changes):
+    # One pass over every GCM for both scenarios, as plot_scenarios does
+    start = time.perf_counter()
+    store = GCMAggregateStore(COLUMNS, periods)
+    store.members = {name: GCMAggregates.from_frame(df, COLUMNS, periods, name) for name, df in frames.items()}
+    joint_time = time.perf_counter() - start
+
+    # One pass per scenario, as calling plot_scenario once per scenario does
+    start = time.perf_counter()
+    for column in COLUMNS:
+        {name: GCMAggregates.from_frame(df, [column], periods, name) for name, df in frames.items()}
+    separate_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = store.monthly_mean_table()
+    table_time = time.perf_counter() - start
+    start = time.perf_counter()
+    changes = calculate_changes(table)
+    changes_time = time.perf_counter() - start
+    return joint_time, separate_time, table_time, changes_time, changes
+
+
+def main(small_ensemble=12, large_ensemble=50):
+    script = runpy.run_path(os.path.join(REPO_DIR, SCRIPT), run_name='bench')
+    frames = synthetic_ensemble(large_ensemble)
+
+    for n_gcms in (small_ensemble, large_ensemble):
+        ensemble = dict(list(frames.items())[:n_gcms])
+        joint_time, separate_time, table_time, changes_time, changes = time_ensemble(
+            ensemble, script['periods'], script['calculate_gcm_percentage_changes'])
+        boxes = changes.groupby(['Scenario', 'Period', 'Month'])['Percentage Change']
+        print(f'{n_gcms} GCMs: {len(changes)} changes in {boxes.ngroups} boxes '
+              f'(mean inter-model IQR {boxes.quantile(0.75).sub(boxes.quantile(0.25)).mean():.2f} points)')
+        print(f'  aggregates, both scenarios in one pass: {joint_time:8.3f} s  (one pass per scenario: {separate_time:.3f} s)')
+        print(f'  long-format monthly table:              {table_time * 1e3:8.2f} ms')
+        print(f'  per-GCM % change:                       {changes_time * 1e3:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
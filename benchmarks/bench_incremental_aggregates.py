@@ -0,0 +1,75 @@
+"""
+Incremental update of the per-GCM aggregate store (gcm_aggregates.GCMAggregateStore): build the store for an
+ensemble, then add one more GCM, and check that only that GCM is recomputed and that the merged ensemble statistics
+(the added GCM's included) match a full recompute.
+
+Usage:
+python benchmarks/bench_incremental_aggregates.py [n_gcms] [last_year]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gcm_aggregates import GCMAggregateStore
+from gcm_io import load_gcm_ensemble
+from time_index import TimeIndex
+from study_periods import BOX_PLOT_PERIODS as PERIODS
+from synthetic_data import write_synthetic_workbook
+
+COLUMNS = ['Flow SSP245', 'Flow SSP585']
+
+
+# Function to time a call
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(n_gcms=30, last_year=2100):
+    with tempfile.TemporaryDirectory() as workdir:
+        gcm_files = {f'GCM-{i:02d}': os.path.join(workdir, f'GCM-{i:02d}.xlsx') for i in range(n_gcms + 1)}
+        for i, path in enumerate(gcm_files.values()):
+            write_synthetic_workbook(path, seed=i, end=f'{last_year}-12-31')
+        first, added = dict(list(gcm_files.items())[:n_gcms]), list(gcm_files)[-1]
+
+        store = GCMAggregateStore(COLUMNS, PERIODS)
+        _, build_time = timed(store.update, first, max_workers=1)
+        _, noop_time = timed(GCMAggregateStore(COLUMNS, PERIODS).update, first, max_workers=1)
+        updated, add_time = timed(store.update, gcm_files, max_workers=1)
+        assert updated == [added], f'Expected only {added} to be recomputed, got {updated}'
+
+        # Full recompute of the ensemble monthly means from the daily data of every GCM (warm column caches)
+        def full_recompute():
+            means = {}
+            for name, df in load_gcm_ensemble(gcm_files, columns=['Date'] + COLUMNS, max_workers=1).items():
+                time_index = TimeIndex(df['Date'])
+                means[name] = {(column, period): time_index.monthly_mean(df[column].to_numpy(), time_index.year_slice(*years))
+                               for column in COLUMNS for period, years in PERIODS.items()}
+            return means
+        reference, recompute_time = timed(full_recompute)
+
+        # Every GCM is checked, so the added GCM's aggregates are compared with its own full recompute too
+        worst = 0.0
+        for column in COLUMNS:
+            for period in PERIODS:
+                merged = store.gcm_monthly_means(column, period)
+                for name in gcm_files:
+                    worst = max(worst, np.max(np.abs(merged[name].to_numpy() / reference[name][(column, period)] - 1)))
+
+        print(f'{n_gcms} GCMs, record 1984-{last_year}')
+        rows = [('initial build (workbooks parsed)', build_time),
+                ('no-op update (aggregates read back)', noop_time),
+                (f'add 1 GCM ({", ".join(updated)})', add_time),
+                (f'full recompute of {n_gcms + 1} GCMs (warm caches)', recompute_time)]
+        for label, seconds in rows:
+            print(f'{label:<42} {seconds:8.2f} s')
+        print(f'{"max relative difference vs full recompute":<42} {worst:8.1e}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
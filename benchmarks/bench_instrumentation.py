@@ -0,0 +1,86 @@
+"""
+Overhead of the stage timers (instrumentation.timed / timer) per call, with instrumentation off and on, against an
+undecorated call; and the cost relative to a real hot-path stage (the batched KDE of the annual maxima).
+
+Usage:
+python benchmarks/bench_instrumentation.py [n_calls] [n_gcms]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import instrumentation
+from instrumentation import timed, timer
+from kde import gaussian_kde_batch
+
+
+# A function cheap enough that the timer dominates its cost
+def add(a, b):
+    return a + b
+
+
+# Function to time n calls of a function (best of 5 runs), in nanoseconds per call
+def per_call(function, n_calls):
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            function(1, 2)
+        best = min(best, time.perf_counter() - start)
+    return best / n_calls * 1e9
+
+
+# Function to time n blocks wrapped in timer(), in nanoseconds per block
+def per_block(n_calls):
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            with timer('block'):
+                pass
+        best = min(best, time.perf_counter() - start)
+    return best / n_calls * 1e9
+
+
+# Function to time one call
+def timed_call(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(n_calls=200000, n_gcms=13):
+    decorated = timed('add')(add)
+    samples = np.random.default_rng(0).gumbel(800.0, 250.0, (n_gcms, 86))
+    kde = timed('kde')(gaussian_kde_batch.__wrapped__)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        instrumentation.disable()
+        plain = per_call(add, n_calls)
+        off = per_call(decorated, n_calls)
+        block_off = per_block(n_calls)
+        kde_off = min(timed_call(kde, samples) for _ in range(20))
+
+        instrumentation.enable(output_dir)
+        on = per_call(decorated, n_calls)
+        block_on = per_block(n_calls)
+        kde_on = min(timed_call(kde, samples) for _ in range(20))
+        report = instrumentation.write_report('bench_instrumentation')
+        instrumentation.disable()
+
+    print(f'undecorated call:            {plain:8.1f} ns')
+    print(f'@timed, instrumentation off: {off:8.1f} ns  (+{off - plain:.1f} ns)')
+    print(f'@timed, instrumentation on:  {on:8.1f} ns  (+{on - plain:.1f} ns)')
+    print(f'timer() block, off / on:     {block_off:8.1f} / {block_on:.1f} ns')
+    print(f'KDE of {n_gcms} GCMs, off / on:   {kde_off * 1e3:8.3f} / {kde_on * 1e3:.3f} ms '
+          f'(timer off: {(off - plain) * 1e-9 / kde_off:.4%}, on: {(on - plain) * 1e-9 / kde_off:.4%} of the stage)')
+    stages = ', '.join(f"{row['stage']} x{row['calls']}" for row in report['stages'])
+    print(f'stages recorded: {stages}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
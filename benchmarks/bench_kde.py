@@ -0,0 +1,85 @@
+"""
+Batched KDE (kde.gaussian_kde_batch) vs one sns.kdeplot / scipy gaussian_kde call per curve, for per-GCM PDFs
+of annual maxima (GCMs x scenarios x periods curves), plus the binned method on long daily series. Also checks
+that 'auto' picks the method per sample in a batch mixing annual maxima with a daily series.
+
+Usage:
+python benchmarks/bench_kde.py [n_gcms] [daily_length]
+"""
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+from scipy.stats import gaussian_kde
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kde import gaussian_kde_batch
+
+# Lengths (years) of the baseline, near, mid and far future periods, for two scenarios
+PERIOD_LENGTHS = (31, 26, 30, 30) * 2
+
+
+# The former approach: one seaborn call per curve (bandwidth, grid and density computed on the plotting side)
+def seaborn_densities(samples, max_calls=200):
+    fig, ax = plt.subplots()
+    calls = min(len(samples), max_calls)  # Timed on a subset and scaled up
+    start = time.perf_counter()
+    for sample in samples[:calls]:
+        sns.kdeplot(sample, ax=ax, fill=True)
+    elapsed = (time.perf_counter() - start) * len(samples) / calls
+    plt.close(fig)
+    return elapsed
+
+
+# One scipy fit and evaluation per curve, on seaborn's grid
+def scipy_densities(samples):
+    densities = []
+    for sample in samples:
+        kde = gaussian_kde(sample)
+        bandwidth = np.sqrt(kde.covariance.squeeze())
+        densities.append(kde(np.linspace(sample.min() - 3 * bandwidth, sample.max() + 3 * bandwidth, 200)))
+    return np.array(densities)
+
+
+def main(n_gcms=50, daily_length=43000):
+    rng = np.random.default_rng(0)
+    samples = [rng.gumbel(1200, 150, length) for _ in range(n_gcms) for length in PERIOD_LENGTHS]
+
+    start = time.perf_counter()
+    _, batched = gaussian_kde_batch(samples)
+    batched_time = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = scipy_densities(samples)
+    scipy_time = time.perf_counter() - start
+    seaborn_time = seaborn_densities(samples)
+
+    print(f'{len(samples)} curves ({n_gcms} GCMs x {len(PERIOD_LENGTHS)} scenario-periods)')
+    print(f'sns.kdeplot per curve:        {seaborn_time:8.3f} s')
+    print(f'scipy gaussian_kde per curve: {scipy_time:8.3f} s')
+    print(f'gaussian_kde_batch:           {batched_time:8.3f} s  ({scipy_time / batched_time:.0f}x vs scipy, '
+          f'{seaborn_time / batched_time:.0f}x vs seaborn), max rel. difference {np.max(np.abs(batched - reference) / reference.max(axis=1, keepdims=True)):.1e}')
+
+    daily = [rng.gamma(2.0, 60.0, daily_length) for _ in range(8)]
+    print(f'\n{len(daily)} daily series of {daily_length} values')
+    densities = {}
+    for method in ('direct', 'binned'):
+        start = time.perf_counter()
+        _, densities[method] = gaussian_kde_batch(daily, method=method)
+        print(f'{method:>6}: {time.perf_counter() - start:8.3f} s')
+    print(f'max rel. difference binned vs direct: '
+          f'{np.max(np.abs(densities["binned"] - densities["direct"]) / densities["direct"].max(axis=1, keepdims=True)):.1e}')
+
+    # One long series in the batch: the annual maxima keep the exact method, the daily series is binned
+    _, mixed = gaussian_kde_batch(samples[:len(PERIOD_LENGTHS)] + daily[:1])
+    np.testing.assert_allclose(mixed[:-1], batched[:len(PERIOD_LENGTHS)], rtol=1e-12)
+    np.testing.assert_allclose(mixed[-1], densities['binned'][0], rtol=1e-6)  # FFT length depends on the batch
+    print('auto on a mixed batch: exact for the annual maxima, binned for the daily series')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
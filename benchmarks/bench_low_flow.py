@@ -0,0 +1,77 @@
+"""
+Low-flow and hydrologic-alteration indices (7-day minimum, dates of the annual minimum and maximum, rise and fall
+rates, reversals, pulse counts) of every GCM and scenario of a synthetic ensemble: low_flow.annual_flow_indices on
+the whole (gcm, scenario, time) array against a pandas loop over the series and years. Also times the full
+per-period table with 7Q10 (low_flow.low_flow_table).
+
+Usage:
+python benchmarks/bench_low_flow.py [n_gcms] [n_loop_series]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ensemble_cube import build_ensemble_cube
+from low_flow import ANNUAL_INDICES, annual_flow_indices, low_flow_table
+from study_periods import DAILY_PERIODS as PERIODS
+from synthetic_data import SCENARIOS, synthetic_ensemble
+
+
+# Function to compute the annual indices of one series with pandas, year by year
+def loop_indices(flows, dates):
+    series = pd.Series(flows, index=dates)
+    baseline = series[(dates.year >= 1984) & (dates.year <= 2014)]
+    low_threshold, high_threshold = baseline.quantile([0.25, 0.75])
+    weekly = series.rolling(7).mean()
+    change = series.diff()
+    direction = np.sign(change.fillna(0))
+    reversal = direction * direction.replace(0, np.nan).ffill().shift() < 0
+    below, above = series < low_threshold, series > high_threshold
+    low_pulse = below & ~below.shift(fill_value=False)
+    high_pulse = above & ~above.shift(fill_value=False)
+
+    rows = {}
+    for year, days in series.groupby(dates.year):
+        year_change = change[days.index]
+        rows[year] = [days.min(), weekly[days.index].min(), days.max(), days.idxmin().dayofyear, days.idxmax().dayofyear,
+                      year_change[year_change > 0].mean(), year_change[year_change < 0].mean(),
+                      reversal[days.index].sum(), low_pulse[days.index].sum(), high_pulse[days.index].sum()]
+    return pd.DataFrame.from_dict(rows, orient='index', columns=ANNUAL_INDICES)
+
+
+def main(n_gcms=50, n_loop_series=10):
+    cube = build_ensemble_cube(synthetic_ensemble(n_gcms), list(SCENARIOS))
+    dates = pd.DatetimeIndex(cube.dates)
+    flows = cube['Flow']
+    n_series = flows.shape[0] * flows.shape[1]
+    n_loop_series = min(n_loop_series, n_gcms)
+
+    start = time.perf_counter()
+    years, indices = annual_flow_indices(flows, cube.time_index)
+    batched_seconds = time.perf_counter() - start
+
+    # The loop is timed (and checked) on the first n_loop_series GCMs of the first scenario, then scaled to the ensemble
+    start = time.perf_counter()
+    for g in range(n_loop_series):
+        looped = loop_indices(flows[g, 0], dates)
+        for name in ANNUAL_INDICES:
+            np.testing.assert_allclose(indices[name][g, 0], looped[name].to_numpy(dtype=float), rtol=1e-9, err_msg=name)
+    loop_seconds = (time.perf_counter() - start) / n_loop_series * n_series
+
+    start = time.perf_counter()
+    table = low_flow_table(flows, cube.time_index, cube.gcms, cube.scenarios, PERIODS)
+    table_seconds = time.perf_counter() - start
+
+    print(f'{n_gcms} GCMs x {len(SCENARIOS)} scenarios = {n_series} daily series of {flows.shape[-1]} days, {len(years)} years')
+    print(f'pandas loop over series and years: {loop_seconds:8.2f} s (estimated from {n_loop_series} series)')
+    print(f'one pass over the ensemble array:  {batched_seconds:8.2f} s ({loop_seconds / batched_seconds:.0f}x faster, '
+          f'results identical)')
+    print(f'per-period table with 7Q10 ({len(table)} rows, ensemble mean included): {table_seconds:.2f} s')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
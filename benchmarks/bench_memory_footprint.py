@@ -0,0 +1,95 @@
+"""
+Peak memory (tracemalloc) of loading a large ensemble into the flow cube: all GCM DataFrames in float64 followed
+by the cube (the former path), the streamed float64 cube, and the streamed compact (float32) cube, read in this
+process and with a pool of worker processes (whose results stream in with only about max_workers GCMs read ahead),
+and the peak while a slow caller works through the GCMs one by one, in this process and with the pool.
+The columnar caches are seeded directly, so no workbook has to be parsed. Exits with status 1 if the compact mode
+does not cut the peak of the sequential read by the target factor.
+
+Usage:
+python benchmarks/bench_memory_footprint.py [n_gcms] [target_factor] [max_workers]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ensemble_cube import build_ensemble_cube, load_ensemble_cube
+from gcm_io import iter_gcm_ensemble, load_gcm_ensemble, memory_report
+from synthetic_data import FLOW_VARIABLES, SCENARIOS, WATER_BALANCE_VARIABLES, write_synthetic_ensemble
+
+VARIABLES = FLOW_VARIABLES + WATER_BALANCE_VARIABLES
+
+
+# Function to measure the peak traced memory and the time of a call
+def traced(function, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+# The former path: every GCM DataFrame is loaded (float64) before the cube is built
+def frames_then_cube(gcm_files):
+    gcm_data = load_gcm_ensemble(gcm_files, columns=['Date'] + [f'Flow {scenario}' for scenario in SCENARIOS], max_workers=1)
+    return build_ensemble_cube(gcm_data, SCENARIOS)
+
+
+# Function to work through the GCMs one by one, taking some time over each (as a caller that plots every GCM)
+def consume_slowly(gcm_files, max_workers, seconds=0.02):
+    for _ in iter_gcm_ensemble(gcm_files, columns=['Date'] + [f'Flow {scenario}' for scenario in SCENARIOS],
+                               max_workers=max_workers):
+        time.sleep(seconds)
+
+
+def main(n_gcms=50, target_factor=4.0, max_workers=4):
+    dates = pd.date_range('1984-01-01', '2100-12-31', freq='D')
+    with tempfile.TemporaryDirectory() as workdir:
+        # Placeholder workbooks with seeded columnar caches of every variable
+        gcm_files = write_synthetic_ensemble(workdir, n_gcms, VARIABLES, excel=False)
+
+        reference, former_peak, former_time = traced(frames_then_cube, gcm_files)
+        del reference
+        _, streamed_peak, streamed_time = traced(load_ensemble_cube, gcm_files, SCENARIOS, max_workers=1)
+        compact, compact_peak, compact_time = traced(load_ensemble_cube, gcm_files, SCENARIOS, max_workers=1, compact=True)
+        parallel, parallel_peak, parallel_time = traced(load_ensemble_cube, gcm_files, SCENARIOS, max_workers=max_workers,
+                                                        compact=True)
+        np.testing.assert_array_equal(parallel.values, compact.values)
+        del parallel
+        _, slow_peak, _ = traced(consume_slowly, gcm_files, 1)
+        _, slow_parallel_peak, _ = traced(consume_slowly, gcm_files, max_workers)
+
+        print(f'{n_gcms} GCMs x {len(SCENARIOS)} scenarios x {len(dates)} days')
+        print(f'frames then cube (float64): peak {former_peak / 1e6:8.1f} MB  {former_time:6.2f} s')
+        print(f'streamed cube (float64):    peak {streamed_peak / 1e6:8.1f} MB  {streamed_time:6.2f} s')
+        print(f'streamed cube (compact):    peak {compact_peak / 1e6:8.1f} MB  {compact_time:6.2f} s  '
+              f'(cube {compact.nbytes / 1e6:.1f} MB)')
+        print(f'streamed cube (compact, {max_workers} workers): peak {parallel_peak / 1e6:8.1f} MB  {parallel_time:6.2f} s')
+        print(f'slow caller, one GCM at a time: peak {slow_peak / 1e6:8.1f} MB in this process, '
+              f'{slow_parallel_peak / 1e6:.1f} MB with {max_workers} workers')
+
+        # Per-GCM footprint of the loaded DataFrames (first GCMs and the ensemble total)
+        columns = ['Date'] + [f'{variable} {scenario}' for variable in VARIABLES for scenario in SCENARIOS]
+        for compact_mode in (False, True):
+            report = memory_report(load_gcm_ensemble(gcm_files, columns=columns, calendar_columns=('Year', 'Month'),
+                                                     max_workers=1, compact=compact_mode))
+            print(f'\nall columns, compact={compact_mode}:')
+            print(pd.concat([report.head(3), report.tail(1)]).to_string())
+
+    factor = former_peak / compact_peak
+    parallel_factor = former_peak / parallel_peak
+    print(f'\npeak reduction: {factor:.1f}x, {parallel_factor:.1f}x with {max_workers} workers (target {target_factor:g}x)')
+    if factor < target_factor:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if i == 1 else int(arg) for i, arg in enumerate(sys.argv[1:4])))
@@ -0,0 +1,41 @@
+"""
+Scaling benchmark for parallel multi-GCM ingestion (gcm_io.load_gcm_ensemble) on synthetic 12- and 50-GCM ensembles.
+
+Workbooks are parsed with pd.read_excel on every run (use_cache=False) so the timings measure the CPU-bound parse.
+
+Usage:
+python benchmarks/bench_parallel_ingest.py [last_year]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gcm_io import load_gcm_ensemble
+from synthetic_data import write_synthetic_workbook
+
+
+def main(last_year=2100, ensemble_sizes=(12, 50)):
+    cpu_count = os.cpu_count() or 1
+    worker_counts = [n for n in (1, 2, 4, 8, 16) if n <= cpu_count] or [1]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = [os.path.join(workdir, f'GCM-{i:02d}.xlsx') for i in range(max(ensemble_sizes))]
+        for i, path in enumerate(paths):
+            write_synthetic_workbook(path, seed=i, end=f'{last_year}-12-31')
+
+        print(f'CPU count: {cpu_count}, record: 1984-{last_year}')
+        print(f'{"GCMs":>5} {"workers":>8} {"time (s)":>10} {"speed-up":>9}')
+        for n_gcms in ensemble_sizes:
+            serial_time = None
+            for workers in worker_counts:
+                start = time.perf_counter()
+                load_gcm_ensemble(paths[:n_gcms], columns=['Date', 'Flow SSP585'], max_workers=workers, use_cache=False)
+                elapsed = time.perf_counter() - start
+                serial_time = serial_time or elapsed
+                print(f'{n_gcms:>5} {workers:>8} {elapsed:>10.2f} {serial_time / elapsed:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2100)
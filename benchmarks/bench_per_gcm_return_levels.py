@@ -0,0 +1,40 @@
+"""
+Benchmark of the batched per-GCM return-level fit (extreme_value.ensemble_return_levels) as the ensemble grows,
+compared with fitting every GCM/scenario/period series in a Python loop.
+
+Usage:
+python benchmarks/bench_per_gcm_return_levels.py [n_gcms ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extreme_value import ensemble_return_levels, return_levels, stack_periods
+from study_periods import DAILY_PERIODS as TIME_PERIODS
+
+
+def main(ensemble_sizes=(12, 50, 100)):
+    years = np.arange(1984, 2101)
+    print(f'{"GCMs":>5} {"fit":>12} {"batched s":>10} {"loop s":>8} {"speed-up":>9}')
+    for n_gcms in ensemble_sizes:
+        annual_max = np.random.default_rng(n_gcms).gumbel(1200, 150, size=(n_gcms, 2, len(years)))
+        stacked = stack_periods(annual_max, years, TIME_PERIODS)
+        for distribution, method in (('gumbel', 'lmom'), ('gumbel', 'mle'), ('gev', 'lmom')):
+            start = time.perf_counter()
+            levels, _ = ensemble_return_levels(annual_max, years, TIME_PERIODS, distribution, method)
+            batched_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for index in np.ndindex(stacked.shape[:-1]):
+                series = stacked[index]
+                np.testing.assert_allclose(return_levels(series[~np.isnan(series)], distribution, method), levels[index], rtol=1e-6)
+            loop_time = time.perf_counter() - start
+
+            print(f'{n_gcms:>5} {distribution + "/" + method:>12} {batched_time:>10.4f} {loop_time:>8.3f} {loop_time / batched_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (12, 50, 100))
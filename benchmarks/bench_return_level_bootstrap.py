@@ -0,0 +1,53 @@
+"""
+Benchmark of the batched bootstrap for return-level confidence bands: 10k resamples x 4 periods x 2 scenarios,
+compared with a Python loop that fits one resample at a time.
+
+Usage:
+python benchmarks/bench_return_level_bootstrap.py [n_boot]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extreme_value import RETURN_PERIODS, bootstrap_return_levels, return_levels
+
+# Lengths (years) of the baseline, near, mid and far future periods
+PERIOD_LENGTHS = (31, 26, 31, 31)
+SCENARIOS = ('SSP245', 'SSP585')
+
+
+# The former approach: one fit per resample inside a Python loop
+def loop_bootstrap(x, distribution, method, n_boot, seed=0):
+    rng = np.random.default_rng(seed)
+    levels = np.empty((n_boot, len(RETURN_PERIODS)))
+    for b in range(n_boot):
+        levels[b] = return_levels(x[rng.integers(0, len(x), len(x))], distribution, method)
+    return np.percentile(levels, [2.5, 97.5], axis=0)
+
+
+def main(n_boot=10000):
+    rng = np.random.default_rng(42)
+    series = [rng.gumbel(1200, 150, n_years) for _ in SCENARIOS for n_years in PERIOD_LENGTHS]
+    loop_boot = max(n_boot // 10, 1)  # The loop is timed on fewer resamples and scaled up
+
+    print(f'{len(series)} series, {n_boot} resamples each')
+    print(f'{"fit":>12} {"batched s":>10} {"loop s (est.)":>14} {"speed-up":>9}')
+    for distribution, method in (('gumbel', 'lmom'), ('gumbel', 'mle'), ('gev', 'lmom')):
+        start = time.perf_counter()
+        for x in series:
+            bootstrap_return_levels(x, distribution, method, n_boot=n_boot, seed=0)
+        batched_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for x in series:
+            loop_bootstrap(x, distribution, method, loop_boot)
+        loop_time = (time.perf_counter() - start) * n_boot / loop_boot
+
+        print(f'{distribution + "/" + method:>12} {batched_time:>10.3f} {loop_time:>14.2f} {loop_time / batched_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,67 @@
+"""
+Rolling 30-year window changes (rolling_windows) from cumulative sums vs recomputing every window from the daily
+series with date masks, for the % change in mean monthly flow of every window from 2015 to 2100.
+
+Usage:
+python benchmarks/bench_rolling_windows.py [n_gcms] [window]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rolling_windows import rolling_monthly_change, window_starts
+
+BASELINE = (1984, 2014)
+
+
+# The direct approach: mask the daily series of every window and group it by month
+def masked_changes(flows, starts, window):
+    years = flows.index.year
+    months = flows.index.month
+    baseline = flows[(years >= BASELINE[0]) & (years <= BASELINE[1])]
+    baseline_means = baseline.groupby(baseline.index.month).mean()
+    changes = []
+    for start in starts:
+        in_window = flows[(years >= start) & (years < start + window)]
+        window_means = in_window.groupby(months[(years >= start) & (years < start + window)]).mean()
+        changes.append(((window_means - baseline_means) / baseline_means * 100).to_numpy())
+    return np.array(changes)
+
+
+def main(n_gcms=50, window=30):
+    dates = pd.date_range('1984-01-01', '2100-12-31', freq='D')
+    rng = np.random.default_rng(0)
+    flows = pd.DataFrame(rng.gamma(2.0, 60.0, (len(dates), n_gcms)), index=dates)
+    starts = window_starts(2015, 2100, window)
+
+    start = time.perf_counter()
+    reference = masked_changes(flows, starts, window)
+    masked_time = time.perf_counter() - start
+
+    # Monthly sums and counts per (GCM, year, month), as kept by GCMAggregateStore
+    start = time.perf_counter()
+    years = np.arange(1984, 2101)
+    codes = (dates.year - 1984) * 12 + dates.month - 1
+    month_sum = np.stack([np.bincount(codes, weights=flows[g].to_numpy(), minlength=len(years) * 12) for g in flows])
+    month_count = np.broadcast_to(np.bincount(codes, minlength=len(years) * 12), month_sum.shape)
+    aggregate_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, changes, _ = rolling_monthly_change(month_sum.reshape(n_gcms, len(years), 12),
+                                           month_count.reshape(n_gcms, len(years), 12), years, BASELINE,
+                                           window=window)
+    rolling_time = time.perf_counter() - start
+
+    print(f'{n_gcms} GCMs, {len(starts)} windows of {window} years ({changes.shape} window x month x GCM cube)')
+    print(f'date masks per window:      {masked_time:8.3f} s')
+    print(f'monthly aggregates (once):  {aggregate_time:8.3f} s')
+    print(f'cumulative-sum windows:     {rolling_time * 1e3:8.2f} ms  ({masked_time / rolling_time:.0f}x), '
+          f'max abs. difference {np.max(np.abs(changes - reference)):.1e} %')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
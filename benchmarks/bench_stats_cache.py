@@ -0,0 +1,78 @@
+"""
+Cost of a cached statistic (stats_cache.StatsCache): fingerprinting, first computation, in-memory and on-disk hits,
+and size-bounded eviction. Also checks that processes sharing one disk cache directory (as the batch_export and
+basin_pipeline workers do) can read, write and evict its files at the same time.
+
+Usage:
+python benchmarks/bench_stats_cache.py [n_gcms] [n_days] [n_workers]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stats_cache import StatsCache, data_fingerprint
+
+
+# Function to time a call
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+# A per-GCM statistic of daily flows: the monthly mean of every GCM over 1984-2014
+def monthly_means(flows):
+    baseline = flows.loc['1984':'2014']
+    return baseline.groupby(baseline.index.month).mean()
+
+
+# Function run in each worker: read and write statistics of a disk cache shared with the other workers
+def use_shared_cache(disk_dir, n_statistics=300):
+    # Bounded to a few dozen files, so every write also evicts files the other workers may be reading or evicting
+    cache = StatsCache(disk_dir=disk_dir, max_disk_bytes=30_000)
+    for i in range(n_statistics):
+        value = cache.get_or_compute('shared', str(i % 60), lambda: np.full(100, float(i % 60)))
+        assert value[0] == i % 60
+    return cache.info()
+
+
+def main(n_gcms=50, n_days=42735, n_workers=4):
+    dates = pd.date_range('1984-01-01', periods=n_days, freq='D')
+    flows = pd.DataFrame(np.random.default_rng(0).gamma(2.0, 60.0, (n_days, n_gcms)), index=dates,
+                         columns=[f'GCM-{i:02d}' for i in range(n_gcms)])
+
+    with tempfile.TemporaryDirectory() as disk_dir:
+        cache = StatsCache(disk_dir=disk_dir)
+        fingerprint, fingerprint_time = timed(data_fingerprint, flows)
+        _, miss_time = timed(cache.get_or_compute, 'monthly_mean', fingerprint, lambda: monthly_means(flows))
+        _, hit_time = timed(cache.get_or_compute, 'monthly_mean', fingerprint, lambda: monthly_means(flows))
+        cache.clear()
+        _, disk_time = timed(cache.get_or_compute, 'monthly_mean', fingerprint, lambda: monthly_means(flows))
+
+        print(f'{n_gcms} GCMs x {n_days} days')
+        print(f'fingerprint of the input:   {fingerprint_time * 1e3:8.2f} ms')
+        print(f'miss (computed):            {miss_time * 1e3:8.2f} ms')
+        print(f'hit (memory):               {hit_time * 1e3:8.3f} ms')
+        print(f'hit (disk):                 {disk_time * 1e3:8.2f} ms')
+        print(f'counters: {cache.info()}')
+
+    # Eviction: a cache bounded to a few monthly tables keeps only the most recently used ones
+    cache = StatsCache(max_bytes=10 * 12 * n_gcms * 8 + 10 * 2000)
+    for year in range(1984, 2014):
+        cache.get_or_compute('monthly_mean', str(year), lambda: monthly_means(flows.loc[str(year):]))
+    print(f'after 30 statistics with a {cache.max_bytes / 1e3:.0f} kB bound: {cache.info()}')
+
+    with tempfile.TemporaryDirectory() as disk_dir, ProcessPoolExecutor(n_workers) as executor:
+        infos = list(executor.map(use_shared_cache, [disk_dir] * n_workers))
+    print(f'{n_workers} processes sharing a bounded disk cache: '
+          f'{sum(info["disk_hits"] for info in infos)} disk hits, {sum(info["misses"] for info in infos)} writes, no errors')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,73 @@
+"""
+Start-up cost of the stats-only command line (flow_statistics.py). Each measurement starts a fresh interpreter:
+the import time of the command line against the plotting stack the scripts import (matplotlib, seaborn, scipy),
+then the wall time of writing the default tables (% change, average annual max per period, basic e-flow) as JSON
+for a synthetic ensemble, stats only and with --figures (which renders them with the annual-max and e-flow scripts).
+Also checks that the stats-only run imports none of the plotting stack.
+
+Usage:
+python benchmarks/bench_stats_cli.py [n_gcms] [repeats]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from synthetic_data import FLOW_VARIABLES, write_synthetic_ensemble
+
+CLI = os.path.join(REPO_DIR, 'flow_statistics.py')
+
+# Top-level packages of the plotting stack
+PLOTTING_STACK = ('matplotlib', 'seaborn', 'scipy')
+
+
+# Function to time a command in a fresh interpreter (best of `repeats`)
+def best_time(command, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       env=dict(os.environ, MPLBACKEND='Agg'))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Function to list the top-level packages a command imports (from python -X importtime)
+def imported_packages(command):
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=REPO_DIR, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return {line.rsplit('|', 1)[1].strip().split('.')[0] for line in result.stderr.splitlines() if line.startswith('import time:')}
+
+
+def main(n_gcms=13, repeats=5):
+    interpreter = best_time([sys.executable, '-c', 'pass'], repeats)
+    imports = {
+        'flow_statistics (stats only)': 'import flow_statistics',
+        'pandas': 'import pandas',
+        'matplotlib.pyplot, seaborn, scipy.stats': 'import matplotlib.pyplot, seaborn, scipy.stats',
+    }
+    print(f'fresh interpreter: {interpreter:.3f} s; import cost on top of it (best of {repeats}):')
+    for label, code in imports.items():
+        print(f'  {label:<42} {best_time([sys.executable, "-c", code], repeats) - interpreter:7.3f} s')
+
+    with tempfile.TemporaryDirectory() as workdir:
+        flow_dir = os.path.join(workdir, 'flow')
+        write_synthetic_ensemble(flow_dir, n_gcms, FLOW_VARIABLES, excel=False)
+        stats_only = [CLI, flow_dir, '--format', 'json']
+        with_figures = [CLI, flow_dir, '--format', 'json', '--output-dir', os.path.join(workdir, 'out'), '--figures']
+
+        plotting = sorted(set(PLOTTING_STACK) & imported_packages(stats_only))
+        assert not plotting, f'The stats-only run imported {plotting}'
+        stats_seconds = best_time([sys.executable] + stats_only, repeats)
+        figures_seconds = best_time([sys.executable] + with_figures, 1)
+
+    print(f'default tables of {n_gcms} synthetic GCMs as JSON, whole process:')
+    print(f'  stats only:     {stats_seconds:7.3f} s (imports none of {", ".join(PLOTTING_STACK)})')
+    print(f'  with --figures: {figures_seconds:7.3f} s ({figures_seconds / stats_seconds:.1f}x longer)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,63 @@
+"""
+Exact vs streaming flow duration curve on a long synthetic sub-daily series: time, peak memory and quantile error.
+Also checks that negative flows (artefacts or unconverted -9999 sentinels) are counted as zero flow.
+
+Usage:
+python benchmarks/bench_streaming_fdc.py [n_values] [chunk_size]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flow_duration import StreamingFDC, flow_at_exceedance, flow_duration_curve, streaming_fdc
+
+EXCEEDANCE = (0.01, 0.05, 0.10, 0.25, 0.50, 0.75, 0.90, 0.95, 0.99)
+
+
+# Function to generate a synthetic hourly flow series chunk by chunk (never materialised as a whole)
+def synthetic_chunks(n_values, chunk_size, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_values, chunk_size):
+        hours = np.arange(start, min(start + chunk_size, n_values))
+        seasonal = 500 + 400 * np.sin(2 * np.pi * hours / (24 * 365.25))
+        yield seasonal + rng.gamma(2.0, 60.0, len(hours))
+
+
+def main(n_values=10_000_000, chunk_size=1_000_000):
+    tracemalloc.start()
+    start = time.perf_counter()
+    sketch = streaming_fdc(synthetic_chunks(n_values, chunk_size))
+    streaming_time = time.perf_counter() - start
+    streaming_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    sorted_flows, _ = flow_duration_curve(np.concatenate(list(synthetic_chunks(n_values, chunk_size))))
+    exact_time = time.perf_counter() - start
+    exact_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f'{n_values} values, chunks of {chunk_size}')
+    print(f'exact:     {exact_time:7.2f} s, peak {exact_peak / 1e6:8.1f} MB')
+    print(f'streaming: {streaming_time:7.2f} s, peak {streaming_peak / 1e6:8.1f} MB '
+          f'(bin error bound {sketch.relative_error_bound:.2%})')
+    print(f'{"Q":>5} {"exact":>12} {"streaming":>12} {"rel. error":>11}')
+    for probability in EXCEEDANCE:
+        exact = flow_at_exceedance(sorted_flows, probability)
+        approx = float(sketch.flow_at_exceedance(probability))
+        print(f'{"Q" + str(round(probability * 100)):>5} {exact:>12.3f} {approx:>12.3f} {(approx - exact) / exact:>11.2e}')
+
+    # Negative flows land in the lowest bin, with the zero flows
+    sketch = StreamingFDC().update([-9999.0, -1e-9, 0.0, 5.0, 50.0])
+    assert sketch.count == 5 and sketch.counts[0] == 3
+    assert 0.0 <= float(sketch.flow_at_exceedance(0.99)) < sketch.lower
+    print('negative flows counted as zero flow')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
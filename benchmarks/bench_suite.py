@@ -0,0 +1,248 @@
+"""
+End-to-end benchmark suite: runs every analysis job of batch_export (every script and scenario, saving PNGs) on a
+synthetic ensemble and times each stage with the instrumentation timers. Stage times are summed by category: load,
+annual max / merge, monthly means, FDC / Q90-Q95, return levels / KDE, seasonal aggregation and plotting. Results are saved
+to benchmarks/results/latest.json and compared with a saved baseline; every job or stage that became slower than
+the tolerance is flagged as a regression (exit code 1).
+
+The workbooks are placeholders with a seeded columnar cache, so the timings are those of every run after the first
+(use --excel to write real workbooks, which adds the one-off parse of each workbook to the first repeat). Each
+repeat starts from the columnar caches only (saved per-GCM aggregates and cached statistics are cleared), so every
+stage does its full work; the fastest of the repeats is kept.
+
+Usage:
+python benchmarks/bench_suite.py [--gcms 13] [--repeats 3] [--jobs NAME ...] [--excel] [--save-baseline]
+                                 [--baseline PATH] [--tolerance 0.25]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import instrumentation
+from basin_pipeline import SCRIPT_INPUTS
+from batch_export import _run_job, build_jobs
+from gcm_io import CACHE_DIR_NAME
+from stats_cache import default_cache
+from synthetic_data import FLOW_VARIABLES, WATER_BALANCE_VARIABLES, write_synthetic_ensemble
+
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+# Category of every timed stage (by stage name; annual_max includes merging the GCMs, fdc the Q90/Q95 flows and the
+# low-flow indices, return_levels the KDE of the annual maxima and trends the Mann-Kendall tests); the self time of
+# each stage is counted in its category
+STAGE_CATEGORIES = {
+    'load': ['read_gcm_workbook', 'read_excel', 'parse_dates', 'write_cache', 'load_gcm_ensemble', 'load_ensemble_cube',
+             'build_ensemble_cube', 'load_all_gcm_data', 'load_gcm_data', 'load_gcm_data_all_scenarios',
+             'load_and_process_data', 'load_monthly_table', 'GCMAggregateStore.update'],
+    'annual_max': ['calculate_annual_max', 'combine_annual_max', 'EnsembleCube.annual_max', 'calculate_ensemble_stats',
+                   'calculate_percentage_change_table', 'calculate_average_by_periods', 'split_by_periods',
+                   'GCMAggregateStore.yearly_arrays'],
+    'monthly_means': ['GCMAggregates.from_frame', 'GCMAggregateStore.gcm_monthly_means', 'GCMAggregateStore.monthly_mean_table',
+                      'calculate_ensemble_mean', 'calculate_gcm_percentage_changes', 'smooth_monthly',
+                      'calculate_rolling_changes', 'rolling_monthly_change', 'rolling_annual_max_change'],
+    'fdc': ['calculate_period_fdcs', 'flow_duration_curve', 'downsample_fdc', 'calculate_basic_eflow',
+            'annual_flow_indices', 'low_flow_table', 'calculate_low_flow_indices'],
+    'return_levels': ['calculate_design_floods', 'calculate_per_gcm_return_levels', 'bootstrap_return_levels',
+                      'ensemble_return_levels', 'calculate_pdf_densities', 'gaussian_kde_batch'],
+    'seasonal': ['load_and_aggregate_gcm_data_seasonal', 'calculate_all_periods_seasonal', 'load_seasonal_means',
+                 'compute_gcm_seasonal_means'],
+    'trends': ['mann_kendall', 'calculate_trends', 'calculate_seasonal_trends'],
+}
+CATEGORY_OF_STAGE = {stage: category for category, stages in STAGE_CATEGORIES.items() for stage in stages}
+CATEGORIES = list(STAGE_CATEGORIES) + ['plotting', 'other']
+
+# Settings that must match for a comparison with the baseline to be meaningful
+COMPARED_SETTINGS = ('gcms', 'excel', 'repeats')
+
+
+# Function to find the category of a stage (drawing and saving figures count as plotting)
+def stage_category(name):
+    if name in CATEGORY_OF_STAGE:
+        return CATEGORY_OF_STAGE[name]
+    if name.startswith(('plot', 'fit_gumbel_and_plot', 'show_figure', 'savefig')):
+        return 'plotting'
+    return 'other'
+
+
+# Function to clear everything a previous repeat left behind except the columnar caches of the workbooks
+def reset_caches(workdir):
+    default_cache.clear()
+    for path in glob.glob(os.path.join(workdir, '*', CACHE_DIR_NAME, '*', 'aggregates-*.npz')):
+        os.remove(path)
+
+
+# Function to run one job once and read its stage timings from the instrumentation report
+def run_once(name, job, inputs, workdir):
+    script, function, kwargs = job
+    variable, kind = SCRIPT_INPUTS[script]
+    # The scripts print their results; only the timings are of interest here
+    with contextlib.redirect_stdout(io.StringIO()):
+        entry = _run_job(name, script, function, kwargs, os.path.join(workdir, 'figures'), ('png',), REPO_DIR,
+                         overrides={variable: inputs[kind]})
+    if entry['status'] != 'ok':
+        return entry, []
+    with open(entry['profile']) as file:
+        return entry, json.load(file)['stages']
+
+
+# Function to time every job on a synthetic ensemble
+def run_suite(jobs, n_gcms=13, repeats=3, excel=False):
+    """
+    Runs every job `repeats` times on a synthetic ensemble and keeps the fastest time of each job and stage.
+
+    Args:
+    jobs (dict): Job name -> (script, function, keyword arguments), e.g. from batch_export.build_jobs.
+    n_gcms (int): Number of synthetic GCMs.
+    repeats (int): Number of runs of every job.
+    excel (bool): Write real workbooks instead of placeholders with a seeded cache.
+
+    Returns:
+    dict: The settings and, per job, its status, total seconds, seconds per stage path and per category.
+    """
+    results = {'settings': {'gcms': n_gcms, 'repeats': repeats, 'excel': excel, 'python': platform.python_version(),
+                            'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(),
+                            'cpu_count': os.cpu_count()},
+               'jobs': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = {'flow': write_synthetic_ensemble(os.path.join(workdir, 'flow'), n_gcms, FLOW_VARIABLES, excel=excel),
+                  'water_balance': write_synthetic_ensemble(os.path.join(workdir, 'water_balance'), n_gcms,
+                                                            WATER_BALANCE_VARIABLES, excel=excel)}
+        instrumentation.enable(os.path.join(workdir, 'profile'))
+        try:
+            for name, job in jobs.items():
+                result = {'status': 'ok', 'seconds': float('inf'), 'stages': {}, 'categories': {}}
+                for _ in range(repeats):
+                    reset_caches(workdir)
+                    entry, stages = run_once(name, job, inputs, workdir)
+                    if entry['status'] != 'ok':
+                        result = {'status': 'failed', 'error': entry['error']}
+                        break
+                    result['seconds'] = min(result['seconds'], entry['seconds'])
+                    for row in stages:
+                        result['stages'][row['stage']] = min(result['stages'].get(row['stage'], float('inf')),
+                                                             row['total_seconds'])
+                    if entry['seconds'] == result['seconds']:
+                        categories = dict.fromkeys(CATEGORIES, 0.0)
+                        for row in stages:
+                            categories[stage_category(row['name'])] += row['self_seconds']
+                        result['categories'] = categories
+                results['jobs'][name] = result
+        finally:
+            instrumentation.disable()
+    return results
+
+
+# Function to list the jobs and stages that got slower than the baseline
+def find_regressions(results, baseline, tolerance=0.25, min_seconds=0.01):
+    """
+    Compares the results with a baseline. A job or stage is a regression when it is more than `tolerance` slower
+    and at least min_seconds slower (so timer noise on tiny stages is not flagged); a job that fails is one too.
+
+    Args:
+    results (dict): Results of run_suite.
+    baseline (dict): Results of an earlier run_suite.
+    tolerance (float): Allowed relative slow-down (0.25 = 25%).
+    min_seconds (float): Smallest absolute slow-down that counts.
+
+    Returns:
+    list of dict: One entry per regression with 'job', 'stage' (None for the whole job), 'baseline' and 'current' seconds.
+    """
+    regressions = []
+    for name, result in results['jobs'].items():
+        previous = baseline['jobs'].get(name)
+        if previous is None or previous['status'] != 'ok':
+            continue
+        if result['status'] != 'ok':
+            regressions.append({'job': name, 'stage': None, 'baseline': previous['seconds'], 'current': None})
+            continue
+        timings = [(None, previous['seconds'], result['seconds'])]
+        timings += [(stage, seconds, result['stages'][stage]) for stage, seconds in previous['stages'].items()
+                    if stage in result['stages']]
+        for stage, before, now in timings:
+            if now > before * (1 + tolerance) and now - before >= min_seconds:
+                regressions.append({'job': name, 'stage': stage, 'baseline': before, 'current': now})
+    return regressions
+
+
+# Function to print the seconds of every job by category
+def print_results(results):
+    columns = [category for category in CATEGORIES if any(result.get('categories', {}).get(category)
+                                                          for result in results['jobs'].values())]
+    width = max(len(name) for name in results['jobs'])
+    print(f"{'job':<{width}} {'total':>7} " + ' '.join(f'{category:>13}' for category in columns))
+    for name, result in results['jobs'].items():
+        if result['status'] != 'ok':
+            print(f"{name:<{width}} failed\n{result['error']}")
+            continue
+        print(f"{name:<{width}} {result['seconds']:7.3f} "
+              + ' '.join(f"{result['categories'].get(category, 0.0):13.3f}" for category in columns))
+
+
+# Function to write results as JSON
+def save_results(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every stage of every analysis on a synthetic ensemble.')
+    parser.add_argument('--gcms', type=int, default=13)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--jobs', nargs='+', default=None, help='Names of the jobs to run (default: all)')
+    parser.add_argument('--excel', action='store_true', help='Write real .xlsx workbooks (slow)')
+    parser.add_argument('--baseline', default=os.path.join(RESULTS_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slow-down (default 0.25)')
+    args = parser.parse_args()
+
+    jobs = build_jobs()
+    if args.jobs:
+        unknown = set(args.jobs) - set(jobs)
+        if unknown:
+            parser.error(f"Unknown jobs: {', '.join(sorted(unknown))} (available: {', '.join(jobs)})")
+        jobs = {name: jobs[name] for name in args.jobs}
+
+    results = run_suite(jobs, args.gcms, args.repeats, args.excel)
+    print(f"{args.gcms} synthetic GCMs, fastest of {args.repeats} repeat(s), seconds:")
+    print_results(results)
+    save_results(results, os.path.join(RESULTS_DIR, 'latest.json'))
+    failed = any(result['status'] != 'ok' for result in results['jobs'].values())
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f'baseline saved to {args.baseline}')
+        return 1 if failed else 0
+    if not os.path.exists(args.baseline):
+        print(f'no baseline at {args.baseline} (save one with --save-baseline)')
+        return 1 if failed else 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    changed = [key for key in COMPARED_SETTINGS if baseline['settings'].get(key) != results['settings'][key]]
+    if changed:
+        print(f"baseline recorded with other settings ({', '.join(changed)}); not compared")
+        return 1 if failed else 0
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        stage = regression['stage'] or '(whole job)'
+        current = 'failed' if regression['current'] is None else f"{regression['current']:.3f} s"
+        print(f"REGRESSION {regression['job']}: {stage}: {regression['baseline']:.3f} s -> {current}")
+    print(f'{len(regressions)} regression(s) against {args.baseline} (tolerance {args.tolerance:.0%})')
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+"""
+Mann-Kendall test and Sen's slope of every GCM, scenario and series (12 monthly means and the annual max) of a
+synthetic ensemble, 2015-2100: the batched pairwise kernel of trend.mann_kendall against a loop over the series
+that tests them one at a time (the textbook O(n^2) loop of per-series implementations). Also times the O(n log n)
+path on one daily record, whose pairwise differences would not fit in memory.
+
+Usage:
+python benchmarks/bench_trend.py [n_gcms] [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy.stats import norm
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gcm_aggregates import GCMAggregateStore
+from synthetic_data import FLOW_VARIABLES, SCENARIOS, synthetic_gcm_frame, write_synthetic_ensemble
+from trend import mann_kendall
+
+
+# Function to test one series at a time (missing values dropped), the way per-series implementations do
+def loop_mann_kendall(x):
+    results = np.full(x.shape[:-1] + (4,), np.nan)
+    for index in np.ndindex(x.shape[:-1]):
+        valid = ~np.isnan(x[index])
+        values, time_steps = x[index][valid], np.flatnonzero(valid)
+        n = len(values)
+        s, slopes = 0.0, []
+        for k in range(n - 1):
+            differences = values[k + 1:] - values[k]
+            s += np.sign(differences).sum()
+            slopes.append(differences / (time_steps[k + 1:] - time_steps[k]))
+        _, counts = np.unique(values, return_counts=True)
+        variance = (n * (n - 1) * (2 * n + 5) - np.sum(counts * (counts - 1) * (2 * counts + 5))) / 18
+        z = (s - np.sign(s)) / np.sqrt(variance)
+        results[index] = s, z, 2 * norm.sf(abs(z)), np.median(np.concatenate(slopes))
+    return np.moveaxis(results, -1, 0)
+
+
+# Function to time a call (best of `repeats`)
+def best_time(function, *args, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(n_gcms=50, repeats=3):
+    with tempfile.TemporaryDirectory() as workdir:
+        gcm_files = write_synthetic_ensemble(workdir, n_gcms, FLOW_VARIABLES, excel=False)
+        columns = [f'Flow {scenario}' for scenario in SCENARIOS]
+        store = GCMAggregateStore(columns, {'trend': (2015, 2100)})
+        store.update(gcm_files)
+        series = []
+        for column in columns:
+            years, month_sum, month_count, annual_max = store.yearly_arrays(column)
+            rows = (years >= 2015) & (years <= 2100)
+            monthly_means = np.moveaxis(month_sum / month_count, 1, -1)[:, :, rows]
+            series.append(np.concatenate((monthly_means, annual_max[:, None, rows]), axis=1))
+    series = np.stack(series, axis=1)  # (gcm, scenario, 13 series, year)
+
+    batched_seconds, batched = best_time(mann_kendall, series, repeats=repeats)
+    loop_seconds, looped = best_time(loop_mann_kendall, series, repeats=1)
+    for name, a, b in zip(('S', 'Z', 'p-value', "Sen's slope"), batched, looped):
+        np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-12, err_msg=name)
+
+    n_series = int(np.prod(series.shape[:-1]))
+    print(f'{n_gcms} GCMs x {len(SCENARIOS)} scenarios x 13 series = {n_series} series of {series.shape[-1]} years')
+    print(f'per-series loop:  {loop_seconds:8.3f} s')
+    print(f'batched pairwise: {batched_seconds:8.3f} s ({loop_seconds / batched_seconds:.0f}x faster, results identical)')
+
+    daily = synthetic_gcm_frame(0)['Flow SSP585'].to_numpy()
+    long_seconds, (s, z, p_value, slope) = best_time(mann_kendall, daily, repeats=1)
+    print(f'one daily record of {len(daily)} days (O(n log n) path): {long_seconds:.3f} s, '
+          f'Z = {float(z):.2f}, Sen\'s slope = {float(slope) * 3652.5:.2f} m3/s per decade '
+          f'({len(daily) * (len(daily) - 1) // 2 / 1e6:.0f} million pairs never materialised)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
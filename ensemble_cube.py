@@ -0,0 +1,151 @@
+import ntpath
+
+import numpy as np
+
+from gcm_io import iter_gcm_ensemble
+from instrumentation import timed
+from time_index import TimeIndex
+
+
+class EnsembleCube:
+    """
+    Daily values of every GCM and scenario held in one contiguous array on a shared date axis.
+
+    The array has shape (variable, gcm, scenario, time); cube['Flow'] returns the [gcm, scenario, time]
+    view of one variable without copying.
+    """
+
+    def __init__(self, values, dates, gcms, scenarios, variables, time_index=None):
+        self.values = values
+        self.dates = dates
+        self.gcms = list(gcms)
+        self.scenarios = list(scenarios)
+        self.variables = list(variables)
+        self._time_index = time_index
+
+    # The time index (year offsets, month codes) is built on first use and then reused
+    @property
+    def time_index(self):
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.dates)
+        return self._time_index
+
+    def __getitem__(self, variable):
+        return self.values[self.variables.index(variable)]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.dates.nbytes
+
+    # Function to get the [gcm, time] view of one variable and scenario
+    def series(self, variable, scenario):
+        return self[variable][:, self.scenarios.index(scenario)]
+
+    # Function to restrict the cube to a range of years (a zero-copy slice of the time axis)
+    def period(self, start_year, end_year):
+        """
+        Returns a cube restricted to start_year..end_year (inclusive) that shares memory with this one.
+
+        Args:
+        start_year (int): First year of the period.
+        end_year (int): Last year of the period.
+
+        Returns:
+        EnsembleCube: View of the period.
+        """
+        rows = self.time_index.year_slice(start_year, end_year)
+        return EnsembleCube(self.values[..., rows], self.dates[rows], self.gcms, self.scenarios, self.variables)
+
+    # Function to average a variable across the GCM axis
+    def ensemble_mean(self, variable, scenario=None):
+        values = self[variable] if scenario is None else self.series(variable, scenario)
+        return values.mean(axis=0)
+
+    # Function to take percentiles of a variable across the GCM axis
+    def ensemble_percentile(self, variable, q, scenario=None):
+        values = self[variable] if scenario is None else self.series(variable, scenario)
+        return np.percentile(values, q, axis=0)
+
+    # Function to reduce the daily values of a variable to annual maxima
+    @timed()
+    def annual_max(self, variable):
+        """
+        Computes the annual maximum of a variable for every GCM and scenario with one reduceat over the time axis.
+
+        Args:
+        variable (str): Variable to reduce (e.g., 'Flow').
+
+        Returns:
+        (np.ndarray, np.ndarray): Years, and annual maxima with shape (gcm, scenario, year).
+        """
+        years, starts = self.time_index.annual_starts()
+        # fmax ignores missing days, like groupby('Year').max()
+        return years, np.fmax.reduceat(self[variable], starts, axis=-1)
+
+
+# Function to build the cube from DataFrames that have already been loaded
+@timed()
+def build_ensemble_cube(gcm_data, scenarios, variables=('Flow',), dtype=np.float64):
+    """
+    Stacks per-GCM DataFrames into an EnsembleCube.
+
+    Args:
+    gcm_data (dict): GCM name -> DataFrame with 'Date' and '<variable> <scenario>' columns.
+    scenarios (list of str): Scenarios to include (e.g., ['SSP245', 'SSP585']).
+    variables (tuple of str): Variable prefixes to include (e.g., ('Flow',) or ('PRECIPmm', 'Etmm', 'SWmm')).
+    dtype (np.dtype): float64 (default) or float32 to halve the memory footprint.
+
+    Returns:
+    EnsembleCube: The stacked ensemble.
+    """
+    return _fill_cube(iter(gcm_data.values()), list(gcm_data.keys()), scenarios, variables, dtype)
+
+
+# Function to copy GCM DataFrames into a new cube one at a time (each frame can be freed once copied)
+def _fill_cube(frames, gcms, scenarios, variables, dtype):
+    values = dates = None
+    for g, df in enumerate(frames):
+        gcm_dates = df['Date'].to_numpy(dtype='datetime64[ns]')
+        if dates is None:
+            # The first GCM sets the shared date axis
+            dates = gcm_dates
+            values = np.empty((len(variables), len(gcms), len(scenarios), len(dates)), dtype=dtype)
+        elif not np.array_equal(gcm_dates, dates):
+            # Align GCMs with a different calendar on the shared date axis (missing days become NaN)
+            df = df.set_index('Date').reindex(dates).reset_index()
+        for v, variable in enumerate(variables):
+            for s, scenario in enumerate(scenarios):
+                values[v, g, s] = df[f'{variable} {scenario}'].to_numpy(dtype=dtype)
+
+    return EnsembleCube(values, dates, gcms, scenarios, variables)
+
+
+# Function to load GCM workbooks straight into a cube
+@timed()
+def load_ensemble_cube(file_paths, scenarios, variables=('Flow',), dtype=np.float64, max_workers=None, compact=False):
+    """
+    Loads the GCM workbooks (in parallel) and stacks them into an EnsembleCube. Each GCM is copied into the cube
+    as soon as it is read, so the per-GCM DataFrames are never all held in memory at once.
+
+    Args:
+    file_paths (dict or list of str): GCM name -> workbook path, or a list of paths (named after the workbook file).
+    scenarios (list of str): Scenarios to include.
+    variables (tuple of str): Variable prefixes to include.
+    dtype (np.dtype): Storage dtype of the cube.
+    max_workers (int, optional): Number of worker processes used to read the workbooks.
+    compact (bool): Read the workbooks as float32 and store the cube as float32 (overrides dtype).
+
+    Returns:
+    EnsembleCube: The stacked ensemble.
+    """
+    if compact:
+        dtype = np.float32
+    if not isinstance(file_paths, dict):
+        # ntpath splits on both '/' and '\\', so Windows paths are named correctly on every platform
+        names = [ntpath.splitext(ntpath.basename(path))[0] for path in file_paths]
+        if len(set(names)) < len(names):
+            names = [str(i) for i in range(len(file_paths))]
+        file_paths = dict(zip(names, file_paths))
+    columns = ['Date'] + [f'{variable} {scenario}' for variable in variables for scenario in scenarios]
+    frames = (df for _, df in iter_gcm_ensemble(file_paths, columns=columns, max_workers=max_workers, compact=compact))
+    return _fill_cube(frames, list(file_paths.keys()), scenarios, variables, dtype)
@@ -0,0 +1,243 @@
+import numpy as np
+from scipy import stats
+from scipy.special import gamma
+
+from instrumentation import timed
+from time_index import TimeIndex
+
+# Return periods (years) reported for design floods
+RETURN_PERIODS = (2, 5, 10, 25, 50, 100)
+
+# Euler-Mascheroni constant (mean of the standard Gumbel distribution)
+EULER_GAMMA = 0.5772156649015329
+
+
+# Function to compute the first three sample L-moments along the last axis
+def sample_lmoments(x):
+    """
+    Computes the unbiased sample L-moments (Hosking, 1990) of every series along the last axis.
+
+    Series of different lengths can be stacked by padding them with NaN.
+
+    Args:
+    x (np.ndarray): Annual maxima with shape (..., n_years).
+
+    Returns:
+    (np.ndarray, np.ndarray, np.ndarray): l1, l2 and l3, each with shape (...).
+    """
+    x = np.sort(np.asarray(x, dtype=np.float64), axis=-1)  # NaN padding is sorted to the end
+    n = np.sum(~np.isnan(x), axis=-1, keepdims=True)
+    j = np.arange(x.shape[-1])
+    valid = j < n
+    values = np.where(valid, x, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w1 = np.where(valid, j / (n - 1), 0.0)
+        w2 = np.where(valid, j * (j - 1) / ((n - 1) * (n - 2)), 0.0)
+        b0 = values.sum(axis=-1) / n[..., 0]
+        b1 = (w1 * values).sum(axis=-1) / n[..., 0]
+        b2 = (w2 * values).sum(axis=-1) / n[..., 0]
+
+    return b0, 2 * b1 - b0, 6 * b2 - 6 * b1 + b0
+
+
+# Function to fit the Gumbel distribution by L-moments
+def fit_gumbel_lmom(x):
+    l1, l2, _ = sample_lmoments(x)
+    alpha = l2 / np.log(2)
+    return l1 - EULER_GAMMA * alpha, alpha
+
+
+# Function to fit the Gumbel distribution by maximum likelihood (vectorized Newton iterations)
+def fit_gumbel_mle(x, n_iter=50, tol=1e-10):
+    """
+    Fits the Gumbel distribution by maximum likelihood for every series along the last axis.
+
+    Args:
+    x (np.ndarray): Annual maxima with shape (..., n_years); NaN entries are ignored.
+    n_iter (int): Maximum number of Newton iterations.
+    tol (float): Relative convergence tolerance on the scale parameter.
+
+    Returns:
+    (np.ndarray, np.ndarray): Location (xi) and scale (alpha), each with shape (...).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    valid = ~np.isnan(x)
+    n = valid.sum(axis=-1)
+    mean = np.nansum(x, axis=-1) / n
+    shift = np.nanmin(x, axis=-1, keepdims=True)  # Keeps exp() from overflowing
+    z = np.where(valid, x - shift, 0.0)
+
+    _, alpha = fit_gumbel_lmom(x)  # L-moment estimate as the starting point
+    alpha = np.array(alpha, dtype=np.float64)
+    for _ in range(n_iter):
+        w = np.where(valid, np.exp(-z / alpha[..., None]), 0.0)
+        sw = w.sum(axis=-1)
+        m1 = (w * z).sum(axis=-1) / sw
+        m2 = (w * z * z).sum(axis=-1) / sw
+        g = alpha - (mean - shift[..., 0]) + m1
+        dg = 1 + (m2 - m1 * m1) / alpha ** 2
+        step = g / dg
+        alpha = alpha - step
+        if np.all(np.abs(step) <= tol * np.abs(alpha)):
+            break
+
+    w = np.where(valid, np.exp(-z / alpha[..., None]), 0.0)
+    xi = shift[..., 0] - alpha * np.log(w.sum(axis=-1) / n)
+    return xi, alpha
+
+
+# Function to fit the GEV distribution by L-moments (Hosking's rational approximation for the shape)
+def fit_gev_lmom(x):
+    """
+    Fits the GEV distribution by L-moments for every series along the last axis.
+
+    The shape parameter k follows Hosking's sign convention (k > 0: bounded upper tail), which is also
+    the convention of scipy.stats.genextreme's c.
+
+    Args:
+    x (np.ndarray): Annual maxima with shape (..., n_years).
+
+    Returns:
+    (np.ndarray, np.ndarray, np.ndarray): Location (xi), scale (alpha) and shape (k).
+    """
+    l1, l2, l3 = sample_lmoments(x)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t3 = l3 / l2
+        c = 2 / (3 + t3) - np.log(2) / np.log(3)
+        k = 7.8590 * c + 2.9554 * c ** 2
+        g = gamma(1 + k)
+        alpha = l2 * k / ((1 - 2 ** -k) * g)
+        xi = l1 - alpha * (1 - g) / k
+    return xi, alpha, k
+
+
+# Function to fit the GEV distribution by maximum likelihood (one series at a time)
+def fit_gev_mle(x):
+    x = np.asarray(x, dtype=np.float64)
+    x = x[~np.isnan(x)]
+    xi0, alpha0, k0 = fit_gev_lmom(x)
+    k, xi, alpha = stats.genextreme.fit(x, float(k0), loc=float(xi0), scale=float(alpha0))
+    return xi, alpha, k
+
+
+# Function to evaluate Gumbel quantiles for the given return periods
+def gumbel_quantile(xi, alpha, return_periods=RETURN_PERIODS):
+    y = -np.log(-np.log(1 - 1 / np.asarray(return_periods, dtype=np.float64)))  # Gumbel reduced variate
+    return np.asarray(xi)[..., None] + np.asarray(alpha)[..., None] * y
+
+
+# Function to evaluate GEV quantiles for the given return periods
+def gev_quantile(xi, alpha, k, return_periods=RETURN_PERIODS):
+    y = -np.log(1 - 1 / np.asarray(return_periods, dtype=np.float64))
+    xi, alpha, k = (np.asarray(p)[..., None] for p in (xi, alpha, k))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(np.abs(k) < 1e-8, xi - alpha * np.log(y), xi + alpha / k * (1 - y ** k))
+
+
+# Function to fit a distribution and return the flows for the given return periods
+def return_levels(x, distribution='gumbel', method='lmom', return_periods=RETURN_PERIODS):
+    """
+    Fits a Gumbel or GEV distribution to every series along the last axis and evaluates its return levels.
+
+    Args:
+    x (np.ndarray): Annual maxima with shape (..., n_years); shorter series can be padded with NaN.
+    distribution (str): 'gumbel' or 'gev'.
+    method (str): 'lmom' (L-moments) or 'mle' (maximum likelihood; GEV MLE is fitted series by series).
+    return_periods (sequence of float): Return periods in years.
+
+    Returns:
+    np.ndarray: Return levels with shape (..., len(return_periods)).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if distribution == 'gumbel':
+        xi, alpha = fit_gumbel_lmom(x) if method == 'lmom' else fit_gumbel_mle(x)
+        return gumbel_quantile(xi, alpha, return_periods)
+    if distribution == 'gev':
+        if method == 'lmom':
+            return gev_quantile(*fit_gev_lmom(x), return_periods)
+        levels = np.empty(x.shape[:-1] + (len(return_periods),))
+        for index in np.ndindex(x.shape[:-1]):
+            levels[index] = gev_quantile(*fit_gev_mle(x[index]), return_periods)
+        return levels
+    raise ValueError(f"Unknown distribution '{distribution}' (expected 'gumbel' or 'gev')")
+
+
+# Function to compute bootstrap confidence bands of the return levels in one batched pass
+@timed()
+def bootstrap_return_levels(x, distribution='gumbel', method='lmom', return_periods=RETURN_PERIODS,
+                            n_boot=1000, ci=0.95, seed=None):
+    """
+    Computes return levels with percentile-bootstrap confidence bands.
+
+    All resamples are drawn as one (n_boot x n_years) index array and fitted together, so there is no
+    Python loop over the resamples.
+
+    Args:
+    x (np.ndarray): Annual maxima of one series (NaN entries are dropped).
+    distribution (str): 'gumbel' or 'gev'.
+    method (str): 'lmom' or 'mle' ('mle' is only batched for 'gumbel').
+    return_periods (sequence of float): Return periods in years.
+    n_boot (int): Number of bootstrap resamples.
+    ci (float): Width of the confidence band (0.95 gives the 2.5th-97.5th percentiles).
+    seed (int, optional): Seed of the random generator.
+
+    Returns:
+    (np.ndarray, np.ndarray, np.ndarray): Estimate, lower and upper bounds, one value per return period.
+    """
+    if distribution == 'gev' and method == 'mle':
+        raise ValueError("Bootstrap bands for GEV are computed with method='lmom'")
+    x = np.asarray(x, dtype=np.float64)
+    x = x[~np.isnan(x)]
+    rng = np.random.default_rng(seed)
+
+    samples = x[rng.integers(0, len(x), size=(n_boot, len(x)))]
+    levels = return_levels(samples, distribution, method, return_periods)  # (n_boot, n_return_periods)
+    lower, upper = np.nanpercentile(levels, [50 * (1 - ci), 50 * (1 + ci)], axis=0)
+    return return_levels(x, distribution, method, return_periods), lower, upper
+
+
+# Function to stack the annual maxima of several periods along a new axis (NaN-padded to a common length)
+def stack_periods(annual_max, years, periods):
+    """
+    Splits annual maxima by period and stacks the periods along a new axis.
+
+    Args:
+    annual_max (np.ndarray): Annual maxima with shape (..., year), e.g. (gcm, scenario, year).
+    years (np.ndarray): Year of each entry along the last axis (ascending).
+    periods (dict): Period name -> (start_year, end_year), inclusive; periods may overlap.
+
+    Returns:
+    np.ndarray: Shape (..., period, max_period_length), padded with NaN.
+    """
+    year_index = TimeIndex.from_years(years)
+    slices = [year_index.year_slice(start_year, end_year) for start_year, end_year in periods.values()]
+    length = max(rows.stop - rows.start for rows in slices)
+    stacked = np.full(annual_max.shape[:-1] + (len(slices), length), np.nan)
+    for p, rows in enumerate(slices):
+        stacked[..., p, :rows.stop - rows.start] = annual_max[..., rows]
+    return stacked
+
+
+# Function to fit return levels for every GCM, scenario and period at once and summarise the spread across GCMs
+@timed()
+def ensemble_return_levels(annual_max, years, periods, distribution='gumbel', method='lmom',
+                           return_periods=RETURN_PERIODS, percentiles=(2.5, 50, 97.5)):
+    """
+    Fits return levels for every GCM, scenario and period as one stacked array operation.
+
+    Args:
+    annual_max (np.ndarray): Annual maxima with shape (gcm, scenario, year).
+    years (np.ndarray): Year of each entry along the last axis.
+    periods (dict): Period name -> (start_year, end_year).
+    distribution (str): 'gumbel' or 'gev'.
+    method (str): 'lmom' or 'mle'.
+    return_periods (sequence of float): Return periods in years.
+    percentiles (sequence of float): Percentiles of the return levels across GCMs.
+
+    Returns:
+    (np.ndarray, np.ndarray): Return levels with shape (gcm, scenario, period, return period), and their
+    percentiles across GCMs with shape (percentile, scenario, period, return period).
+    """
+    levels = return_levels(stack_periods(annual_max, years, periods), distribution, method, return_periods)
+    return levels, np.nanpercentile(levels, percentiles, axis=0)
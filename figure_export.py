@@ -0,0 +1,134 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+
+import matplotlib.pyplot as plt
+
+from instrumentation import timed, timer
+
+# Figure titles used for each scenario
+SCENARIO_TITLES = {'SSP245': 'Moderate Scenario', 'SSP585': 'Extreme Scenario'}
+
+# Settings and records of the active batch export (None: figures are shown interactively)
+_export = None
+
+# Figures kept for reuse during a batch export, one per layout
+_figures = {}
+
+
+# Function to get the figure title of a scenario ('SSP245' or a column name such as 'Flow SSP245')
+def scenario_title(scenario):
+    return SCENARIO_TITLES[scenario.split()[-1]]
+
+
+# Function to turn a figure name into a file name
+def _slug(name):
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+# Function to get the figure kept for a layout, cleared and made current (created on first use)
+def _reusable_figure(layout, figsize, dpi):
+    fig = _figures.get(layout)
+    if fig is None or not plt.fignum_exists(fig.number):
+        fig = _figures[layout] = plt.figure(figsize=figsize, dpi=dpi)
+    else:
+        fig.clf()
+        # clf() keeps the subplot parameters of the previous plot, so restore the defaults
+        fig.subplots_adjust(**{side: plt.rcParams[f'figure.subplot.{side}']
+                               for side in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')})
+        plt.figure(fig.number)
+    _export['started'] = time.perf_counter()
+    return fig
+
+
+# Function to start a single-axes figure (replaces plt.figure)
+def new_figure(figsize, dpi=None):
+    """
+    Starts a new figure. During a batch export the figure of the same layout is cleared and reused.
+
+    Args:
+    figsize (tuple): Figure size in inches.
+    dpi (int, optional): Figure resolution (None uses the matplotlib default).
+
+    Returns:
+    matplotlib.figure.Figure: The current figure.
+    """
+    if _export is None:
+        return plt.figure(figsize=figsize, dpi=dpi)
+    return _reusable_figure(('figure', tuple(figsize), dpi), figsize, dpi)
+
+
+# Function to start a figure with a grid of axes (replaces plt.subplots)
+def new_subplots(nrows, ncols, figsize, dpi=None, **kwargs):
+    """
+    Starts a new figure with a grid of axes. During a batch export the figure of the same layout is cleared and reused.
+
+    Args:
+    nrows (int): Number of rows of axes.
+    ncols (int): Number of columns of axes.
+    figsize (tuple): Figure size in inches.
+    dpi (int, optional): Figure resolution (None uses the matplotlib default).
+    kwargs: Further arguments of plt.subplots (e.g. sharey).
+
+    Returns:
+    (matplotlib.figure.Figure, np.ndarray): The figure and its axes.
+    """
+    if _export is None:
+        return plt.subplots(nrows, ncols, figsize=figsize, dpi=dpi, **kwargs)
+    fig = _reusable_figure(('subplots', nrows, ncols, tuple(figsize), dpi, tuple(sorted(kwargs.items()))), figsize, dpi)
+    return fig, fig.subplots(nrows, ncols, **kwargs)
+
+
+# Function to finish the current figure (replaces plt.show)
+@timed()
+def show_figure(name):
+    """
+    Shows the current figure, or during a batch export saves it in every requested format and records its timings.
+
+    Args:
+    name (str): Name of the figure, used for its file names (unique within one export).
+    """
+    if _export is None:
+        plt.show()
+        return
+
+    fig = plt.gcf()
+    render_seconds = time.perf_counter() - _export['started']
+    stem = _slug(name)
+    _export['names'][stem] = _export['names'].get(stem, 0) + 1
+    if _export['names'][stem] > 1:
+        stem = f"{stem}_{_export['names'][stem]}"
+
+    record = {'figure': stem, 'render_seconds': render_seconds, 'files': []}
+    for fmt in _export['formats']:
+        path = os.path.join(_export['output_dir'], f'{stem}.{fmt}')
+        start = time.perf_counter()
+        with timer(f'savefig {fmt}'):
+            fig.savefig(path, format=fmt)
+        record['files'].append({'format': fmt, 'path': path, 'save_seconds': time.perf_counter() - start,
+                                'bytes': os.path.getsize(path)})
+    _export['records'].append(record)
+
+
+# Context manager that saves figures to files instead of showing them
+@contextmanager
+def export_mode(output_dir, formats=('png',)):
+    """
+    Saves every figure finished with show_figure inside the block to output_dir.
+
+    Args:
+    output_dir (str): Directory for the figure files (created if needed).
+    formats (tuple of str): File formats, e.g. ('png', 'pdf', 'svg').
+
+    Yields:
+    list of dict: One record per saved figure, with its render and save timings and file sizes.
+    """
+    global _export
+    os.makedirs(output_dir, exist_ok=True)
+    previous = _export
+    _export = {'output_dir': output_dir, 'formats': tuple(formats), 'records': [], 'names': {}, 'started': time.perf_counter()}
+    try:
+        yield _export['records']
+    finally:
+        _export = previous
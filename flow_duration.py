@@ -0,0 +1,219 @@
+import numpy as np
+
+from instrumentation import timed
+
+
+# Function to compute an exact flow duration curve (the series is sorted once)
+@timed()
+def flow_duration_curve(flows):
+    """
+    Computes the flow duration curve of a flow series.
+
+    Args:
+    flows (np.ndarray): Flow values.
+
+    Returns:
+    (np.ndarray, np.ndarray): Flows sorted in descending order and their exceedance probabilities (%).
+    """
+    sorted_flows = np.sort(np.asarray(flows, dtype=np.float64))[::-1]
+    exceedance_probability = np.arange(1, len(sorted_flows) + 1) / len(sorted_flows) * 100
+    return sorted_flows, exceedance_probability
+
+
+# Function to read the flow exceeded a given fraction of the time from an exact FDC
+def flow_at_exceedance(sorted_flows, probability):
+    """
+    Returns the flow exceeded a given fraction of the time (e.g. 0.90 for Q90) from flows sorted in descending order.
+
+    Args:
+    sorted_flows (np.ndarray): Flows sorted in descending order (from flow_duration_curve).
+    probability (float): Exceedance probability as a fraction (0-1).
+
+    Returns:
+    float: The flow at that exceedance probability.
+    """
+    return sorted_flows[int(probability * len(sorted_flows))]
+
+
+# Function to build the exceedance probabilities (%) at which an FDC is drawn
+def fdc_render_grid(n_points=500, focus=(85.0, 97.0)):
+    """
+    Builds a fixed grid of exceedance probabilities for drawing FDCs: log-spaced towards both tails,
+    linear in the body and denser around the low-flow indices (Q90/Q95).
+
+    Args:
+    n_points (int): Approximate number of grid points.
+    focus (tuple of float): Exceedance range (%) drawn with extra resolution.
+
+    Returns:
+    np.ndarray: Sorted, unique exceedance probabilities (%) between 0 and 100.
+    """
+    part = max(n_points // 4, 2)
+    high_flows = np.geomspace(1e-3, 10.0, part)         # Floods: 0.001% - 10% exceedance
+    low_flows = 100.0 - np.geomspace(1e-3, 10.0, part)  # Droughts: 90% - 99.999% exceedance
+    body = np.linspace(10.0, 90.0, part)
+    low_flow_indices = np.linspace(focus[0], focus[1], part)
+    return np.unique(np.concatenate((high_flows, body, low_flow_indices, low_flows, [100.0])))
+
+
+# Function to pick the points of a curve that best preserve its shape (Largest-Triangle-Three-Buckets)
+def lttb(x, y, n_out):
+    """
+    Downsamples a curve to n_out points with the Largest-Triangle-Three-Buckets algorithm.
+
+    Args:
+    x (np.ndarray): X values (sorted).
+    y (np.ndarray): Y values.
+    n_out (int): Number of points to keep (the first and last points are always kept).
+
+    Returns:
+    (np.ndarray, np.ndarray): The kept x and y values.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out - 2 buckets between the end points
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    selected = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        mean_x, mean_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[selected] - mean_x) * (y[lo:hi] - y[selected]) - (x[selected] - x[lo:hi]) * (mean_y - y[selected]))
+        selected = lo + int(np.argmax(area))
+        keep[i + 1] = selected
+    return x[keep], y[keep]
+
+
+# Function to reduce an FDC to the points needed to draw it
+@timed()
+def downsample_fdc(sorted_flows, exceedance_probability, max_points=500, method='grid'):
+    """
+    Reduces an FDC to about max_points points for plotting; short curves are returned unchanged.
+
+    Args:
+    sorted_flows (np.ndarray): Flows sorted in descending order.
+    exceedance_probability (np.ndarray): Matching exceedance probabilities (%).
+    max_points (int): Target number of points.
+    method (str): 'grid' samples the curve on fdc_render_grid; 'lttb' keeps the most shape-defining points.
+
+    Returns:
+    (np.ndarray, np.ndarray): Downsampled flows and exceedance probabilities (%).
+    """
+    sorted_flows = np.asarray(sorted_flows, dtype=np.float64)
+    exceedance_probability = np.asarray(exceedance_probability, dtype=np.float64)
+    if len(sorted_flows) <= max_points:
+        return sorted_flows, exceedance_probability
+    if method == 'lttb':
+        exceedance_probability, sorted_flows = lttb(exceedance_probability, sorted_flows, max_points)
+        return sorted_flows, exceedance_probability
+    if method != 'grid':
+        raise ValueError(f"Unknown downsampling method '{method}' (expected 'grid' or 'lttb')")
+    grid = fdc_render_grid(max_points)
+    grid = np.unique(np.concatenate(([exceedance_probability[0]], grid[grid > exceedance_probability[0]])))
+    return np.interp(grid, exceedance_probability, sorted_flows), grid
+
+
+class StreamingFDC:
+    """
+    Bounded-memory flow duration curve built from chunks of a series with a fixed log-spaced histogram.
+
+    Memory use is O(n_bins) whatever the length of the series, and sketches of different chunks, GCMs or basins
+    can be merged. Flows are located by interpolating inside a bin, so the relative error of any quantile between
+    lower and upper is below relative_error_bound.
+    """
+
+    def __init__(self, lower=1e-3, upper=1e6, n_bins=4096):
+        self.lower = float(lower)
+        self.upper = float(upper)
+        # Bin 0 holds flows below `lower` (including zero and negative flows), the last bin flows at or above `upper`
+        self.edges = np.concatenate(([0.0], np.geomspace(lower, upper, n_bins + 1), [np.inf]))
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def relative_error_bound(self):
+        # Width of one log-spaced bin relative to its lower edge
+        return float(self.edges[2] / self.edges[1] - 1)
+
+    # Function to add a chunk of flows to the sketch
+    def update(self, flows):
+        flows = np.asarray(flows, dtype=np.float64)
+        flows = flows[~np.isnan(flows)]
+        if flows.size == 0:
+            return self
+        # Negative flows (model artefacts, or missing-value sentinels such as -9999 not converted to NaN) fall below
+        # the first edge; they are counted in bin 0 with the zero flows
+        bins = np.maximum(np.searchsorted(self.edges, flows, side='right') - 1, 0)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.minimum = min(self.minimum, float(flows.min()))
+        self.maximum = max(self.maximum, float(flows.max()))
+        return self
+
+    # Function to combine two sketches with the same bins
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError('Only sketches with identical bins can be merged')
+        self.counts += other.counts
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    # Function to read the flow exceeded a given fraction of the time (same rank convention as flow_at_exceedance)
+    def flow_at_exceedance(self, probability):
+        """
+        Approximates the flow exceeded a given fraction of the time.
+
+        Args:
+        probability (float or np.ndarray): Exceedance probability as a fraction (0-1).
+
+        Returns:
+        float or np.ndarray: Approximate flow(s).
+        """
+        n = self.count
+        probability = np.asarray(probability, dtype=np.float64)
+        # Rank (0-based, ascending) of the value the exact FDC would pick
+        rank = n - 1 - np.floor(probability * n)
+        cumulative = np.cumsum(self.counts)
+        bins = np.searchsorted(cumulative, rank, side='right')
+        before = np.where(bins > 0, cumulative[np.maximum(bins - 1, 0)], 0)
+        fraction = (rank - before + 0.5) / self.counts[bins]
+
+        # Interpolate inside the bin (geometrically for the log-spaced bins), clipped to the observed range
+        lo = np.maximum(self.edges[bins], self.minimum)
+        hi = np.minimum(self.edges[bins + 1], self.maximum)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            geometric = lo * (hi / lo) ** fraction
+        flows = np.where((lo > 0) & np.isfinite(hi), geometric, lo + (hi - lo) * fraction)
+        return np.clip(flows, self.minimum, self.maximum)
+
+    # Function to evaluate the approximate FDC at a set of exceedance probabilities (%)
+    def curve(self, exceedance_probability):
+        exceedance_probability = np.asarray(exceedance_probability, dtype=np.float64)
+        return self.flow_at_exceedance(exceedance_probability / 100)
+
+
+# Function to build a streaming FDC from an iterable of chunks
+def streaming_fdc(chunks, lower=1e-3, upper=1e6, n_bins=4096):
+    """
+    Builds a StreamingFDC from chunks (e.g. gcm_io.iter_workbook_chunks) without holding the whole series in memory.
+
+    Args:
+    chunks (iterable of np.ndarray): Chunks of the flow series.
+    lower (float): Lowest flow resolved by the log-spaced bins.
+    upper (float): Highest flow resolved by the log-spaced bins.
+    n_bins (int): Number of log-spaced bins.
+
+    Returns:
+    StreamingFDC: The sketch.
+    """
+    sketch = StreamingFDC(lower, upper, n_bins)
+    for chunk in chunks:
+        sketch.update(chunk)
+    return sketch
@@ -0,0 +1,182 @@
+"""
+Stats-only command line: computes the numeric outputs of the plotting scripts with the analysis graph and writes
+them as CSV or JSON, for scheduled jobs that only need the numbers. By default these are the % change table
+(result_table) and the average annual max flow per period of the annual-max script, and the basic e-flow of the
+e-flow script. matplotlib and seaborn are not imported, and scipy is only imported for the return levels. The
+figures of the requested tables are rendered (through batch_export, which imports the plotting stack) only with
+--figures.
+
+Tables (one row per period, month or season; tables of one scenario are stacked with a 'Scenario' column):
+annual_max_change      % change of the mean annual max flow of every future period (result_table)
+annual_max_by_period   Average annual max flow of every period and scenario
+basic_eflow            Q90, Q95 and basic e-flow of the ensemble mean flow of every period
+return_levels          Gumbel return levels of the ensemble mean annual max flow of every period
+monthly_means          Ensemble mean monthly flow of every period
+monthly_change         % change of the ensemble mean monthly flow of every future period
+seasonal_means         Ensemble seasonal precipitation, ET and soil water (needs --water-balance-dir)
+
+Every .xlsx workbook of a directory is one GCM, named after the file. Without --output-dir the tables are written
+to standard output (JSON: one object with a list of records per table; CSV: every table after a '# name' line).
+
+Usage:
+python flow_statistics.py FLOW_DIR [--water-balance-dir DIR] [--tables NAME ...] [--format csv|json]
+                          [--output-dir DIR] [--figures] [--formats png] [--workers N]
+"""
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+from analysis_graph import SCENARIOS, run_analyses
+from basin_pipeline import discover_workbooks
+
+# Tables by name: (analysis, output of the analysis ('{scenario}' for one output per scenario), figure jobs)
+TABLES = {
+    'annual_max_change': ('annual_max_flow', 'percentage_change', ['annual_max_flow']),
+    'annual_max_by_period': ('annual_max_flow', 'average_by_period', ['annual_max_flow']),
+    'basic_eflow': ('environmental_flow', 'basic_eflow {scenario}', ['environmental_flow_{scenario}']),
+    'return_levels': ('return_period', 'return_levels {scenario}', ['return_period_{scenario}']),
+    'monthly_means': ('monthly_mean_discharge', 'monthly_means {scenario}', ['monthly_mean_discharge_{scenario}']),
+    'monthly_change': ('monthly_change', 'percentage_change {scenario}', ['monthly_change_boxplot_{scenario}']),
+    'seasonal_means': ('seasonal_means', 'seasonal_means {scenario}', ['seasonal_means']),
+}
+
+# Tables written when none are requested (the numbers the annual-max and e-flow scripts print)
+DEFAULT_TABLES = ['annual_max_change', 'annual_max_by_period', 'basic_eflow']
+
+
+# Function to turn an analysis table into a flat table (its row labels become the first column)
+def _flat(table):
+    return table.reset_index() if any(name is not None for name in table.index.names) else table
+
+
+# Function to compute the requested tables, every shared load and reduction running once
+def compute_tables(flow_files, water_balance_files=None, tables=DEFAULT_TABLES, scenarios=SCENARIOS, max_workers=None):
+    """
+    Args:
+    flow_files (dict or list of str): GCM name -> flow workbook path (or a list of paths).
+    water_balance_files (dict or list of str, optional): Water balance workbooks (needed by 'seasonal_means').
+    tables (list of str): Names from TABLES.
+    scenarios (tuple of str): Scenarios to analyse.
+    max_workers (int, optional): Number of threads for independent steps (see AnalysisGraph.compute).
+
+    Returns:
+    dict: Table name -> pd.DataFrame, in the order of tables.
+    """
+    analyses = list(dict.fromkeys(TABLES[name][0] for name in tables))
+    results, _ = run_analyses(flow_files, water_balance_files, analyses, scenarios, max_workers)
+    computed = {}
+    for name in tables:
+        analysis, output, _ = TABLES[name]
+        if analysis not in results:
+            raise ValueError(f"Table '{name}' needs the water balance workbooks")
+        if '{scenario}' in output:
+            per_scenario = {scenario: results[analysis][output.format(scenario=scenario)] for scenario in scenarios}
+            computed[name] = pd.concat(per_scenario, names=['Scenario']).reset_index()
+        else:
+            computed[name] = _flat(results[analysis][output])
+    return computed
+
+
+# Function to write the tables as CSV or JSON files (one per table), or to standard output without a directory
+def write_tables(tables, output_format='csv', output_dir=None):
+    """
+    Args:
+    tables (dict): Table name -> pd.DataFrame, e.g. from compute_tables.
+    output_format (str): 'csv' or 'json' (a list of records per table; missing values are null).
+    output_dir (str, optional): Directory for the files (<table>.csv or <table>.json).
+
+    Returns:
+    list of str: Paths of the files written (empty when writing to standard output).
+    """
+    if output_dir is None:
+        if output_format == 'json':
+            json.dump({name: json.loads(table.to_json(orient='records', double_precision=15)) for name, table in tables.items()}, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        else:
+            for name, table in tables.items():
+                sys.stdout.write(f'# {name}\n')
+                table.to_csv(sys.stdout, index=False)
+                sys.stdout.write('\n')
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, table in tables.items():
+        path = os.path.join(output_dir, f'{name}.{output_format}')
+        if output_format == 'json':
+            table.to_json(path, orient='records', double_precision=15, indent=2)
+        else:
+            table.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+# Function to render the figures of the requested tables with the plotting scripts (imports the plotting stack)
+def render_figures(tables, inputs, output_dir, formats=('png',), scenarios=SCENARIOS):
+    """
+    Args:
+    tables (list of str): Names from TABLES.
+    inputs (dict): Kind of workbook ('flow', 'water_balance') -> GCM name -> workbook path.
+    output_dir (str): Directory for the figures (one sub-directory per job).
+    formats (tuple of str): Figure file formats.
+    scenarios (tuple of str): Scenarios to render.
+
+    Returns:
+    list of dict: The batch_export entry of every job (status, timings and figures).
+    """
+    from basin_pipeline import SCRIPT_INPUTS
+    from batch_export import SCRIPT_DIR, _run_job, build_jobs
+
+    jobs = build_jobs(scenarios)
+    names = dict.fromkeys(job.format(scenario=scenario) for name in tables for job in TABLES[name][2] for scenario in scenarios)
+    entries = []
+    for name in names:
+        script, function, kwargs = jobs[name]
+        variable, kind = SCRIPT_INPUTS[script]
+        entries.append(_run_job(name, script, function, kwargs, output_dir, tuple(formats), SCRIPT_DIR,
+                                overrides={variable: inputs[kind]}))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the statistics of the analyses as CSV or JSON, without plotting.')
+    parser.add_argument('flow_dir', help='Directory of the GCM flow workbooks')
+    parser.add_argument('--water-balance-dir', default=None, help='Directory of the GCM water balance workbooks')
+    parser.add_argument('--tables', nargs='+', default=DEFAULT_TABLES, choices=list(TABLES))
+    parser.add_argument('--format', dest='output_format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--output-dir', default=None, help='Directory for the tables (default: standard output)')
+    parser.add_argument('--figures', action='store_true', help='Also render the figures of the tables')
+    parser.add_argument('--formats', nargs='+', default=['png'], help='Figure file formats (with --figures)')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    inputs = {'flow': discover_workbooks(args.flow_dir)}
+    if not inputs['flow']:
+        parser.error(f'No .xlsx workbooks in {args.flow_dir}')
+    if args.water_balance_dir:
+        inputs['water_balance'] = discover_workbooks(args.water_balance_dir)
+    elif 'seasonal_means' in args.tables:
+        parser.error("The 'seasonal_means' table needs --water-balance-dir")
+    if args.figures and args.output_dir is None:
+        parser.error('--figures needs --output-dir')
+
+    tables = compute_tables(inputs['flow'], inputs.get('water_balance'), args.tables, max_workers=args.workers)
+    paths = write_tables(tables, args.output_format, args.output_dir)
+    if args.output_dir is not None:
+        print(f"{len(paths)} table(s) written to {args.output_dir}")
+    if args.figures:
+        entries = render_figures(args.tables, inputs, os.path.join(args.output_dir, 'figures'), args.formats)
+        for entry in entries:
+            if entry['status'] == 'failed':
+                print(f"{entry['job']}:\n{entry['error']}")
+        print(f"{sum(len(entry['figures']) for entry in entries)} figure(s) written to "
+              f"{os.path.join(args.output_dir, 'figures')}")
+        return 0 if all(entry['status'] == 'ok' for entry in entries) else 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
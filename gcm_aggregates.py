@@ -0,0 +1,283 @@
+import hashlib
+import json
+import ntpath
+import os
+
+import numpy as np
+import pandas as pd
+
+from gcm_io import cache_path_for, load_gcm_ensemble, workbook_fingerprint
+from instrumentation import timed
+from time_index import TimeIndex
+
+
+class GCMAggregates:
+    """
+    Partial statistics of one GCM workbook: sums and counts of every (year, month), annual maxima, the number of
+    days in each year and the sorted flows of every period.
+
+    Ensemble monthly means, percentage changes, annual-maximum percentiles and FDCs are all rebuilt from these
+    small arrays, so the daily series of a GCM is only read again when its workbook changes.
+    """
+
+    def __init__(self, fingerprint, columns, years, month_sum, month_count, annual_max, year_days, period_flows):
+        self.fingerprint = fingerprint
+        self.columns = list(columns)
+        self.years = np.asarray(years)
+        self.month_sum = month_sum        # (column, year, month)
+        self.month_count = month_count    # (column, year, month)
+        self.annual_max = annual_max      # (column, year); NaN for years without data
+        self.year_days = year_days        # (year,)
+        self.period_flows = period_flows  # (column, period name) -> flows of the period sorted in ascending order
+        self._year_index = None
+
+    @property
+    def year_index(self):
+        if self._year_index is None:
+            self._year_index = TimeIndex.from_years(self.years)
+        return self._year_index
+
+    # Function to compute the aggregates of one GCM from its daily data
+    @classmethod
+    @timed()
+    def from_frame(cls, df, columns, periods, fingerprint):
+        """
+        Computes the aggregates of one GCM in a single pass over each column.
+
+        Args:
+        df (pd.DataFrame): Daily data with a 'Date' column.
+        columns (list of str): Value columns to aggregate (e.g. ['Flow SSP245', 'Flow SSP585']).
+        periods (dict): Period name -> (start_year, end_year) for the sorted period flows.
+        fingerprint (str): Content hash of the workbook the data was read from.
+
+        Returns:
+        GCMAggregates: The aggregates.
+        """
+        time_index = TimeIndex(df['Date'])
+        n_years = len(time_index.years)
+        codes = time_index.year_codes.astype(np.int64) * 12 + time_index.month_codes
+        year_days = np.diff(time_index.year_offsets)
+        annual_years, starts = time_index.annual_starts()
+
+        month_sum = np.zeros((len(columns), n_years, 12))
+        month_count = np.zeros((len(columns), n_years, 12), dtype=np.int64)
+        annual_max = np.full((len(columns), n_years), np.nan)
+        period_flows = {}
+        for c, column in enumerate(columns):
+            values = df[column].to_numpy(dtype=np.float64)
+            valid = ~np.isnan(values)
+            month_sum[c] = np.bincount(codes[valid], weights=values[valid], minlength=n_years * 12).reshape(n_years, 12)
+            month_count[c] = np.bincount(codes[valid], minlength=n_years * 12).reshape(n_years, 12)
+            annual_max[c, annual_years - time_index.first_year] = np.fmax.reduceat(values, starts)
+            for name, (start_year, end_year) in periods.items():
+                flows = values[time_index.year_slice(start_year, end_year)]
+                period_flows[(column, name)] = np.sort(flows[~np.isnan(flows)])
+
+        return cls(fingerprint, columns, time_index.years, month_sum, month_count, annual_max, year_days, period_flows)
+
+    # Function to write the aggregates to a .npz file
+    def save(self, file_path):
+        arrays = {'years': self.years, 'month_sum': self.month_sum, 'month_count': self.month_count,
+                  'annual_max': self.annual_max, 'year_days': self.year_days}
+        keys = list(self.period_flows)
+        for k, key in enumerate(keys):
+            arrays[f'period_{k}'] = self.period_flows[key]
+        meta = {'fingerprint': self.fingerprint, 'columns': self.columns, 'period_keys': keys}
+        temporary = file_path + '.tmp.npz'
+        np.savez(temporary, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(temporary, file_path)
+
+    # Function to read aggregates written by save
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as data:
+            meta = json.loads(str(data['meta']))
+            period_flows = {tuple(key): data[f'period_{k}'] for k, key in enumerate(meta['period_keys'])}
+            return cls(meta['fingerprint'], meta['columns'], data['years'], data['month_sum'], data['month_count'],
+                       data['annual_max'], data['year_days'], period_flows)
+
+
+class GCMAggregateStore:
+    """
+    Per-GCM aggregates of an ensemble, kept on disk next to each workbook's column cache.
+
+    update() only reads the workbooks that are new or whose contents changed since their aggregates were saved,
+    so adding one model to a 30-model ensemble costs the time of that one model; every ensemble statistic is
+    then merged from the stored aggregates.
+    """
+
+    def __init__(self, columns, periods, cache_dir=None):
+        self.columns = list(columns)
+        self.periods = dict(periods)
+        self.cache_dir = cache_dir
+        self.members = {}
+        # The file name depends on the configuration, so stores with other columns or periods do not collide
+        config = json.dumps({'columns': self.columns, 'periods': {name: list(years) for name, years in self.periods.items()}})
+        self._file_name = f'aggregates-{hashlib.sha1(config.encode("utf-8")).hexdigest()[:10]}.npz'
+
+    @property
+    def gcms(self):
+        return list(self.members)
+
+    # Function to bring the store in line with a set of workbooks, recomputing only new or changed models
+    @timed()
+    def update(self, gcm_files, max_workers=None):
+        """
+        Synchronises the store with the given workbooks: aggregates are computed for new or changed workbooks,
+        read back for unchanged ones, and dropped for GCMs that are no longer listed.
+
+        Args:
+        gcm_files (dict or list of str): GCM name -> workbook path (a list is named by file stem).
+        max_workers (int, optional): Worker processes for reading the new or changed workbooks.
+
+        Returns:
+        list of str: GCMs whose aggregates were recomputed.
+        """
+        if not isinstance(gcm_files, dict):
+            gcm_files = {ntpath.splitext(ntpath.basename(path))[0]: path for path in gcm_files}
+
+        stale = {}
+        members = {}
+        for name, path in gcm_files.items():
+            fingerprint = workbook_fingerprint(path, self.cache_dir)
+            member = self.members.get(name)
+            if member is None or member.fingerprint != fingerprint:
+                target = os.path.join(cache_path_for(path, self.cache_dir), self._file_name)
+                member = GCMAggregates.load(target) if os.path.exists(target) else None
+            if member is None or member.fingerprint != fingerprint:
+                stale[name] = (path, fingerprint)
+            members[name] = member
+
+        if stale:
+            frames = load_gcm_ensemble({name: path for name, (path, _) in stale.items()}, columns=['Date'] + self.columns,
+                                       max_workers=max_workers, cache_dir=self.cache_dir)
+            for name, (path, fingerprint) in stale.items():
+                members[name] = GCMAggregates.from_frame(frames[name], self.columns, self.periods, fingerprint)
+                members[name].save(os.path.join(cache_path_for(path, self.cache_dir), self._file_name))
+
+        self.members = members
+        return list(stale)
+
+    # Function to get the mean of each calendar month over a period, for every GCM
+    @timed()
+    def gcm_monthly_means(self, column, period):
+        """
+        Computes the mean of each calendar month over a period for every GCM from the stored monthly sums and counts.
+
+        Args:
+        column (str): Value column (e.g. 'Flow SSP245').
+        period (str or tuple): A configured period name, or any (start_year, end_year).
+
+        Returns:
+        pd.DataFrame: Monthly means indexed by 'Month' (1-12), one column per GCM.
+        """
+        start_year, end_year = self.periods[period] if isinstance(period, str) else period
+        c = self.columns.index(column)
+        means = {}
+        for name, member in self.members.items():
+            rows = member.year_index.year_slice(start_year, end_year)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means[name] = member.month_sum[c, rows].sum(axis=0) / member.month_count[c, rows].sum(axis=0)
+        return pd.DataFrame(means, index=pd.Index(range(1, 13), name='Month'))
+
+    # Function to get the monthly means of every column, GCM and configured period as one long-format table
+    @timed()
+    def monthly_mean_table(self):
+        """
+        Builds the monthly means of every (column, GCM, period, month) from the stored monthly sums and counts.
+
+        Returns:
+        pd.DataFrame: Long-format table with the columns 'Scenario' (the value column), 'GCM', 'Period' (the
+        configured period name), 'Month' (1-12) and 'Flow'.
+        """
+        names = list(self.members)
+        period_names = list(self.periods)
+        # (gcm, period, column, month)
+        means = np.empty((len(names), len(period_names), len(self.columns), 12))
+        for g, member in enumerate(self.members.values()):
+            for p, (start_year, end_year) in enumerate(self.periods.values()):
+                rows = member.year_index.year_slice(start_year, end_year)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    means[g, p] = member.month_sum[:, rows].sum(axis=1) / member.month_count[:, rows].sum(axis=1)
+
+        index = pd.MultiIndex.from_product([names, period_names, self.columns, range(1, 13)],
+                                           names=['GCM', 'Period', 'Scenario', 'Month'])
+        table = pd.DataFrame({'Flow': means.ravel()}, index=index).reset_index()
+        return table[['Scenario', 'GCM', 'Period', 'Month', 'Flow']]
+
+    # Function to get the ensemble mean of the monthly means over a period
+    def ensemble_monthly_mean(self, column, period):
+        return self.gcm_monthly_means(column, period).mean(axis=1)
+
+    # Function to get the annual maxima of every GCM as one table
+    def annual_max(self, column, complete_years_only=False):
+        """
+        Collects the annual maxima of every GCM.
+
+        Args:
+        column (str): Value column (e.g. 'Flow SSP585').
+        complete_years_only (bool): Keep only years with 365 or 366 days of data.
+
+        Returns:
+        pd.DataFrame: Annual maxima indexed by 'Year', one column per GCM.
+        """
+        c = self.columns.index(column)
+        table = {}
+        for name, member in self.members.items():
+            keep = member.year_days >= 365 if complete_years_only else member.year_days > 0
+            table[name] = pd.Series(member.annual_max[c, keep], index=member.years[keep])
+        return pd.DataFrame(table).rename_axis('Year')
+
+    # Function to get percentiles of the annual maxima across GCMs, year by year
+    def annual_max_percentiles(self, column, q=(2.5, 50, 97.5), complete_years_only=False):
+        table = self.annual_max(column, complete_years_only)
+        return pd.DataFrame(np.nanpercentile(table.to_numpy(), q, axis=1).T, index=table.index, columns=list(q))
+
+    # Function to stack the yearly aggregates of every GCM on one common year axis
+    @timed()
+    def yearly_arrays(self, column):
+        """
+        Stacks the monthly sums and counts and the annual maxima of every GCM over the union of their years.
+
+        Args:
+        column (str): Value column (e.g. 'Flow SSP245').
+
+        Returns:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): Consecutive years; monthly sums and monthly counts with
+        shape (gcm, year, 12) (0 where a GCM has no data); annual maxima with shape (gcm, year) (NaN where it has none).
+        """
+        c = self.columns.index(column)
+        members = list(self.members.values())
+        first = min(int(member.years[0]) for member in members)
+        years = np.arange(first, max(int(member.years[-1]) for member in members) + 1)
+        month_sum = np.zeros((len(members), len(years), 12))
+        month_count = np.zeros((len(members), len(years), 12))
+        annual_max = np.full((len(members), len(years)), np.nan)
+        for g, member in enumerate(members):
+            rows = slice(int(member.years[0]) - first, int(member.years[-1]) - first + 1)
+            month_sum[g, rows] = member.month_sum[c]
+            month_count[g, rows] = member.month_count[c]
+            annual_max[g, rows] = np.where(member.year_days > 0, member.annual_max[c], np.nan)
+        return years, month_sum, month_count, annual_max
+
+    # Function to get the flow duration curve of one GCM for a configured period
+    def period_fdc(self, gcm, column, period):
+        sorted_flows = self.members[gcm].period_flows[(column, period)][::-1]
+        return sorted_flows, np.arange(1, len(sorted_flows) + 1) / len(sorted_flows) * 100
+
+    # Function to get the flow duration curve of the daily flows of all GCMs pooled together
+    def pooled_fdc(self, column, period):
+        """
+        Builds the FDC of the daily flows of every GCM pooled together, by merging the stored sorted period flows.
+
+        Args:
+        column (str): Value column.
+        period (str): A configured period name.
+
+        Returns:
+        (np.ndarray, np.ndarray): Flows sorted in descending order and their exceedance probabilities (%).
+        """
+        # The stored runs are already sorted, which the stable (merge) sort exploits
+        pooled = np.sort(np.concatenate([member.period_flows[(column, period)] for member in self.members.values()]),
+                         kind='stable')[::-1]
+        return pooled, np.arange(1, len(pooled) + 1) / len(pooled) * 100
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed, timer
+
+# Name of the hidden folder (created next to the workbooks) that holds the columnar cache
+CACHE_DIR_NAME = '.gcm_cache'
+
+# Bump this when the on-disk layout changes so stale caches are rebuilt automatically
+CACHE_FORMAT_VERSION = 1
+
+
+# Function to compute a cheap signature (mtime and size) of a source workbook
+def _file_signature(file_path):
+    stat = os.stat(file_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+# Function to hash the contents of a source workbook
+def _file_sha256(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to locate the cache folder of a given workbook
+def cache_path_for(file_path, cache_dir=None):
+    """
+    Returns the folder that holds the columnar cache for a workbook.
+
+    Args:
+    file_path (str): Path to the GCM workbook (.xlsx).
+    cache_dir (str, optional): Root folder for all caches. Defaults to a '.gcm_cache' folder next to the workbook.
+
+    Returns:
+    str: Path of the cache folder for this workbook.
+    """
+    absolute_path = os.path.abspath(file_path)
+    root = cache_dir if cache_dir is not None else os.path.join(os.path.dirname(absolute_path), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(absolute_path))[0]
+    # The path digest keeps workbooks with the same name in different folders apart
+    path_digest = hashlib.sha1(absolute_path.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(root, f'{stem}-{path_digest}')
+
+
+# Function to write a DataFrame as one .npy file per column (dates stored as int64 nanoseconds)
+def _write_cache(df, target, signature):
+    os.makedirs(target, exist_ok=True)
+    columns = []
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        if column == 'Date' or pd.api.types.is_datetime64_any_dtype(values):
+            kind = 'datetime'
+            array = pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view('int64')
+        elif pd.api.types.is_numeric_dtype(values):
+            kind = 'numeric'
+            array = values.to_numpy()
+        else:
+            kind = 'string'
+            array = values.astype(str).to_numpy(dtype=str)
+        file_name = f'col_{position:03d}.npy'
+        np.save(os.path.join(target, file_name), array, allow_pickle=False)
+        columns.append({'name': str(column), 'file': file_name, 'kind': kind})
+
+    meta = dict(signature, version=CACHE_FORMAT_VERSION, columns=columns)
+    # Write the metadata last (and atomically) so a half-written cache is never considered valid
+    temp_path = os.path.join(target, 'meta.json.tmp')
+    with open(temp_path, 'w') as handle:
+        json.dump(meta, handle, indent=2)
+    os.replace(temp_path, os.path.join(target, 'meta.json'))
+
+
+# Function to read the metadata of a cache folder (None if missing or unreadable)
+def _read_meta(target):
+    try:
+        with open(os.path.join(target, 'meta.json')) as handle:
+            meta = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_FORMAT_VERSION:
+        return None
+    return meta
+
+
+# Function to shrink a DataFrame's dtypes: float32 values and categorical text
+def _compact_frame(df):
+    for column in df.columns:
+        if pd.api.types.is_float_dtype(df[column]):
+            df[column] = df[column].astype(np.float32)
+        elif pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column]):
+            df[column] = df[column].astype('category')
+    return df
+
+
+# Function to load selected columns back from a cache folder
+def _read_cache(target, meta, columns=None, compact=False):
+    entries = meta['columns']
+    if columns is not None:
+        by_name = {entry['name']: entry for entry in entries}
+        missing = [column for column in columns if column not in by_name]
+        if missing:
+            raise KeyError(f'Columns not found in cached workbook: {missing}')
+        entries = [by_name[column] for column in columns]
+
+    data = {}
+    for entry in entries:
+        path = os.path.join(target, entry['file'])
+        if compact and entry['kind'] == 'numeric':
+            # Downcast straight from the memory-mapped file, so the float64 column is never held in memory
+            array = np.load(path, mmap_mode='r')
+            data[entry['name']] = array.astype(np.float32) if array.dtype.kind == 'f' else np.array(array)
+            continue
+        array = np.load(path, allow_pickle=False)
+        if entry['kind'] == 'datetime':
+            array = array.view('datetime64[ns]')
+        elif compact and entry['kind'] == 'string':
+            array = pd.Categorical(array)
+        data[entry['name']] = array
+    return pd.DataFrame(data)
+
+
+# Function to read a GCM workbook through the columnar cache
+@timed()
+def read_gcm_workbook(file_path, columns=None, cache_dir=None, use_cache=True, compact=False):
+    """
+    Reads a GCM workbook, converting it once into a columnar .npy cache and loading from that cache afterwards.
+
+    The cache is considered up to date when the workbook's modification time and size are unchanged.
+    If only the modification time changed (e.g. the file was copied), the contents hash is compared
+    before deciding to parse the workbook again.
+
+    Args:
+    file_path (str): Path to the GCM workbook (.xlsx).
+    columns (list of str, optional): Columns to return. Defaults to all columns.
+    cache_dir (str, optional): Root folder for the cache. Defaults to a '.gcm_cache' folder next to the workbook.
+    use_cache (bool): Set to False to always parse the workbook with pd.read_excel.
+    compact (bool): Return float columns as float32 and text columns as categoricals (about half the memory).
+
+    Returns:
+    pd.DataFrame: Workbook contents with 'Date' already converted to datetime.
+    """
+    if not use_cache:
+        df = pd.read_excel(file_path, usecols=columns)
+        if 'Date' in df:
+            df['Date'] = pd.to_datetime(df['Date'])
+        df = df[columns] if columns is not None else df
+        return _compact_frame(df) if compact else df
+
+    # Cold runs parse the workbook here; the first read is served from the cache as well so cold and warm runs return identical dtypes
+    target, meta = _fresh_cache(file_path, cache_dir)
+    return _read_cache(target, meta, columns, compact)
+
+
+# Function to make sure the cache of a workbook is up to date, returning its folder and metadata
+def _fresh_cache(file_path, cache_dir=None):
+    target = cache_path_for(file_path, cache_dir)
+    signature = _file_signature(file_path)
+    meta = _read_meta(target)
+
+    if meta is not None:
+        if meta['mtime_ns'] == signature['mtime_ns'] and meta['size'] == signature['size']:
+            return target, meta
+        if meta['size'] == signature['size'] and meta.get('sha256') == _file_sha256(file_path):
+            # Same contents with a new timestamp: refresh the signature instead of parsing again
+            meta.update(signature)
+            with open(os.path.join(target, 'meta.json'), 'w') as handle:
+                json.dump(meta, handle, indent=2)
+            return target, meta
+
+    # Cold path: parse the workbook once and store it column by column
+    with timer('read_excel'):
+        df = pd.read_excel(file_path)
+    with timer('parse_dates'):
+        df['Date'] = pd.to_datetime(df['Date'])
+    with timer('write_cache'):
+        _write_cache(df, target, dict(signature, sha256=_file_sha256(file_path)))
+    return target, _read_meta(target)
+
+
+# Function to get the content hash of a workbook (from its cache metadata)
+def workbook_fingerprint(file_path, cache_dir=None):
+    """
+    Returns the SHA-256 of a workbook's contents. It is read from the cache metadata, so the workbook is only
+    hashed (or parsed) when its cache is missing or stale.
+
+    Args:
+    file_path (str): Path to the GCM workbook (.xlsx).
+    cache_dir (str, optional): Root folder for all caches (see cache_path_for).
+
+    Returns:
+    str: Hex digest of the workbook contents.
+    """
+    return _fresh_cache(file_path, cache_dir)[1]['sha256']
+
+
+# Function to stream one column of a workbook in chunks (memory-mapped from the cache)
+def iter_workbook_chunks(file_path, column, chunk_size=1 << 20, cache_dir=None):
+    """
+    Yields one column of a GCM workbook in chunks without loading the whole column into memory.
+
+    Args:
+    file_path (str): Path to the GCM workbook (.xlsx).
+    column (str): Column to stream (e.g., 'Flow SSP585').
+    chunk_size (int): Number of rows per chunk.
+    cache_dir (str, optional): Root folder for the cache (see read_gcm_workbook).
+
+    Yields:
+    np.ndarray: Consecutive chunks of the column.
+    """
+    target, meta = _fresh_cache(file_path, cache_dir)
+    entry = next((entry for entry in meta['columns'] if entry['name'] == column), None)
+    if entry is None:
+        raise KeyError(f'Column not found in cached workbook: {column}')
+    values = np.load(os.path.join(target, entry['file']), mmap_mode='r')
+    for start in range(0, len(values), chunk_size):
+        yield np.array(values[start:start + chunk_size])
+
+
+# Function run in each worker: read one GCM, parse dates and keep only the requested columns
+def _load_one_gcm(file_path, columns, calendar_columns, cache_dir, use_cache, compact=False):
+    df = read_gcm_workbook(file_path, columns=columns, cache_dir=cache_dir, use_cache=use_cache, compact=compact)
+    if 'Year' in calendar_columns:
+        df['Year'] = df['Date'].dt.year.astype(np.int16) if compact else df['Date'].dt.year
+    if 'Month' in calendar_columns:
+        df['Month'] = df['Date'].dt.month.astype(np.int8) if compact else df['Date'].dt.month
+    return df
+
+
+# Function to read the GCMs of an ensemble one by one (in input order), so callers can consume each before the next
+def iter_gcm_ensemble(file_paths, columns=None, calendar_columns=(), max_workers=None, cache_dir=None, use_cache=True,
+                      compact=False):
+    """
+    Yields the GCM DataFrames of an ensemble in input order; see load_gcm_ensemble for the arguments.
+
+    Yields:
+    (str or int, pd.DataFrame): GCM name (or position when file_paths is a list) and its data.
+    """
+    names = list(file_paths.keys()) if isinstance(file_paths, dict) else list(range(len(file_paths)))
+    paths = list(file_paths.values()) if isinstance(file_paths, dict) else list(file_paths)
+    if max_workers is None:
+        max_workers = min(len(paths), os.cpu_count() or 1)
+    task_args = (columns, tuple(calendar_columns), cache_dir, use_cache, compact)
+
+    if max_workers <= 1 or len(paths) <= 1:
+        for name, path in zip(names, paths):
+            yield name, _load_one_gcm(path, *task_args)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # About max_workers reads are in flight: the next GCM is submitted when the oldest one is yielded, so
+            # finished DataFrames do not pile up here while the caller is still on the first ones (results are
+            # taken in submission order, so the GCM order is preserved)
+            tasks = iter(zip(names, paths))
+            pending = deque()
+            try:
+                for name, path in tasks:
+                    pending.append((name, executor.submit(_load_one_gcm, path, *task_args)))
+                    if len(pending) == max_workers:
+                        break
+                while pending:
+                    name, future = pending.popleft()
+                    for next_name, next_path in tasks:
+                        pending.append((next_name, executor.submit(_load_one_gcm, next_path, *task_args)))
+                        break
+                    yield name, future.result()
+            finally:
+                # A caller that stops early does not wait for the reads it will never consume
+                for _, future in pending:
+                    future.cancel()
+
+
+# Function to load every GCM of an ensemble, fanning the reads out over a process pool
+@timed()
+def load_gcm_ensemble(file_paths, columns=None, calendar_columns=(), max_workers=None, cache_dir=None, use_cache=True,
+                      compact=False):
+    """
+    Loads all GCM workbooks of an ensemble in parallel and returns them in the same GCM order.
+
+    Note: on Windows the worker processes re-import the calling script, so the call must sit
+    behind an `if __name__ == '__main__':` guard.
+
+    Args:
+    file_paths (list of str or dict): Workbook paths, or GCM name -> workbook path.
+    columns (list of str, optional): Columns to keep (e.g., ['Date', 'Flow SSP585']). Defaults to all columns.
+    calendar_columns (tuple of str): Extra columns derived from 'Date' in the workers ('Year' and/or 'Month').
+    max_workers (int, optional): Number of worker processes. Defaults to one per GCM, capped at the CPU count.
+        Use 1 to read the files one after another in the current process.
+    cache_dir (str, optional): Root folder for the columnar cache (see read_gcm_workbook).
+    use_cache (bool): Set to False to always parse the workbooks with pd.read_excel.
+    compact (bool): Load float columns as float32, text columns as categoricals, and the calendar columns as
+        int16 (Year) and int8 (Month).
+
+    Returns:
+    list of pd.DataFrame or dict: One DataFrame per GCM, in input order (a dict when file_paths is a dict).
+    """
+    frames = dict(iter_gcm_ensemble(file_paths, columns, calendar_columns, max_workers, cache_dir, use_cache, compact))
+    if isinstance(file_paths, dict):
+        return frames
+    return list(frames.values())
+
+
+# Function to report the memory held by each GCM's DataFrame
+def memory_report(gcm_data):
+    """
+    Reports the rows, columns and memory (including the index) of every loaded GCM.
+
+    Args:
+    gcm_data (dict or list of pd.DataFrame): Loaded GCMs, as returned by load_gcm_ensemble.
+
+    Returns:
+    pd.DataFrame: One row per GCM with 'Rows', 'Columns' and 'Memory (MB)', plus a 'Total' row.
+    """
+    frames = gcm_data if isinstance(gcm_data, dict) else dict(enumerate(gcm_data))
+    report = pd.DataFrame({'Rows': [len(df) for df in frames.values()],
+                           'Columns': [df.shape[1] for df in frames.values()],
+                           'Memory (MB)': [df.memory_usage(deep=True).sum() / 1e6 for df in frames.values()]},
+                          index=pd.Index(list(frames.keys()), name='GCM'))
+    report.loc['Total'] = [report['Rows'].sum(), report['Columns'].max(), report['Memory (MB)'].sum()]
+    return report.astype({'Rows': np.int64, 'Columns': np.int64})
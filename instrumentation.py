@@ -0,0 +1,215 @@
+import atexit
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from functools import wraps
+
+# State of the active profiling run (None while instrumentation is off, which makes every timer a no-op)
+_run = None
+
+# Guards the stage records, which timers running in different threads update
+_lock = threading.Lock()
+
+
+# Timer of one stage; nested stages are recorded under the path of the stages enclosing them (in the same thread)
+class _Timer:
+    __slots__ = ('stage', 'stack', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.stack = _run['stacks'].setdefault(threading.get_ident(), [])
+        self.stack.append(self.stage)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            record = _run['stages'].setdefault(tuple(self.stack), [0, 0.0])
+            record[0] += 1
+            record[1] += elapsed
+        self.stack.pop()
+        return False
+
+
+# Stand-in for a timer while instrumentation is off (shared, so a disabled timer allocates nothing)
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+# Function to time a block of code as one stage
+def timer(stage):
+    """
+    Context manager that records the wall time of a block under the given stage name (nothing while disabled).
+
+    Args:
+    stage (str): Name of the stage, e.g. 'read_excel'.
+
+    Returns:
+    context manager: The timer.
+    """
+    return _NO_TIMER if _run is None else _Timer(stage)
+
+
+# Decorator that times every call of a function as one stage
+def timed(stage=None):
+    """
+    Records the wall time of every call of the decorated function. While instrumentation is off the only cost is
+    one check per call.
+
+    Args:
+    stage (str, optional): Name of the stage. Defaults to the function's qualified name.
+
+    Returns:
+    callable: The decorator.
+    """
+    def decorator(function):
+        name = stage or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _run is None:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Function to check whether instrumentation is on
+def enabled():
+    return _run is not None
+
+
+# Function to start a new (empty) recording in the current process
+def _start_recording(profile):
+    if _run.get('profiler') is not None:
+        _run['profiler'].disable()
+    _run.update(stacks={}, stages={}, started=time.perf_counter(), pid=os.getpid(), profiler=None)
+    if profile:
+        _run['profiler'] = cProfile.Profile()
+        _run['profiler'].enable()
+
+
+# Function to switch instrumentation on
+def enable(output_dir='profile', profile=False):
+    """
+    Starts recording stage timings; a report is written to output_dir when the process exits (or by write_report).
+
+    Args:
+    output_dir (str): Directory for the reports.
+    profile (bool): Also run cProfile and save its statistics (.prof, readable with pstats or snakeviz).
+    """
+    global _run
+    if _run is None:
+        atexit.register(_write_at_exit)
+    _run = {'output_dir': output_dir, 'profile': profile}
+    _start_recording(profile)
+
+
+# Function to switch instrumentation off, discarding what was not written yet
+def disable():
+    global _run
+    if _run is not None and _run['profiler'] is not None:
+        _run['profiler'].disable()
+    _run = None
+
+
+# Function to summarise the recorded stages (total and self time of every stage path)
+def _stage_table(stages):
+    child_seconds = {}
+    for path, (_, seconds) in stages.items():
+        if len(path) > 1:
+            child_seconds[path[:-1]] = child_seconds.get(path[:-1], 0.0) + seconds
+    table = [{'stage': ';'.join(path), 'name': path[-1], 'depth': len(path) - 1, 'calls': calls,
+              'total_seconds': seconds, 'self_seconds': max(seconds - child_seconds.get(path, 0.0), 0.0)}
+             for path, (calls, seconds) in stages.items()]
+    return sorted(table, key=lambda row: row['total_seconds'], reverse=True)
+
+
+# Function to turn a label into a file name
+def _slug(label):
+    return re.sub(r'[^0-9A-Za-z_-]+', '_', label).strip('_') or 'profile'
+
+
+# Function to write the report of everything recorded since the last report, then start recording again
+def write_report(label=None):
+    """
+    Writes the stage timings recorded in this process to the output directory:
+    <label>-<time>-<pid>.json (calls, total and self seconds of every stage path), .folded (one 'a;b;c microseconds'
+    line per stage path, the collapsed-stack input of flamegraph.pl and speedscope) and, with cProfile on, .prof.
+
+    Args:
+    label (str, optional): Prefix of the file names. Defaults to the name of the running script.
+
+    Returns:
+    dict or None: The report, or None if instrumentation is off or nothing was recorded.
+    """
+    if _run is None:
+        return None
+    if _run['profiler'] is not None:
+        _run['profiler'].disable()
+    if not _run['stages']:
+        _start_recording(_run['profile'])
+        return None
+
+    label = _slug(label or os.path.splitext(os.path.basename(sys.argv[0]))[0])
+    os.makedirs(_run['output_dir'], exist_ok=True)
+    base = os.path.join(_run['output_dir'], f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    stem, count = base, 1
+    # Reports written within the same second by the same process get a numbered suffix
+    while os.path.exists(f'{stem}.json'):
+        count += 1
+        stem = f'{base}_{count}'
+    table = _stage_table(_run['stages'])
+    report = {'label': label, 'pid': os.getpid(), 'argv': sys.argv,
+              'wall_seconds': time.perf_counter() - _run['started'], 'stages': table,
+              'files': {'json': f'{stem}.json', 'folded': f'{stem}.folded'}}
+
+    with open(f'{stem}.folded', 'w') as file:
+        for row in sorted(table, key=lambda row: row['stage']):
+            file.write(f"{row['stage']} {round(row['self_seconds'] * 1e6)}\n")
+    if _run['profiler'] is not None:
+        report['files']['prof'] = f'{stem}.prof'
+        _run['profiler'].dump_stats(f'{stem}.prof')
+    with open(f'{stem}.json', 'w') as file:
+        json.dump(report, file, indent=2)
+
+    _start_recording(_run['profile'])
+    return report
+
+
+# Function run when the process exits: write whatever was recorded since the last report
+def _write_at_exit():
+    report = write_report()
+    if report is not None:
+        print(f"Profile written to {report['files']['json']}", file=sys.stderr)
+
+
+# Function run in a forked child process (e.g. a pool worker): drop the stages inherited from the parent
+def _reset_after_fork():
+    if _run is not None:
+        _start_recording(_run['profile'])
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Set GCM_PROFILE_DIR to record the stage timings of every run there; set GCM_PROFILE_CPROFILE=1 to add cProfile
+if os.environ.get('GCM_PROFILE_DIR'):
+    enable(os.environ['GCM_PROFILE_DIR'], profile=os.environ.get('GCM_PROFILE_CPROFILE', '') not in ('', '0'))
@@ -0,0 +1,207 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from time_index import TimeIndex
+
+# Standard normal quantile of the 10-year low flow (non-exceedance probability 1/10)
+Z_10_YEAR_LOW = -1.2815515655446004
+
+# Annual indices, in the column order of the tables
+ANNUAL_INDICES = ['1-Day Min', '7-Day Min', '1-Day Max', 'Date of Min', 'Date of Max', 'Rise Rate', 'Fall Rate',
+                  'Reversals', 'Low Pulses', 'High Pulses']
+
+# Indices given as a day of the year, averaged as angles so late December and early January stay close
+DATE_INDICES = ('Date of Min', 'Date of Max')
+
+
+# Function to compute the moving average of the last `window` days of every day (NaN for the first window - 1 days)
+def moving_average(flows, window=7):
+    """
+    Computes the trailing moving average along the time axis with one cumulative sum (O(1) per day for any window).
+
+    Args:
+    flows (np.ndarray): Daily flows with shape (..., time); a window containing a missing day is NaN.
+    window (int): Window length in days.
+
+    Returns:
+    np.ndarray: Moving averages with shape (..., time).
+    """
+    flows = np.asarray(flows, dtype=np.float64)
+    missing = np.isnan(flows)
+    padding = np.zeros(flows.shape[:-1] + (1,))
+    # Missing days are summed as 0 and counted separately, so one gap does not spoil every later window
+    cumulative = np.concatenate((padding, np.cumsum(np.where(missing, 0.0, flows), axis=-1)), axis=-1)
+    cumulative_missing = np.concatenate((padding, np.cumsum(missing, axis=-1)), axis=-1)
+    averages = np.full(flows.shape, np.nan)
+    window_missing = cumulative_missing[..., window:] - cumulative_missing[..., :-window]
+    averages[..., window - 1:] = np.where(window_missing > 0, np.nan, (cumulative[..., window:] - cumulative[..., :-window]) / window)
+    return averages
+
+
+# Function to lay daily values out as one row of 366 days per year with a single gather
+def _by_year(values, time_index):
+    """
+    Args:
+    values (np.ndarray): Daily values with shape (..., time), aligned with time_index.
+    time_index (TimeIndex): Time axis of the values.
+
+    Returns:
+    np.ndarray: Values with shape (..., year, 366); NaN after the last day of every year.
+    """
+    starts = time_index.year_offsets[:-1]
+    lengths = np.diff(time_index.year_offsets)
+    days = np.arange(366)
+    positions = np.minimum(starts[:, None] + days, len(time_index) - 1)
+    return np.where(days < lengths[:, None], np.asarray(values, dtype=np.float64)[..., positions], np.nan)
+
+
+# Function to flag the days on which a run of True starts
+def _run_starts(condition):
+    previous = np.concatenate((np.zeros(condition.shape[:-1] + (1,), dtype=bool), condition[..., :-1]), axis=-1)
+    return condition & ~previous
+
+
+# Function to flag the days on which the flow changes direction (rising after falling or falling after rising)
+def _reversals(change):
+    direction = np.sign(np.nan_to_num(change))
+    # Direction of the last day with a non-zero change, carried forward over days without change
+    positions = np.where(direction != 0, np.arange(direction.shape[-1]), 0)
+    last_direction = np.take_along_axis(direction, np.maximum.accumulate(positions, axis=-1), axis=-1)
+    previous = np.concatenate((np.zeros(direction.shape[:-1] + (1,)), last_direction[..., :-1]), axis=-1)
+    return direction * previous < 0
+
+
+# Function to compute the annual low-flow and hydrologic-alteration indices of every series in one pass
+@timed()
+def annual_flow_indices(flows, dates, baseline_period=(1984, 2014)):
+    """
+    Computes IHA-style indices of every year for every series (e.g. every GCM and scenario) at once: the 1-day and
+    7-day minimum, the 1-day maximum, the day of the year of the minimum and of the maximum, the mean rise and fall
+    rates (mean positive / negative day-to-day change), the number of reversals, and the number of low and high
+    pulses (runs below the 25th / above the 75th percentile of the series' baseline flows, counted in the year they
+    start). The daily flags are computed on the whole (..., time) array, then every index is one reduction of its
+    (..., year, 366) layout.
+
+    Args:
+    flows (np.ndarray): Daily flows with shape (..., time) on consecutive days; NaN for missing days.
+    dates (pd.DatetimeIndex or TimeIndex): Dates of the time axis.
+    baseline_period (tuple): (start_year, end_year) defining the pulse thresholds.
+
+    Returns:
+    (np.ndarray, dict): Years, and index name -> values with shape (..., year); NaN for years without data.
+    """
+    time_index = dates if isinstance(dates, TimeIndex) else TimeIndex(dates)
+    flows = np.asarray(flows, dtype=np.float64)
+    change = np.diff(flows, axis=-1, prepend=np.nan)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # Series or years without data
+        low_threshold, high_threshold = np.nanpercentile(flows[..., time_index.year_slice(*baseline_period)], [25, 75], axis=-1)
+
+        daily = _by_year(flows, time_index)
+        has_data = ~np.all(np.isnan(daily), axis=-1)
+        day_of_year = _by_year(time_index.dates.dayofyear.to_numpy(), time_index)
+        lowest = np.argmin(np.where(np.isnan(daily), np.inf, daily), axis=-1)[..., None]
+        highest = np.argmax(np.where(np.isnan(daily), -np.inf, daily), axis=-1)[..., None]
+        yearly_change = _by_year(change, time_index)
+
+        indices = {
+            '1-Day Min': np.nanmin(daily, axis=-1),
+            '7-Day Min': np.nanmin(_by_year(moving_average(flows, 7), time_index), axis=-1),
+            '1-Day Max': np.nanmax(daily, axis=-1),
+            'Date of Min': np.take_along_axis(np.broadcast_to(day_of_year, daily.shape), lowest, axis=-1)[..., 0],
+            'Date of Max': np.take_along_axis(np.broadcast_to(day_of_year, daily.shape), highest, axis=-1)[..., 0],
+            'Rise Rate': np.nanmean(np.where(yearly_change > 0, yearly_change, np.nan), axis=-1),
+            'Fall Rate': np.nanmean(np.where(yearly_change < 0, yearly_change, np.nan), axis=-1),
+            'Reversals': np.nansum(_by_year(_reversals(change), time_index), axis=-1),
+            'Low Pulses': np.nansum(_by_year(_run_starts(flows < low_threshold[..., None]), time_index), axis=-1),
+            'High Pulses': np.nansum(_by_year(_run_starts(flows > high_threshold[..., None]), time_index), axis=-1),
+        }
+    return time_index.years, {name: np.where(has_data, indices[name], np.nan) for name in ANNUAL_INDICES}
+
+
+# Function to estimate the 10-year 7-day low flow (7Q10) from the annual 7-day minima
+def seven_q10(annual_minima):
+    """
+    Fits a log-Pearson type III distribution (moments of the log10 flows, Wilson-Hilferty frequency factor) to the
+    annual 7-day minima of every series and returns its 10-year low flow. Years with zero or missing flow are skipped.
+
+    Args:
+    annual_minima (np.ndarray): Annual 7-day minimum flows with shape (..., year).
+
+    Returns:
+    np.ndarray: 7Q10 with shape (...); NaN for series with fewer than 3 positive minima.
+    """
+    logs = np.log10(np.where(np.asarray(annual_minima, dtype=np.float64) > 0, annual_minima, np.nan))
+    n = np.sum(~np.isnan(logs), axis=-1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean = np.nanmean(logs, axis=-1)
+        std = np.nanstd(logs, axis=-1, ddof=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            skew = n / ((n - 1) * (n - 2)) * np.nansum(((logs - mean[..., None]) / std[..., None]) ** 3, axis=-1)
+            factor = np.where(np.abs(skew) < 1e-6, Z_10_YEAR_LOW,
+                              2 / skew * ((1 + skew * Z_10_YEAR_LOW / 6 - skew ** 2 / 36) ** 3 - 1))
+    return np.where(n >= 3, 10 ** (mean + factor * std), np.nan)
+
+
+# Function to average the annual indices over every period and add the 7Q10 of the period
+def period_flow_indices(years, indices, periods):
+    """
+    Args:
+    years (np.ndarray): Years of the annual indices.
+    indices (dict): Index name -> values with shape (..., year), from annual_flow_indices.
+    periods (dict): Period name -> (start_year, end_year); periods may overlap.
+
+    Returns:
+    dict: Index name (ANNUAL_INDICES and '7Q10') -> values with shape (..., period). Dates are circular means.
+    """
+    masks = np.array([(years >= start_year) & (years <= end_year) for start_year, end_year in periods.values()])
+    result = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # Periods without data
+        for name, values in indices.items():
+            by_period = np.where(masks, values[..., None, :], np.nan)  # (..., period, year)
+            if name in DATE_INDICES:
+                angle = 2 * np.pi * (by_period - 1) / 365.25
+                mean_angle = np.arctan2(np.nanmean(np.sin(angle), axis=-1), np.nanmean(np.cos(angle), axis=-1))
+                result[name] = np.mod(mean_angle, 2 * np.pi) * 365.25 / (2 * np.pi) + 1
+            else:
+                result[name] = np.nanmean(by_period, axis=-1)
+        result['7Q10'] = seven_q10(np.where(masks, indices['7-Day Min'][..., None, :], np.nan))
+    return result
+
+
+# Function to tabulate the low-flow indices of every scenario, period and GCM (plus the ensemble mean flow)
+@timed()
+def low_flow_table(flows, dates, gcms, scenarios, periods, baseline_period=(1984, 2014), ensemble=True):
+    """
+    Computes the period indices of every GCM and scenario in one pass over the (gcm, scenario, time) array.
+
+    Args:
+    flows (np.ndarray): Daily flows with shape (gcm, scenario, time), e.g. cube['Flow'] of an EnsembleCube.
+    dates (pd.DatetimeIndex or TimeIndex): Dates of the time axis.
+    gcms (list of str): GCM names.
+    scenarios (list of str): Scenario names.
+    periods (dict): Period name -> (start_year, end_year).
+    baseline_period (tuple): (start_year, end_year) defining the pulse thresholds.
+    ensemble (bool): Also compute the indices of the ensemble mean flow (GCM 'Ensemble', the series of the e-flow FDCs).
+
+    Returns:
+    pd.DataFrame: Columns 'Scenario', 'Period', 'GCM', then ANNUAL_INDICES (period means) and '7Q10'.
+    """
+    flows = np.asarray(flows, dtype=np.float64)
+    gcms = list(gcms)
+    if ensemble:
+        flows = np.concatenate((flows, flows.mean(axis=0, keepdims=True)), axis=0)
+        gcms = gcms + ['Ensemble']
+    years, indices = annual_flow_indices(flows, dates, baseline_period)
+    by_period = period_flow_indices(years, indices, periods)  # (gcm, scenario, period)
+
+    table = pd.MultiIndex.from_product([scenarios, list(periods), gcms], names=['Scenario', 'Period', 'GCM']).to_frame(index=False)
+    for name, values in by_period.items():
+        table[name] = np.transpose(values, (1, 2, 0)).ravel()
+    return table
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from flow_duration import flow_at_exceedance, flow_duration_curve
+from stats_cache import memoize
+from time_index import TimeIndex
+
+# Scenario labels of the % change tables
+SCENARIO_LABELS = {'SSP245': 'SSP2-4.5', 'SSP585': 'SSP5-8.5'}
+
+
+# Function to compute percentage change
+def percentage_change(future, baseline):
+    return ((future - baseline) / baseline) * 100
+
+
+## DAILY ENSEMBLE MEAN FLOW (return-period and environmental flow scripts)
+
+# Function to get the daily ensemble mean flow of one scenario as a table
+def ensemble_daily_mean(cube, scenario, variable='Flow'):
+    """
+    Args:
+    cube (EnsembleCube): GCM x scenario x day data.
+    scenario (str): Scenario to average (e.g. 'SSP585').
+    variable (str): Variable to average.
+
+    Returns:
+    pd.DataFrame: 'Date' and 'Ensemble_Flow' (mean over the GCMs, one reduction over the GCM axis).
+    """
+    return pd.DataFrame({'Date': cube.dates, 'Ensemble_Flow': cube.ensemble_mean(variable, scenario)})
+
+
+# Function to split a daily table by time periods
+def split_daily_periods(data, periods):
+    """
+    Args:
+    data (pd.DataFrame): Daily table with a 'Date' column.
+    periods (dict): Period name -> (start_year, end_year).
+
+    Returns:
+    dict: Period name -> rows of the period.
+    """
+    # Build the time index once; each period is then a zero-copy slice instead of a full scan
+    time_index = TimeIndex(data['Date'])
+    return {period: data.iloc[time_index.year_slice(start_year, end_year)] for period, (start_year, end_year) in periods.items()}
+
+
+# Function to get the annual maximum of the ensemble mean flow in every period
+def period_annual_max(periods):
+    return {period: df.groupby(df['Date'].dt.year).max()['Ensemble_Flow'] for period, df in periods.items()}
+
+
+# Function to compute the flow duration curve of every period (each period is sorted only once)
+def period_fdcs(periods):
+    return {period: flow_duration_curve(df['Ensemble_Flow'].to_numpy()) for period, df in periods.items()}
+
+
+# Function to tabulate Q90, Q95 and the basic e-flow (their mean) of every period, with the mean over the periods
+def basic_eflow_table(fdcs):
+    """
+    Args:
+    fdcs (dict): Period -> (sorted flows, exceedance probabilities), e.g. from period_fdcs.
+
+    Returns:
+    pd.DataFrame: 'Q90', 'Q95' and 'Basic E-Flow' indexed by 'Period', with a last 'Mean' row.
+    """
+    table = pd.DataFrame({'Q90': [flow_at_exceedance(sorted_flows, 0.90) for sorted_flows, _ in fdcs.values()],
+                          'Q95': [flow_at_exceedance(sorted_flows, 0.95) for sorted_flows, _ in fdcs.values()]},
+                         index=pd.Index(list(fdcs), name='Period'))
+    table['Basic E-Flow'] = (table['Q90'] + table['Q95']) / 2  # Mean of Q90 and Q95
+    table.loc['Mean'] = table.mean()
+    return table
+
+
+## ANNUAL MAXIMUM FLOW OF EVERY GCM (annual-max script)
+
+# Function to tabulate the annual maxima of every GCM per scenario, with a year index per table
+def annual_max_tables(years, annual_max, gcms, scenarios):
+    """
+    Args:
+    years (np.ndarray): Years of the annual maxima.
+    annual_max (np.ndarray): Annual maxima with shape (gcm, scenario, year), e.g. from EnsembleCube.annual_max.
+    gcms (list of str): GCM names.
+    scenarios (list of str): Scenario names.
+
+    Returns:
+    (dict, dict): Scenario -> table with 'Year' and one 'Flow <scenario>_<gcm>' column per GCM (years without an
+    annual maximum in every GCM are dropped), and scenario -> TimeIndex of the table's years.
+    """
+    combined_data = {}
+    year_indexes = {}
+    for s, scenario in enumerate(scenarios):
+        # Ensure no missing data: drop years without an annual maximum in every GCM
+        complete = np.flatnonzero(~np.isnan(annual_max[:, s]).any(axis=0))
+        columns = {'Year': years[complete]}
+        columns.update({f'Flow {scenario}_{gcm}': annual_max[g, s, complete] for g, gcm in enumerate(gcms)})
+        combined_data[scenario] = pd.DataFrame(columns, index=complete)
+        # Built once so every period below is an O(1) row slice of the table
+        year_indexes[scenario] = TimeIndex.from_years(columns['Year'])
+    return combined_data, year_indexes
+
+
+# Function to calculate the ensemble mean annual maximum flow of a period (cached by the contents of the table and the period)
+@memoize('ensemble_mean_annual_max')
+def ensemble_mean_flow(df, year_index, period):
+    subset = df.iloc[year_index.year_slice(*period)]
+    return subset.iloc[:, 1:].mean().mean()
+
+
+# Function to calculate the ensemble mean annual maximum flow of the baseline and every future period
+def average_by_periods(df, year_index, baseline_period, future_periods):
+    """
+    Args:
+    df (pd.DataFrame): Annual maximum flow table of one scenario (from annual_max_tables).
+    year_index (TimeIndex): Year index of the table.
+    baseline_period (tuple): (start_year, end_year) of the baseline.
+    future_periods (dict): Future period name -> (start_year, end_year).
+
+    Returns:
+    dict: 'baseline' and every future period name -> mean annual maximum flow.
+    """
+    averages = {'baseline': ensemble_mean_flow(df, year_index, baseline_period)}
+    for period_name, period_range in future_periods.items():
+        averages[period_name] = ensemble_mean_flow(df, year_index, period_range)
+    return averages
+
+
+# Function to build the table of % change in mean annual max discharge of every scenario
+def percentage_change_table(combined_data, year_indexes, baseline_period, future_periods, period_labels,
+                            scenario_labels=SCENARIO_LABELS):
+    """
+    Args:
+    combined_data (dict): Annual maximum flow tables by scenario (from annual_max_tables).
+    year_indexes (dict): TimeIndex of each table by scenario.
+    baseline_period (tuple): (start_year, end_year) of the baseline.
+    future_periods (dict): Future period name -> (start_year, end_year).
+    period_labels (dict): Future period name -> label in the 'Time Period' column.
+    scenario_labels (dict): Scenario -> label of its column.
+
+    Returns:
+    pd.DataFrame: 'Time Period' and one '<scenario label> % Change' column per scenario.
+    """
+    table = {'Time Period': [period_labels[period] for period in future_periods]}
+    for scenario, df in combined_data.items():
+        averages = average_by_periods(df, year_indexes[scenario], baseline_period, future_periods)
+        baseline_mean = averages.pop('baseline')
+        table[f'{scenario_labels.get(scenario, scenario)} % Change'] = [percentage_change(future_mean, baseline_mean)
+                                                                         for future_mean in averages.values()]
+    return pd.DataFrame(table)
+
+
+## MONTHLY MEAN FLOW (line graph and box plots)
+
+# Function to tabulate the ensemble mean monthly flow of every period (months as rows, periods as columns)
+def ensemble_monthly_table(store, column, periods):
+    """
+    Args:
+    store (GCMAggregateStore): Per-GCM aggregates holding the column.
+    column (str): Value column (e.g. 'Flow SSP245').
+    periods (dict): Period name -> (start_year, end_year).
+
+    Returns:
+    pd.DataFrame: Ensemble mean flow of every month (index 'Month', 1-12) and period (one column each).
+    """
+    return pd.DataFrame({period: store.ensemble_monthly_mean(column, years) for period, years in periods.items()})
+
+
+# Function to compute the % change of every future period's monthly flows relative to the baseline
+def monthly_percentage_change(monthly_table, baseline='baseline'):
+    """
+    Args:
+    monthly_table (pd.DataFrame): Monthly flows with one column per period (e.g. from ensemble_monthly_table).
+    baseline (str): Column of the baseline period.
+
+    Returns:
+    pd.DataFrame: % change of every month (rows) and future period (columns).
+    """
+    return percentage_change(monthly_table.drop(columns=baseline), monthly_table[baseline].to_numpy()[:, None])
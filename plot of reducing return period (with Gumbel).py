@@ -1,35 +1,56 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from ensemble_cube import load_ensemble_cube
+from extreme_value import RETURN_PERIODS, bootstrap_return_levels, ensemble_return_levels, return_levels
+from period_stats import ensemble_daily_mean, period_annual_max, split_daily_periods
+from study_periods import DAILY_PERIODS
+from figure_export import new_figure, show_figure, scenario_title
+from instrumentation import timed
+
+# Define the baseline and future periods (shared with the e-flow script and the stats command line; edit them in study_periods.py)
+time_periods = DAILY_PERIODS
+
+# Define the file paths for the GCMs (add more paths as needed)
+file_paths = [
+    "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble\Amalshid Simulation Flow data/BCC-CSM2-MR.xlsx",
+    "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble\Amalshid Simulation Flow data/MPI-ESM1-2-HR.xlsx",
+    "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble\Amalshid Simulation Flow data/MPI-ESM1-2-LR.xlsx",
+    "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\ACCESS-CM2.xlsx",
+    "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\ACCESS-ESM1-5.xlsx",
+    "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\CanESM5.xlsx",
+    "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\EC-Earth3.xlsx",
+    "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\EC-Earth3-Veg.xlsx",
+    r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\INM-CM4-8.xlsx",
+    r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\INM-CM5-0.xlsx",
+    r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\MRI-ESM2-0.xlsx",
+    r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\NorESM2-LM.xlsx",
+    r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\NorESM2-MM.xlsx"
+]
 
 # Function to load and process the GCM data
-def load_gcm_data(file_paths, scenario_column):
+@timed()
+def load_gcm_data(file_paths, scenario_column, max_workers=None):
     """
     Loads GCM data from multiple files and returns a dataframe with ensemble average.
     
     Args:
     file_paths (list of str): Paths to GCM data files.
     scenario_column (str): The column name of the scenario to use (e.g., 'Flow SSP585' or 'Flow SSP245').
+    max_workers (int, optional): Number of worker processes used to read the files (1 reads them sequentially).
     
     Returns:
     pd.DataFrame: Ensemble-averaged flow data.
     """
-    # Initialize an empty list to hold individual GCM dataframes
-    gcm_dataframes = []
-
-    # Load each GCM data file into a pandas DataFrame and append it to the list
-    for file_path in file_paths:
-        gcm_df = pd.read_excel(file_path)
-        gcm_df['Date'] = pd.to_datetime(gcm_df['Date'])  # Convert 'Date' to datetime
-        gcm_dataframes.append(gcm_df[['Date', scenario_column]])
+    # Load the GCM data files in parallel and stack them into a GCM x scenario x day cube (aligned by 'Date')
+    variable, scenario = scenario_column.split(' ', 1)
+    cube = load_ensemble_cube(file_paths, [scenario], variables=(variable,), max_workers=max_workers)
 
-    # Concatenate all GCM data along the columns (align by 'Date')
-    ensemble_data = pd.DataFrame({'Date': gcm_dataframes[0]['Date']})  # Start with the date column
-    ensemble_data['Ensemble_Flow'] = sum(df[scenario_column] for df in gcm_dataframes) / len(gcm_dataframes)  # Ensemble average
-
-    return ensemble_data
+    # Ensemble average as a single reduction over the GCM axis
+    return ensemble_daily_mean(cube, scenario, variable)
 
 # Function to separate data by time periods
+@timed()
 def split_by_periods(data):
     """
     Splits the ensemble data into baseline, near future, mid future, and far future periods.
@@ -40,15 +61,10 @@ def split_by_periods(data):
     Returns:
     dict: Dictionary containing separated periods.
     """
-    periods = {
-        'Baseline (1984-2014)': data[(data['Date'] >= '1984-01-01') & (data['Date'] <= '2014-12-31')],
-        'Near Future (2015-2040)': data[(data['Date'] >= '2015-01-01') & (data['Date'] <= '2040-12-31')],
-        'Mid Future (2041-2071)': data[(data['Date'] >= '2041-01-01') & (data['Date'] <= '2071-12-31')],
-        'Far Future (2070-2100)': data[(data['Date'] >= '2070-01-01') & (data['Date'] <= '2100-12-31')]
-    }
-    return periods
+    return split_daily_periods(data, time_periods)
 
 # Function to calculate the annual maximum flows for each period
+@timed()
 def calculate_annual_max(periods):
     """
     Calculate the annual maximum flow for each time period.
@@ -59,58 +75,145 @@ def calculate_annual_max(periods):
     Returns:
     dict: Dictionary of annual maximum flows.
     """
-    annual_max_flows = {period: df.groupby(df['Date'].dt.year).max()['Ensemble_Flow'] for period, df in periods.items()}
-    return annual_max_flows
+    return period_annual_max(periods)
 
 # Function to fit Gumbel distribution and plot the return periods
-def fit_gumbel_and_plot(annual_max_flows):
+@timed()
+def fit_gumbel_and_plot(annual_max_flows, method='lmom', n_boot=1000, title='Extreme Scenario'):
     """
     Fits the Gumbel distribution and plots return periods for each time period.
+    The fitted curve is drawn with its bootstrap confidence band, and the empirical (Weibull) plotting positions as markers.
     
     Args:
     annual_max_flows (dict): Dictionary containing annual maximum flows for each period.
+    method (str): Fitting method, 'lmom' (L-moments) or 'mle' (maximum likelihood).
+    n_boot (int): Number of bootstrap resamples for the 95% confidence band.
+    title (str): Title of the plot.
     """
-    plt.figure(figsize=(10, 6))
+    new_figure(figsize=(10, 6))
+    curve_return_periods = np.logspace(np.log10(1.01), np.log10(max(RETURN_PERIODS)), 200)
     
     for period, max_flows in annual_max_flows.items():
         sorted_flows = np.sort(max_flows)
         exceedance_probabilities = 1 - np.arange(1, len(sorted_flows) + 1) / (len(sorted_flows) + 1)
         return_periods = 1 / exceedance_probabilities
-        plt.plot(return_periods, sorted_flows, label=period)
+
+        # Fitted Gumbel curve with its 95% bootstrap band (all resamples fitted in one batched pass)
+        fitted_flows, lower, upper = bootstrap_return_levels(max_flows, 'gumbel', method, curve_return_periods, n_boot=n_boot, seed=0)
+        line, = plt.plot(curve_return_periods, fitted_flows, label=period)
+        plt.fill_between(curve_return_periods, lower, upper, color=line.get_color(), alpha=0.15)
+        plt.scatter(return_periods, sorted_flows, color=line.get_color(), s=12)
         
     
     plt.xscale('log')
-    plt.title('Extreme Scenario',fontsize=15)
+    plt.title(title,fontsize=15)
+    plt.xlabel('Return Period (years)',fontsize=14)
+    plt.ylabel('Flow (m³/s)',fontsize=14)
+    plt.grid(True, which='both', linestyle='--', linewidth=0.5)
+    plt.legend(fontsize=13,loc='upper left')
+    show_figure('return_period')
+
+# Function to calculate the design floods (with bootstrap confidence bands) for each period
+@timed()
+def calculate_design_floods(annual_max_flows, distributions=('gumbel', 'gev'), method='lmom', n_boot=1000):
+    """
+    Fits each distribution to the annual maximum flows of every period and tabulates the design floods.
+    
+    Args:
+    annual_max_flows (dict): Dictionary containing annual maximum flows for each period.
+    distributions (tuple of str): Distributions to fit ('gumbel' and/or 'gev').
+    method (str): Fitting method of the design floods, 'lmom' (L-moments) or 'mle' (maximum likelihood; the bootstrap
+    resamples of GEV are always fitted with L-moments, so only its bands do not follow the method).
+    n_boot (int): Number of bootstrap resamples.
+    
+    Returns:
+    pd.DataFrame: One row per period, distribution and return period with the design flood and its 95% band.
+    """
+    rows = []
+    for period, max_flows in annual_max_flows.items():
+        for distribution in distributions:
+            band_method = 'lmom' if distribution == 'gev' else method
+            flows, lower, upper = bootstrap_return_levels(max_flows, distribution, band_method, RETURN_PERIODS, n_boot=n_boot, seed=0)
+            if band_method != method:
+                # The design floods themselves are fitted with the requested method
+                max_flows = np.asarray(max_flows, dtype=np.float64)
+                flows = return_levels(max_flows[~np.isnan(max_flows)], distribution, method, RETURN_PERIODS)
+            for return_period, flow, low, high in zip(RETURN_PERIODS, flows, lower, upper):
+                rows.append({'Period': period, 'Distribution': distribution, 'Return Period (years)': return_period,
+                             'Flow (m³/s)': flow, 'Lower 95%': low, 'Upper 95%': high})
+    return pd.DataFrame(rows)
+
+# Function to calculate the return levels of every GCM, scenario and period in one batched pass
+@timed()
+def calculate_per_gcm_return_levels(file_paths, scenarios=('SSP245', 'SSP585'), distribution='gumbel', method='lmom'):
+    """
+    Fits return levels to the annual maxima of each GCM (instead of the annual maxima of the ensemble mean flow).
+    
+    Args:
+    file_paths (list of str): Paths to GCM data files.
+    scenarios (tuple of str): Scenarios to analyze.
+    distribution (str): Distribution to fit ('gumbel' or 'gev').
+    method (str): Fitting method, 'lmom' (L-moments) or 'mle' (maximum likelihood).
+    
+    Returns:
+    (pd.DataFrame, pd.DataFrame): Tidy table of return levels per GCM, scenario, period and return period,
+    and the median and 2.5th/97.5th percentiles of the return levels across GCMs.
+    """
+    # Annual maxima of every GCM and scenario from one reduction over the ensemble cube
+    cube = load_ensemble_cube(file_paths, list(scenarios))
+    years, annual_max = cube.annual_max('Flow')
+    levels, bands = ensemble_return_levels(annual_max, years, time_periods, distribution, method)
+
+    index = pd.MultiIndex.from_product([cube.gcms, scenarios, list(time_periods), RETURN_PERIODS],
+                                       names=['GCM', 'Scenario', 'Period', 'Return Period (years)'])
+    table = pd.DataFrame({'Flow (m³/s)': levels.ravel()}, index=index).reset_index()
+
+    band_index = pd.MultiIndex.from_product([scenarios, list(time_periods), RETURN_PERIODS],
+                                            names=['Scenario', 'Period', 'Return Period (years)'])
+    band_table = pd.DataFrame({'2.5th': bands[0].ravel(), 'Median': bands[1].ravel(), '97.5th': bands[2].ravel()},
+                              index=band_index).reset_index()
+    return table, band_table
+
+# Function to plot the median return level across GCMs with its 2.5th-97.5th percentile band
+@timed()
+def plot_per_gcm_return_levels(band_table, scenario):
+    """
+    Plots the spread of return levels across GCMs for each time period.
+    
+    Args:
+    band_table (pd.DataFrame): Percentiles of the return levels across GCMs (from calculate_per_gcm_return_levels).
+    scenario (str): Scenario to plot ('SSP585' or 'SSP245').
+    """
+    new_figure(figsize=(10, 6))
+    
+    for period, bands in band_table[band_table['Scenario'] == scenario].groupby('Period', sort=False):
+        line, = plt.plot(bands['Return Period (years)'], bands['Median'], marker='o', label=period)
+        plt.fill_between(bands['Return Period (years)'], bands['2.5th'], bands['97.5th'], color=line.get_color(), alpha=0.15)
+    
+    plt.xscale('log')
+    plt.title(scenario_title(scenario), fontsize=15)
     plt.xlabel('Return Period (years)',fontsize=14)
     plt.ylabel('Flow (m³/s)',fontsize=14)
     plt.grid(True, which='both', linestyle='--', linewidth=0.5)
     plt.legend(fontsize=13,loc='upper left')
-    plt.show()
+    show_figure('return_period_per_gcm')
 
 # Main function to execute the workflow
-def main(scenario='SSP585'):
+def main(scenario='SSP585', per_gcm=False):
     """
     Main function to calculate and plot return periods for a given scenario.
     
     Args:
     scenario (str): Scenario to analyze ('SSP585' or 'SSP245').
+    per_gcm (bool): Fit every GCM separately and show the spread across GCMs instead of fitting the ensemble mean flow.
     """
-    # Define the file paths for the GCMs
-    file_paths = [
-         "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble\Amalshid Simulation Flow data/BCC-CSM2-MR.xlsx",
-         "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble\Amalshid Simulation Flow data/MPI-ESM1-2-HR.xlsx",
-         "D:/Turjo/Model with Amalshid/Data/RESULTs/For ensemble\Amalshid Simulation Flow data/MPI-ESM1-2-LR.xlsx",
-         "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\ACCESS-CM2.xlsx",
-         "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\ACCESS-ESM1-5.xlsx",
-         "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\CanESM5.xlsx",
-         "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\EC-Earth3.xlsx",
-         "D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\EC-Earth3-Veg.xlsx",
-         r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\INM-CM4-8.xlsx",
-         r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\INM-CM5-0.xlsx",
-         r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\MRI-ESM2-0.xlsx",
-         r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\NorESM2-LM.xlsx",
-         r"D:\Turjo\Model with Amalshid\Data\RESULTs\For ensemble\Amalshid Simulation Flow data\NorESM2-MM.xlsx"
-    ]
+    
+    if per_gcm:
+        # Return levels for every GCM, scenario and period, summarised across GCMs
+        table, band_table = calculate_per_gcm_return_levels(file_paths)
+        print(band_table[band_table['Scenario'] == scenario])
+        plot_per_gcm_return_levels(band_table, scenario)
+        return table, band_table
     
     # Choose the scenario column based on the selected scenario
     scenario_column = f"Flow {scenario}"
@@ -125,8 +228,11 @@ def main(scenario='SSP585'):
     annual_max_flows = calculate_annual_max(periods)
     
     # Fit Gumbel distribution and plot return periods
-    fit_gumbel_and_plot(annual_max_flows)
+    fit_gumbel_and_plot(annual_max_flows, title=scenario_title(scenario))
+    
+    # Display the design floods for the 2- to 100-year return periods
+    print(calculate_design_floods(annual_max_flows))
 
 # Run the main function for SSP5-8.5 scenario
 if __name__ == '__main__':
-    main(scenario='SSP585')  # Change to 'SSP245' for the other scenario
+    main(scenario='SSP585')  # Change to 'SSP245' for the other scenario, or pass per_gcm=True for the GCM spread
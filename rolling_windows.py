@@ -0,0 +1,141 @@
+import warnings
+
+import numpy as np
+
+from instrumentation import timed
+
+
+# Function to list the start years of every window that fits between start_year and end_year
+def window_starts(start_year=2015, end_year=2100, window=30):
+    return np.arange(start_year, end_year - window + 2)
+
+
+# Function to total every window along the last (year) axis with one cumulative sum
+def _window_totals(values, years, starts, window):
+    """
+    Sums values over the years of every window; each window is the difference of two cumulative sums, so it costs
+    O(1) whatever its length. Windows are clipped to the years on record.
+
+    Args:
+    values (np.ndarray): Yearly values with shape (..., year); use 0 for missing years.
+    years (np.ndarray): Consecutive years of the last axis.
+    starts (np.ndarray): Start year of every window.
+    window (int): Window length in years.
+
+    Returns:
+    np.ndarray: Window totals with shape (..., window).
+    """
+    cumulative = np.concatenate((np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis=-1)), axis=-1)
+    lo = np.clip(np.asarray(starts) - years[0], 0, len(years))
+    hi = np.clip(np.asarray(starts) + window - years[0], 0, len(years))
+    return cumulative[..., hi] - cumulative[..., lo]
+
+
+# Function to compute the percentage change of the mean monthly flow in every rolling window, for every GCM
+@timed()
+def rolling_monthly_change(month_sum, month_count, years, baseline_period=(1984, 2014), start_year=2015, end_year=2100, window=30):
+    """
+    Computes the % change in mean monthly flow of every rolling window relative to the baseline period.
+
+    Args:
+    month_sum (np.ndarray): Sum of the daily flows of every (GCM, year, month), shape (gcm, year, 12).
+    month_count (np.ndarray): Number of daily values of every (GCM, year, month), same shape.
+    years (np.ndarray): Consecutive years of the year axis.
+    baseline_period (tuple): (start_year, end_year) of the baseline.
+    start_year (int): Start of the first window.
+    end_year (int): End of the last window.
+    window (int): Window length in years.
+
+    Returns:
+    (np.ndarray, np.ndarray, np.ndarray): Window start years; % change of every GCM with shape (window, month, gcm);
+    and % change of the ensemble mean monthly flow with shape (window, month).
+    """
+    starts = window_starts(start_year, end_year, window)
+    # Years on the last axis: (gcm, month, year)
+    sums = np.moveaxis(np.asarray(month_sum, dtype=np.float64), 1, -1)
+    counts = np.moveaxis(np.asarray(month_count, dtype=np.float64), 1, -1)
+    baseline_start, baseline_end = baseline_period
+    baseline_length = baseline_end - baseline_start + 1
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        window_means = _window_totals(sums, years, starts, window) / _window_totals(counts, years, starts, window)
+        baseline_means = (_window_totals(sums, years, [baseline_start], baseline_length)
+                          / _window_totals(counts, years, [baseline_start], baseline_length))
+        change = (window_means - baseline_means) / baseline_means * 100
+
+        # Ensemble change from the ensemble mean flows, as in the box-plot and line-graph scripts
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)  # Months without data in any GCM
+            ensemble_window = np.nanmean(window_means, axis=0)
+            ensemble_baseline = np.nanmean(baseline_means, axis=0)
+        ensemble_change = (ensemble_window - ensemble_baseline) / ensemble_baseline * 100
+
+    return starts, np.transpose(change, (2, 1, 0)), ensemble_change.T
+
+
+# Function to compute the percentage change of the mean annual maximum flow in every rolling window, for every GCM
+@timed()
+def rolling_annual_max_change(annual_max, years, baseline_period=(1984, 2014), start_year=2015, end_year=2100, window=30):
+    """
+    Computes the % change in mean annual maximum flow of every rolling window relative to the baseline period.
+
+    Args:
+    annual_max (np.ndarray): Annual maxima with shape (gcm, year); NaN for years without data.
+    years (np.ndarray): Consecutive years of the year axis.
+    baseline_period (tuple): (start_year, end_year) of the baseline.
+    start_year (int): Start of the first window.
+    end_year (int): End of the last window.
+    window (int): Window length in years.
+
+    Returns:
+    (np.ndarray, np.ndarray, np.ndarray): Window start years; % change of every GCM with shape (window, gcm);
+    and % change of the ensemble mean with shape (window,).
+    """
+    starts = window_starts(start_year, end_year, window)
+    annual_max = np.asarray(annual_max, dtype=np.float64)
+    valid = ~np.isnan(annual_max)
+    values = np.where(valid, annual_max, 0.0)
+    baseline_start, baseline_end = baseline_period
+    baseline_length = baseline_end - baseline_start + 1
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        window_means = _window_totals(values, years, starts, window) / _window_totals(valid, years, starts, window)
+        baseline_means = (_window_totals(values, years, [baseline_start], baseline_length)
+                          / _window_totals(valid, years, [baseline_start], baseline_length))
+        change = (window_means - baseline_means) / baseline_means * 100
+
+        # Ensemble change from the ensemble mean, as in the annual-max script
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)  # Windows without data in any GCM
+            ensemble_window = np.nanmean(window_means, axis=0)
+            ensemble_baseline = np.nanmean(baseline_means, axis=0)
+        ensemble_change = (ensemble_window - ensemble_baseline) / ensemble_baseline * 100
+
+    return starts, change.T, ensemble_change
+
+
+# Function to find the first window from which the change signal stays robust
+def time_of_emergence(starts, change, threshold=10.0, agreement=0.8):
+    """
+    Finds the time of emergence: the first window from which the median change across GCMs exceeds the threshold
+    (in absolute value) with at least `agreement` of the GCMs agreeing on its sign, in that and every later window.
+
+    Args:
+    starts (np.ndarray): Window start years.
+    change (np.ndarray): % change with shape (window, ..., gcm).
+    threshold (float): Minimum absolute median change (%).
+    agreement (float): Minimum fraction of GCMs with the sign of the median change.
+
+    Returns:
+    np.ndarray: Start year of the emergence window with shape (...); NaN where the signal never emerges.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        median = np.nanmedian(change, axis=-1)
+    same_sign = np.mean(np.sign(change) == np.sign(median)[..., None], axis=-1)
+    emerged = (np.abs(median) >= threshold) & (same_sign >= agreement)
+
+    # Keep only windows after which the signal never drops out again
+    persistent = np.flip(np.logical_and.accumulate(np.flip(emerged, axis=0), axis=0), axis=0)
+    first = np.argmax(persistent, axis=0)
+    return np.where(persistent.any(axis=0), np.asarray(starts)[first], np.nan)
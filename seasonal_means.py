@@ -0,0 +1,149 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from gcm_io import iter_gcm_ensemble
+from instrumentation import timed
+
+# Seasons based on Bangladesh and India's climate pattern (codes 0-3 in this order)
+SEASONS = ['Winter (DJF)', 'Pre-Monsoon (MAM)', 'Monsoon (JJAS)', 'Post-Monsoon (ON)']
+
+# Lookup array from month number (1-12) to season code; index 0 is unused
+MONTH_TO_SEASON = np.array([-1, 0, 0, 1, 1, 1, 2, 2, 2, 2, 3, 3, 0], dtype=np.int8)
+
+# Workbook column prefixes and the labels used in the figures
+VARIABLES = {
+    'PRECIPmm': 'Precipitation (mm)',
+    'Etmm': 'Evapotranspiration (mm)',
+    'SWmm': 'Soil Water Content (mm)'
+}
+
+
+# Function to build a year -> period code lookup array (-1 for years outside every period)
+def build_period_lookup(time_periods, first_year, last_year):
+    """
+    Builds a lookup array mapping (year - first_year) to the position of its period in time_periods.
+
+    Args:
+    time_periods (dict): Period name -> (start_year, end_year), inclusive. Periods must not overlap.
+    first_year (int): First year covered by the lookup.
+    last_year (int): Last year covered by the lookup.
+
+    Returns:
+    np.ndarray: int16 array of period codes, -1 where a year belongs to no period.
+    """
+    lookup = np.full(last_year - first_year + 1, -1, dtype=np.int16)
+    for code, (start_year, end_year) in enumerate(time_periods.values()):
+        lo = max(start_year, first_year) - first_year
+        hi = min(end_year, last_year) - first_year
+        if hi < lo:
+            continue
+        if (lookup[lo:hi + 1] >= 0).any():
+            raise ValueError('Seasonal periods must not overlap')
+        lookup[lo:hi + 1] = code
+    return lookup
+
+
+# Function to compute the seasonal means of one GCM for every scenario, period and variable in a single pass
+@timed()
+def compute_gcm_seasonal_means(df, scenarios, time_periods):
+    """
+    Computes the seasonal means of every variable for all scenarios and periods with one grouped aggregation.
+
+    Args:
+    df (pd.DataFrame): GCM data with 'Date' and '<variable> <scenario>' columns.
+    scenarios (list of str): Scenarios to include (e.g., ['SSP245', 'SSP585']).
+    time_periods (dict): Period name -> (start_year, end_year).
+
+    Returns:
+    np.ndarray: Means with shape (scenario, period, season, variable); NaN where there is no data.
+    """
+    years = df['Date'].dt.year.to_numpy()
+    months = df['Date'].dt.month.to_numpy()
+
+    first_year = int(years.min())
+    period_codes = build_period_lookup(time_periods, first_year, int(years.max()))[years - first_year]
+    season_codes = MONTH_TO_SEASON[months]
+    keep = period_codes >= 0
+    group_codes = period_codes[keep].astype(np.int64) * len(SEASONS) + season_codes[keep]
+
+    columns = [f'{variable} {scenario}' for scenario in scenarios for variable in VARIABLES]
+    values = pd.DataFrame(df[columns].to_numpy(dtype=np.float64)[keep])
+    grouped = values.groupby(group_codes).mean()  # NaN values are skipped, as in the per-period groupby
+    grouped = grouped.reindex(range(len(time_periods) * len(SEASONS)))
+
+    # (period * season, scenario * variable) -> (scenario, period, season, variable)
+    means = grouped.to_numpy().reshape(len(time_periods), len(SEASONS), len(scenarios), len(VARIABLES))
+    return means.transpose(2, 0, 1, 3)
+
+
+# Function to load every GCM once and compute all of its seasonal means
+@timed()
+def load_seasonal_means(gcm_files, scenarios, time_periods, max_workers=None, compact=False):
+    """
+    Reads each GCM workbook once and computes its seasonal means for every scenario, period and variable.
+
+    Args:
+    gcm_files (dict): GCM name -> workbook path.
+    scenarios (list of str): Scenarios to include.
+    time_periods (dict): Period name -> (start_year, end_year).
+    max_workers (int, optional): Number of worker processes used to read the workbooks.
+    compact (bool): Read the daily values as float32 (the means are still accumulated in float64).
+
+    Returns:
+    np.ndarray: Means with shape (gcm, scenario, period, season, variable).
+    """
+    columns = ['Date'] + [f'{variable} {scenario}' for scenario in scenarios for variable in VARIABLES]
+    # Each GCM is reduced as soon as it is read, so only one daily table is held at a time
+    gcm_data = iter_gcm_ensemble(list(gcm_files.values()), columns=columns, max_workers=max_workers, compact=compact)
+    return np.stack([compute_gcm_seasonal_means(df, scenarios, time_periods) for _, df in gcm_data])
+
+
+# Function to load the seasonal means of every single year (the yearly series of the seasonal trend tests)
+def load_yearly_seasonal_means(gcm_files, scenarios, first_year, last_year, max_workers=None, compact=False):
+    """
+    Computes the seasonal means of every year from first_year to last_year, treating each year as its own period.
+
+    Args:
+    gcm_files (dict): GCM name -> workbook path.
+    scenarios (list of str): Scenarios to include.
+    first_year (int): First year.
+    last_year (int): Last year.
+    max_workers (int, optional): Number of worker processes used to read the workbooks.
+    compact (bool): Read the daily values as float32.
+
+    Returns:
+    np.ndarray: Means with shape (gcm, scenario, year, season, variable).
+    """
+    years = {str(year): (year, year) for year in range(first_year, last_year + 1)}
+    return load_seasonal_means(gcm_files, scenarios, years, max_workers, compact)
+
+
+# Function to turn the seasonal means of one scenario into the ensemble table used for plotting
+def ensemble_seasonal_table(seasonal_means, scenarios, scenario, time_periods):
+    """
+    Averages the per-GCM seasonal means across the ensemble for one scenario.
+
+    Args:
+    seasonal_means (np.ndarray): Output of load_seasonal_means, shape (gcm, scenario, period, season, variable).
+    scenarios (list of str): Scenarios in the order used to build seasonal_means.
+    scenario (str): Scenario to tabulate.
+    time_periods (dict): Period name -> (start_year, end_year), in the order used to build seasonal_means.
+
+    Returns:
+    pd.DataFrame: Seasons as index, one column per variable plus 'Period', one block of rows per period.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Seasons without data in any GCM stay NaN
+        ensemble = np.nanmean(seasonal_means[:, scenarios.index(scenario)], axis=0)  # (period, season, variable)
+
+    # Seasons are listed alphabetically, matching the ensemble groupby('Season').mean() of the per-file loader
+    season_order = np.argsort(SEASONS)
+    tables = []
+    for code, period_name in enumerate(time_periods):
+        table = pd.DataFrame(ensemble[code][season_order], columns=list(VARIABLES.values()),
+                             index=pd.Index([SEASONS[i] for i in season_order], name='Season'))
+        table['Period'] = period_name
+        tables.append(table)
+    return pd.concat(tables)
@@ -0,0 +1,49 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+from instrumentation import timed
+
+
+# Function to build the matrix that maps 12 monthly values to a smooth periodic curve (built once per grid)
+@lru_cache(maxsize=None)
+def periodic_spline_basis(n_points=500, n_months=12):
+    """
+    Builds the periodic cubic spline basis of a monthly cycle: row i holds the weights of the 12 monthly values
+    at point i of an even grid from month 1 to month 12. The spline wraps from December back to January, so the
+    curve has no seam at the year boundary.
+
+    Args:
+    n_points (int): Number of points of the smooth grid.
+    n_months (int): Number of values per cycle.
+
+    Returns:
+    (np.ndarray, np.ndarray): The grid (n_points,) and the basis (n_points, n_months), both read-only.
+    """
+    months = np.arange(1, n_months + 2)
+    # A spline is linear in its values, so splining the unit vectors gives the weights of every value
+    unit_values = np.vstack((np.eye(n_months), np.eye(n_months)[:1]))  # January repeated one period later
+    grid = np.linspace(1, n_months, n_points)
+    basis = CubicSpline(months, unit_values, bc_type='periodic')(grid)
+    grid.flags.writeable = False
+    basis.flags.writeable = False
+    return grid, basis
+
+
+# Function to smooth any number of monthly series in one matrix multiply
+@timed()
+def smooth_monthly(values, n_points=500):
+    """
+    Smooths monthly series with the periodic cubic spline basis.
+
+    Args:
+    values (array-like): Monthly values with shape (..., 12), e.g. (period, GCM, 12).
+    n_points (int): Number of points of the smooth grid.
+
+    Returns:
+    (np.ndarray, np.ndarray): The grid (n_points,) and the smooth series with shape (..., n_points).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    grid, basis = periodic_spline_basis(n_points, values.shape[-1])
+    return grid, values @ basis.T
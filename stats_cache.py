@@ -0,0 +1,228 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+
+# Function to feed an object's contents into a hash (arrays, pandas objects, containers and plain objects)
+def _update_digest(digest, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        digest.update(type(obj).__name__.encode())
+        if isinstance(obj, pd.DataFrame):
+            digest.update(repr(list(obj.columns)).encode())
+        elif isinstance(obj, pd.Series):
+            digest.update(repr(obj.name).encode())
+        digest.update(pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index)).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        digest.update(f'ndarray{obj.dtype.str}{obj.shape}'.encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        digest.update(b'dict')
+        for key in sorted(obj, key=repr):
+            digest.update(repr(key).encode())
+            _update_digest(digest, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        digest.update(f'{type(obj).__name__}{len(obj)}'.encode())
+        for item in obj:
+            _update_digest(digest, item)
+    elif hasattr(obj, '__dict__') and not callable(obj):
+        # Plain objects (e.g. a TimeIndex) are fingerprinted by their public attributes
+        digest.update(type(obj).__name__.encode())
+        _update_digest(digest, {name: value for name, value in vars(obj).items() if not name.startswith('_')})
+    else:
+        digest.update(repr(obj).encode())
+
+
+# Function to fingerprint the data a statistic is computed from
+def data_fingerprint(*objects):
+    """
+    Hashes the contents (not the identity) of the given objects, so equal inputs give equal fingerprints
+    across calls, scripts and processes.
+
+    Args:
+    objects: DataFrames, Series, arrays, containers of them, or plain values.
+
+    Returns:
+    str: Hex digest.
+    """
+    digest = hashlib.sha1()
+    _update_digest(digest, objects)
+    return digest.hexdigest()
+
+
+# Function to estimate the memory held by a cached value
+def _size_of(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size_of(key) + _size_of(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size_of(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class StatsCache:
+    """
+    Cache of computed statistics keyed by (statistic, fingerprint of the input data).
+
+    Values live in an in-process LRU bounded by max_bytes, and optionally in an on-disk cache (one pickle per key,
+    bounded by max_disk_bytes and evicted by last use) that is shared between scripts and runs. Cached values are
+    returned as is, so callers must not modify them in place.
+    """
+
+    def __init__(self, max_bytes=256 << 20, disk_dir=None, max_disk_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()  # key -> (value, size), least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Statistics can be requested from several threads at once (e.g. by the steps of an analysis graph)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Function to get a statistic from the cache, computing (and storing) it on a miss
+    def get_or_compute(self, statistic, fingerprint, compute):
+        """
+        Returns the cached value of a statistic, or computes and caches it.
+
+        Args:
+        statistic (str): Name of the statistic (e.g. 'ensemble_mean').
+        fingerprint (str): Fingerprint of the input data (see data_fingerprint).
+        compute (callable): Function without arguments that computes the value.
+
+        Returns:
+        The value of the statistic.
+        """
+        key = hashlib.sha1(f'{statistic}:{fingerprint}'.encode()).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        path = os.path.join(self.disk_dir, f'{key}.pkl') if self.disk_dir else None
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'rb') as handle:
+                    value = pickle.load(handle)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                value = None  # Unreadable entry (e.g. from an interrupted write): compute it again
+            else:
+                try:
+                    os.utime(path)  # Marks the entry as recently used for the disk eviction
+                except FileNotFoundError:
+                    pass  # Evicted by another process sharing the directory in the meantime
+                self.disk_hits += 1
+                self._store(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        self._store(key, value)
+        if path is not None:
+            self._write_disk(path, value)
+        return value
+
+    # Function to keep a value in memory, evicting the least recently used entries beyond max_bytes
+    def _store(self, key, value):
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:  # Computed by another thread in the meantime
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    # Function to write a value to the disk cache, evicting the least recently used files beyond max_disk_bytes
+    def _write_disk(self, path, value):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        # Written under a name of its own (per process and thread) and moved into place in one step, so readers
+        # never see a partly written pickle
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as handle:
+            pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+        # Other processes sharing the directory (e.g. the batch_export and basin_pipeline workers) can remove
+        # files while they are scanned here: those are skipped
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, file_path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            total -= size
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    # Function to empty the in-memory cache (the disk cache is kept)
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    # Function to report the cache counters
+    def info(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'nbytes': self.nbytes}
+
+    # Decorator that caches a function's result by the fingerprint of its arguments
+    def memoize(self, statistic, key=None):
+        """
+        Caches the results of a statistic function.
+
+        Args:
+        statistic (str): Name of the statistic, shared by functions that compute the same value.
+        key (callable, optional): Maps the function's arguments to the data to fingerprint (defaults to all arguments),
+        e.g. to fingerprint only the part of a larger structure the statistic reads.
+
+        Returns:
+        callable: The decorator.
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                data = key(*args, **kwargs) if key is not None else (args, kwargs)
+                return self.get_or_compute(statistic, data_fingerprint(data), lambda: function(*args, **kwargs))
+            return wrapper
+        return decorator
+
+
+# Cache shared by the scripts; set GCM_STATS_CACHE_DIR to also keep the statistics on disk between runs
+default_cache = StatsCache(disk_dir=os.environ.get('GCM_STATS_CACHE_DIR') or None)
+
+
+# Decorator that caches a statistic in the shared cache
+def memoize(statistic, key=None):
+    return default_cache.memoize(statistic, key)
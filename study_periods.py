@@ -0,0 +1,66 @@
+# Baseline and future periods of every analysis: period name -> (start_year, end_year), both years included.
+# The scripts and the analysis graph (and with it the stats command line) all read them from here, so the
+# figures and the exported tables always cover the same years.
+
+# Annual maximum flow: baseline, future periods and the labels of the % change table
+ANNUAL_MAX_BASELINE = (1984, 2014)
+ANNUAL_MAX_FUTURE_PERIODS = {
+    'near_future': (2015, 2040),
+    'mid_future': (2041, 2070),
+    'far_future': (2071, 2100)
+}
+ANNUAL_MAX_PERIOD_LABELS = {
+    'near_future': 'Near Future (2015-2040)',
+    'mid_future': 'Mid-Future (2041-2070)',
+    'far_future': 'Far Future (2071-2100)'
+}
+
+# Daily ensemble mean flow of the return-period and environmental flow scripts
+DAILY_PERIODS = {
+    'Baseline (1984-2014)': (1984, 2014),
+    'Near Future (2015-2040)': (2015, 2040),
+    'Mid Future (2041-2071)': (2041, 2071),
+    'Far Future (2070-2100)': (2070, 2100)
+}
+
+# Ensemble mean monthly discharge of the line graph
+LINE_GRAPH_PERIODS = {
+    'baseline': (1984, 2014),
+    'near_future': (2015, 2040),
+    'mid_future': (2041, 2070),
+    'far_future': (2071, 2100)
+}
+
+# Monthly % change of the box plots, and the labels of the future periods on them
+BOX_PLOT_PERIODS = {
+    'baseline': (1984, 2014),
+    'near_future': (2015, 2040),
+    'mid_future': (2041, 2071),
+    'far_future': (2070, 2100)
+}
+BOX_PLOT_PERIOD_LABELS = {
+    'near_future': 'Near Future (2015-2040)',
+    'mid_future': 'Mid Future (2041-2070)',
+    'far_future': 'Far Future (2071-2100)'
+}
+
+# Seasonal precipitation, ET and soil water content, and their short labels (no year ranges)
+SEASONAL_PERIODS = {
+    'Baseline (1984-2014)': (1984, 2014),
+    'Near Future (2015-2040)': (2015, 2040),
+    'Mid Future (2041-2070)': (2041, 2070),
+    'Far Future (2071-2100)': (2071, 2100)
+}
+SEASONAL_PERIOD_LABELS = {
+    'Baseline (1984-2014)': 'Baseline',
+    'Near Future (2015-2040)': 'Near Future',
+    'Mid Future (2041-2070)': 'Mid Future',
+    'Far Future (2071-2100)': 'Far Future'
+}
+
+# Rolling 30-year windows of the rolling %change heatmap: baseline, and the years the windows cover
+ROLLING_BASELINE = (1984, 2014)
+ROLLING_WINDOW_YEARS = (2015, 2100)
+
+# Years tested for a trend (the projection period) by the Mann-Kendall heatmap and the seasonal trends
+TREND_PERIOD = (2015, 2100)
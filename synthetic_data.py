@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from gcm_io import _file_sha256, _file_signature, _write_cache, cache_path_for
+
+# Scenarios of the GCM workbooks
+SCENARIOS = ('SSP245', 'SSP585')
+
+# Variables of the flow workbooks and of the water balance (precipitation, ET and soil water) workbooks
+FLOW_VARIABLES = ('Flow',)
+WATER_BALANCE_VARIABLES = ('PRECIPmm', 'Etmm', 'SWmm')
+
+# First year of the projections; the synthetic trends start here
+PROJECTION_START = 2015
+
+
+# Function to generate the daily values of one variable of one GCM and scenario
+def _daily_values(variable, scenario_index, day_of_year, years_projected, rng, bias):
+    # Monsoon cycle peaking in August (0 in the dry season, 1 at the peak)
+    monsoon = np.clip(np.sin(2 * np.pi * (day_of_year - 130) / 365.25), 0, None) ** 2
+    # Drift of the projections: stronger for the extreme scenario
+    trend = 1 + (0.002 + 0.003 * scenario_index) * years_projected
+    n_days = len(day_of_year)
+
+    if variable == 'Flow':
+        return bias * trend * (60 + 1500 * monsoon) * rng.gamma(4.0, 0.25, n_days)
+    if variable == 'PRECIPmm':
+        wet = rng.random(n_days) < 0.1 + 0.7 * monsoon
+        return np.where(wet, bias * trend * rng.gamma(0.8, 6 + 14 * monsoon), 0.0)
+    if variable == 'Etmm':
+        return bias * trend * (1.2 + 3.0 * monsoon + 0.3 * rng.standard_normal(n_days)).clip(0.1)
+    if variable == 'SWmm':
+        # Soil water lags the monsoon by about a month and changes slowly from day to day
+        lagged = np.roll(monsoon, 30)
+        noise = np.convolve(rng.standard_normal(n_days), np.ones(15) / 15, mode='same')
+        return (bias * (40 + 110 * lagged) / trend ** 0.5 + 5 * noise).clip(0.0)
+    raise ValueError(f'Unknown variable: {variable}')
+
+
+# Function to generate the daily data of one GCM with the schema of the GCM workbooks
+def synthetic_gcm_frame(seed, variables=FLOW_VARIABLES, scenarios=SCENARIOS, start='1984-01-01', end='2100-12-31'):
+    """
+    Generates the daily data of one synthetic GCM: a 'Date' column and one '<variable> <scenario>' column per
+    variable and scenario, with a monsoon cycle, GCM-specific bias and a projection trend. The same seed always
+    gives the same data.
+
+    Args:
+    seed (int or sequence of int): Seed of the GCM.
+    variables (tuple of str): 'Flow' and/or the water balance variables ('PRECIPmm', 'Etmm', 'SWmm').
+    scenarios (tuple of str): Scenarios (e.g., ('SSP245', 'SSP585')).
+    start (str): First day of the record.
+    end (str): Last day of the record.
+
+    Returns:
+    pd.DataFrame: Daily data, in the column order of the workbooks.
+    """
+    dates = pd.date_range(start, end, freq='D')
+    rng = np.random.default_rng(seed)
+    day_of_year = dates.dayofyear.to_numpy()
+    years_projected = np.clip(dates.year.to_numpy() - PROJECTION_START, 0, None)
+
+    data = {'Date': dates}
+    for variable in variables:
+        bias = rng.uniform(0.8, 1.2)
+        for scenario_index, scenario in enumerate(scenarios):
+            data[f'{variable} {scenario}'] = _daily_values(variable, scenario_index, day_of_year, years_projected, rng, bias)
+    return pd.DataFrame(data)
+
+
+# Function to generate the daily data of a whole ensemble in memory
+def synthetic_ensemble(n_gcms, variables=FLOW_VARIABLES, scenarios=SCENARIOS, start='1984-01-01', end='2100-12-31', seed=0):
+    """
+    Generates an ensemble of synthetic GCMs (see synthetic_gcm_frame).
+
+    Args:
+    n_gcms (int): Number of GCMs.
+    variables (tuple of str): Variables of every GCM.
+    scenarios (tuple of str): Scenarios of every variable.
+    start (str): First day of the record.
+    end (str): Last day of the record.
+    seed (int): Seed of the ensemble; GCM i is generated from (seed, i).
+
+    Returns:
+    dict: GCM name ('GCM-00', 'GCM-01', ...) -> pd.DataFrame.
+    """
+    return {f'GCM-{i:02d}': synthetic_gcm_frame((seed, i), variables, scenarios, start, end) for i in range(n_gcms)}
+
+
+# Function to write the data of one synthetic GCM as a workbook
+def write_synthetic_workbook(file_path, seed, start='1984-01-01', end='2100-12-31', variables=FLOW_VARIABLES,
+                             scenarios=SCENARIOS):
+    synthetic_gcm_frame(seed, variables, scenarios, start, end).to_excel(file_path, index=False)
+
+
+# Function to write a synthetic ensemble to a directory, as workbooks or as ready-made columnar caches
+def write_synthetic_ensemble(directory, n_gcms, variables=FLOW_VARIABLES, scenarios=SCENARIOS, start='1984-01-01',
+                             end='2100-12-31', seed=0, excel=True, cache_dir=None):
+    """
+    Writes one workbook per synthetic GCM. Writing and parsing .xlsx files takes seconds per GCM, so with
+    excel=False a small placeholder file is written instead, together with an up-to-date columnar cache
+    (see gcm_io.read_gcm_workbook) of the data: every cached reader loads it as if the workbook had been parsed.
+
+    Args:
+    directory (str): Directory for the workbooks (created if needed).
+    n_gcms (int): Number of GCMs.
+    variables (tuple of str): Variables of every GCM.
+    scenarios (tuple of str): Scenarios of every variable.
+    start (str): First day of the record.
+    end (str): Last day of the record.
+    seed (int): Seed of the ensemble (see synthetic_ensemble).
+    excel (bool): Write real .xlsx workbooks (set to False for placeholder workbooks with a seeded cache).
+    cache_dir (str, optional): Root folder of the seeded caches (see gcm_io.cache_path_for).
+
+    Returns:
+    dict: GCM name -> workbook path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    gcm_files = {}
+    for name, df in synthetic_ensemble(n_gcms, variables, scenarios, start, end, seed).items():
+        path = os.path.join(directory, f'{name}.xlsx')
+        if excel:
+            df.to_excel(path, index=False)
+        else:
+            # The placeholder describes the data, so a workbook's fingerprint changes whenever its data does
+            with open(path, 'w') as handle:
+                handle.write(f'Synthetic GCM {name}: seed {seed}, {start} to {end}, columns {list(df.columns[1:])}; '
+                             'the data is in the columnar cache\n')
+            _write_cache(df, cache_path_for(path, cache_dir), dict(_file_signature(path), sha256=_file_sha256(path)))
+        gcm_files[name] = path
+    return gcm_files
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+
+class TimeIndex:
+    """
+    Time axis of a dataset, built once: sorted dates with start/stop offsets for every year and every
+    configured period, plus month and year group codes.
+
+    Year ranges become O(1) slices (df.iloc[index.year_slice(2015, 2040)] or values[..., slice]) instead of
+    boolean masks over the full series, and monthly/annual groupings reuse the precomputed codes.
+    """
+
+    def __init__(self, dates, periods=None):
+        dates = pd.DatetimeIndex(dates)
+        if not dates.is_monotonic_increasing:
+            raise ValueError('TimeIndex requires dates sorted in ascending order')
+        self.dates = dates
+        years = dates.year.to_numpy()
+        self.first_year = int(years[0])
+        self.last_year = int(years[-1])
+
+        # Group codes: month 0-11 and year 0..n_years-1
+        self.month_codes = (dates.month.to_numpy() - 1).astype(np.int8)
+        self.year_codes = (years - self.first_year).astype(np.int16)
+        self.years = np.arange(self.first_year, self.last_year + 1)
+
+        # year_offsets[y - first_year] is the position of the first row of year y; the last entry is len(dates)
+        self.year_offsets = np.searchsorted(years, np.arange(self.first_year, self.last_year + 2), side='left')
+
+        self.periods = {}
+        for name, (start_year, end_year) in (periods or {}).items():
+            self.add_period(name, start_year, end_year)
+
+    # Function to build an index for an annual table (one row per year)
+    @classmethod
+    def from_years(cls, years, periods=None):
+        return cls(pd.to_datetime(np.asarray(years).astype(str), format='%Y'), periods)
+
+    def __len__(self):
+        return len(self.dates)
+
+    # Function to get the rows of start_year..end_year (inclusive) as a slice
+    def year_slice(self, start_year, end_year):
+        lo = min(max(start_year, self.first_year), self.last_year + 1) - self.first_year
+        hi = min(max(end_year + 1, self.first_year), self.last_year + 1) - self.first_year
+        return slice(int(self.year_offsets[lo]), int(self.year_offsets[max(hi, lo)]))
+
+    # Function to register a named period so it can be sliced by name
+    def add_period(self, name, start_year, end_year):
+        self.periods[name] = self.year_slice(start_year, end_year)
+        return self.periods[name]
+
+    # Function to get the slice of a registered period
+    def period_slice(self, name):
+        return self.periods[name]
+
+    # Function to compute the mean of each month within a slice of the series (NaN values are skipped)
+    def monthly_mean(self, values, rows=slice(None)):
+        """
+        Computes the mean of each calendar month with np.bincount on the precomputed month codes.
+
+        Args:
+        values (np.ndarray): Daily values aligned with the dates of this index.
+        rows (slice): Rows to include, e.g. a period slice.
+
+        Returns:
+        np.ndarray: 12 monthly means (January first); NaN for months without data.
+        """
+        values = np.asarray(values, dtype=np.float64)[rows]
+        codes = self.month_codes[rows]
+        valid = ~np.isnan(values)
+        sums = np.bincount(codes[valid], weights=values[valid], minlength=12)
+        counts = np.bincount(codes[valid], minlength=12)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts
+
+    # Function to get the start offset of every year within a year-aligned slice (for np.ufunc.reduceat)
+    def annual_starts(self, rows=slice(None)):
+        start, stop, _ = rows.indices(len(self))
+        first_rows = self.year_offsets[:-1]
+        keep = (first_rows < self.year_offsets[1:]) & (first_rows >= start) & (first_rows < stop)
+        return self.years[keep], first_rows[keep] - start
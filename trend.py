@@ -0,0 +1,167 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import ndtr
+
+from instrumentation import timed
+
+# Series longer than this are tested with the O(n log n) path (every pairwise difference would not fit in memory)
+LONG_RECORD = 2000
+
+
+# Function to compute the tie correction of the Mann-Kendall variance of every series, sum of t(t-1)(2t+5) over tie groups
+def _tie_term(series):
+    """
+    Counts the tie groups of every series by sorting it once (NaN entries are ignored).
+
+    Args:
+    series (np.ndarray): Values with shape (series, time).
+
+    Returns:
+    np.ndarray: sum over the tie groups of t(t-1)(2t+5) with shape (series,).
+    """
+    n_series, n_time = series.shape
+    ordered = np.sort(series, axis=-1)
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    groups = np.cumsum(starts, axis=-1) - 1 + np.arange(n_series)[:, None] * n_time
+    t = np.bincount(groups[~np.isnan(ordered)], minlength=n_series * n_time).reshape(n_series, n_time)
+    return np.sum(t * (t - 1) * (2 * t + 5), axis=-1)
+
+
+# Function to compute S and Sen's slope of many short series from all their pairwise differences at once
+def _pairwise_kernel(series, max_elements):
+    n_series, n_time = series.shape
+    i, j = np.triu_indices(n_time, 1)
+    gaps = (j - i).astype(np.float64)
+    s = np.empty(n_series)
+    slope = np.empty(n_series)
+    # Series are processed in chunks so the (series, pair) block of differences stays bounded
+    chunk = max(1, max_elements // max(len(i), 1))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # Series without two valid values
+        for start in range(0, n_series, chunk):
+            differences = series[start:start + chunk, j] - series[start:start + chunk, i]
+            s[start:start + chunk] = np.nansum(np.sign(differences), axis=-1)  # Pairs with a missing value count 0
+            slope[start:start + chunk] = np.nanmedian(differences / gaps, axis=-1)
+    return s, slope
+
+
+# Function to count the pairs of equal values of one series
+def _tied_pairs(values):
+    _, counts = np.unique(values, return_counts=True)
+    return float(np.sum(counts * (counts - 1) / 2))
+
+
+# Function to compute S of one series in O(n log n): concordant minus discordant pairs with time (Kendall's tau)
+def _kendall_s(time, values):
+    n_pairs = len(values) * (len(values) - 1) / 2
+    tied_pairs = _tied_pairs(values)
+    tau = stats.kendalltau(time, values).statistic
+    # tau-b = (concordant - discordant) / sqrt(pairs * (pairs - tied pairs)); time itself has no ties
+    return float(np.rint(tau * np.sqrt(n_pairs * (n_pairs - tied_pairs)))) if n_pairs > tied_pairs else 0.0
+
+
+# Function to find the k-th smallest pairwise slope (k counted from 1) of one series in O(n log n) per step
+def _kth_pair_slope(time, values, k, n_iter=100):
+    """
+    Bisects on the slope b: the pairs (i < j) with slope <= b are those with values - b * time not increasing, which
+    Kendall's tau of (time, values - b * time) counts in O(n log n), so the whole search needs no pairwise array.
+    """
+    n_pairs = len(values) * (len(values) - 1) / 2
+    span = np.ptp(values) / max(np.min(np.diff(time)), 1)
+    lo, hi = -span, span
+    for _ in range(n_iter):
+        mid = (lo + hi) / 2
+        residual = values - mid * time
+        # Pairs with slope <= mid: the discordant and tied pairs of (time, residual)
+        at_most = (n_pairs - _kendall_s(time, residual) + _tied_pairs(residual)) / 2
+        if at_most >= k:
+            hi = mid
+        else:
+            lo = mid
+        if hi - lo <= 1e-12 * max(abs(lo), abs(hi), 1e-300):
+            break
+    return hi
+
+
+# Function to compute S and Sen's slope of one long series without its pairwise differences
+def _long_record_kernel(values):
+    time = np.flatnonzero(~np.isnan(values)).astype(np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) < 2:
+        return 0.0, np.nan
+    n_pairs = len(values) * (len(values) - 1) // 2
+    # Sen's slope is the median pairwise slope: the middle one, or the mean of the middle two
+    lower = _kth_pair_slope(time, values, (n_pairs + 1) // 2)
+    upper = lower if n_pairs % 2 else _kth_pair_slope(time, values, n_pairs // 2 + 1)
+    return _kendall_s(time, values), (lower + upper) / 2
+
+
+# Function to run the Mann-Kendall trend test and estimate Sen's slope of every series in one batched pass
+@timed()
+def mann_kendall(x, max_elements=1 << 22, long_record=LONG_RECORD):
+    """
+    Runs the Mann-Kendall trend test (normal approximation with tie and continuity corrections) and computes
+    Sen's slope of every series along the last axis.
+
+    Series up to long_record steps are handled together from their pairwise differences (one (series, pair) block
+    per chunk); longer ones are handled one at a time in O(n log n) per step with Kendall's tau, so no pairwise
+    array is ever built.
+
+    Args:
+    x (np.ndarray): Values with shape (..., time) at equally spaced steps (e.g., years); NaN for missing steps.
+    max_elements (int): Largest number of pairwise differences held in memory at once.
+    long_record (int): Length above which series take the O(n log n) path.
+
+    Returns:
+    (np.ndarray, np.ndarray, np.ndarray, np.ndarray): S, Z, two-sided p-value and Sen's slope (per time step),
+    each with shape (...). Z and the p-value are NaN for series with fewer than 3 values.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    series = x.reshape(-1, x.shape[-1])
+    n = np.sum(~np.isnan(series), axis=-1)
+
+    if series.shape[-1] <= long_record:
+        s, slope = _pairwise_kernel(series, max_elements)
+    else:
+        s, slope = np.array([_long_record_kernel(values) for values in series]).reshape(-1, 2).T
+
+    variance = (n * (n - 1) * (2 * n + 5) - _tie_term(series)) / 18
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(n >= 3, (s - np.sign(s)) / np.sqrt(variance), np.nan)
+    p_value = 2 * ndtr(-np.abs(z))
+    shape = x.shape[:-1]
+    return s.reshape(shape), z.reshape(shape), p_value.reshape(shape), slope.reshape(shape)
+
+
+# Function to tabulate the trend of every series (one row per series)
+def trend_table(x, axes, alpha=0.05, slope_scale=1.0):
+    """
+    Runs mann_kendall on every series and lists the results in a tidy table.
+
+    Args:
+    x (np.ndarray): Values with shape (..., time); NaN for missing steps.
+    axes (dict): Name -> labels of every leading axis of x, in order (e.g., {'GCM': [...], 'Month': range(1, 13)}).
+    alpha (float): Significance level of the two-sided test.
+    slope_scale (float): Factor applied to Sen's slope (e.g., 10 for a per-decade slope of yearly series).
+
+    Returns:
+    pd.DataFrame: One column per axis, then 'N', 'S', 'Z', 'p-value', "Sen's Slope", "Sen's Slope (%)" (relative to
+    the mean of the series), 'Significant' and 'Trend' ('increasing', 'decreasing' or 'no trend').
+    """
+    s, z, p_value, slope = mann_kendall(x)
+    table = pd.MultiIndex.from_product(list(axes.values()), names=list(axes)).to_frame(index=False)
+    table['N'] = np.sum(~np.isnan(x), axis=-1).ravel()
+    table['S'] = s.ravel()
+    table['Z'] = z.ravel()
+    table['p-value'] = p_value.ravel()
+    table["Sen's Slope"] = slope.ravel() * slope_scale
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # Series without data
+        table["Sen's Slope (%)"] = table["Sen's Slope"] / np.nanmean(x, axis=-1).ravel() * 100
+    table['Significant'] = table['p-value'] < alpha
+    table['Trend'] = np.where(~table['Significant'], 'no trend', np.where(table['S'] > 0, 'increasing', 'decreasing'))
+    return table